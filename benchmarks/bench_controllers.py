@@ -0,0 +1,155 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Latency of the ZonesController operations and of the model hot      #
+# paths, as the zone grows.                                            #
+#                                                                      #
+# The controllers are called directly (no HTTP server, no CoreDNS)     #
+# against a temporary FILES_PATH. add_a_record and delete_a_record     #
+# are measured on a zone already holding N records, and delete_zone    #
+# on zones of N records built outside of the measurement. The          #
+# "models" rows measure SOA.from_str, A_rec.__str__ and the json_out   #
+# serialization of a page of records.                                  #
+#                                                                      #
+#   python benchmarks/bench_controllers.py --output controllers.json   #
+#   python benchmarks/bench_controllers.py --flush-mode sync \         #
+#       --sizes 10,1000                                                #
+########################################################################
+import argparse
+import os
+import random
+import shutil
+import tempfile
+
+from harness import measure, summarize, emit
+
+
+def address(i: int) -> str:
+    return "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255)
+
+
+def build_zone(zone_store, zoneName: str, size: int):
+    # Built straight into the store, then written once, so building a 1M
+    # records zone does not rewrite the zone file a million times
+    from dns.models import SOA, A_rec
+    soa = SOA(zoneName, "ns1." + zoneName, "admin." + zoneName, "2022110900", "7200", "3600", "1209600", "3600")
+    zone = zone_store.create(soa)
+    for i in range(size):
+        zone.add(A_rec("host%d.%s" % (i, zoneName), address(i), "60"))
+    zone_store.write(zone)
+
+
+def bench_size(controller, zone_store, size: int, iterations: int, zone_iterations: int) -> list:
+    results = []
+    zoneName = "bench%d.zone" % size
+    build_zone(zone_store, zoneName, size)
+
+    samples = measure(
+        lambda i: controller.add_a_record(zoneName, "new%d.%s" % (i, zoneName), address(i), "60"),
+        iterations,
+        setup=lambda i: i,
+    )
+    results.append(dict(operation="add_a_record", records=size, **summarize(samples)))
+
+    names = random.sample(range(size), min(iterations, size))
+    samples = measure(
+        lambda name: controller.delete_a_record(zoneName, name),
+        len(names),
+        setup=lambda i: "host%d.%s" % (names[i], zoneName),
+    )
+    results.append(dict(operation="delete_a_record", records=size, **summarize(samples)))
+    zone_store.drop(zoneName)
+
+    def setup_zone(i):
+        build_zone(zone_store, "drop%d.%s" % (i, zoneName), size)
+        return "drop%d.%s" % (i, zoneName)
+
+    samples = measure(controller.delete_zone, zone_iterations, setup=setup_zone)
+    results.append(dict(operation="delete_zone", records=size, **summarize(samples)))
+    return results
+
+
+def bench_add_zone(controller, zone_store, iterations: int) -> dict:
+    samples = measure(
+        lambda zoneName: controller.add_zone(zoneName, "ns1." + zoneName, "admin." + zoneName,
+                                             "7200", "3600", "1209600", "3600"),
+        iterations,
+        setup=lambda i: "new%d.zone" % i,
+    )
+    for i in range(iterations):
+        controller.delete_zone("new%d.zone" % i)
+    return dict(operation="add_zone", records=0, **summarize(samples))
+
+
+def bench_models(iterations: int) -> list:
+    from dns.models import SOA, A_rec, NestedEncoder, json_out
+    results = []
+    soa_line = "bench.zone. IN SOA ns1.bench.zone. admin.bench.zone. 2022110900 7200 3600 1209600 3600\n"
+    samples = measure(lambda: SOA.from_str(soa_line), iterations)
+    results.append(dict(operation="SOA.from_str", records=1, **summarize(samples)))
+
+    record = A_rec("host1.bench.zone", "10.0.0.1", "60")
+    samples = measure(lambda: str(record), iterations)
+    results.append(dict(operation="A_rec.__str__", records=1, **summarize(samples)))
+
+    page = [A_rec("host%d.bench.zone" % i, address(i), "60") for i in range(100)]
+    serialize = json_out(cls=NestedEncoder)(lambda: dict(records=page))
+    samples = measure(serialize, iterations)
+    results.append(dict(operation="json_out", records=len(page), **summarize(samples)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of the ZonesController operations as the zone grows.")
+    parser.add_argument("--sizes", default="10,1000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=1000,
+                        help="record additions/deletions measured per zone size")
+    parser.add_argument("--zone-iterations", type=int, default=3,
+                        help="zones created and deleted per zone size")
+    parser.add_argument("--flush-mode", choices=["sync", "coalesce"], default="coalesce",
+                        help="sync rewrites the zone file on every mutation, which dominates "
+                             "the latency of large zones")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    files_path = tempfile.mkdtemp(prefix="dns-bench-")
+    # The configuration is read when the dns package is imported
+    os.environ["DNS_FILES_PATH"] = files_path + "/"
+    os.environ["DNS_FLUSH_MODE"] = args.flush_mode
+    repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    shutil.copy(os.path.join(repo, "temp_files", "Corefile"), files_path)
+
+    import cherrypy
+    from dns.api.controllers.zones_controller import ZonesController
+    from dns.store import zone_store
+    cherrypy.config.update({"log.screen": False})
+
+    random.seed(0)
+    try:
+        controller = ZonesController()
+        results = [bench_add_zone(controller, zone_store, args.zone_iterations)]
+        for size in (int(s) for s in args.sizes.split(",")):
+            results.extend(bench_size(controller, zone_store, size, args.iterations, args.zone_iterations))
+        results.extend(bench_models(args.iterations))
+    finally:
+        shutil.rmtree(files_path, ignore_errors=True)
+    for result in results:
+        result["flush_mode"] = args.flush_mode
+    emit("controllers", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
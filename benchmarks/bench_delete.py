@@ -0,0 +1,90 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Record deletion latency as the zone grows.                           #
+#                                                                      #
+# "index" deletes through ZoneStore.delete_records in coalescing mode, #
+# so only the owner name index is touched. "regex" is the former       #
+# re.sub scan over the zone text (without the file write), kept as a   #
+# baseline for the smaller sizes.                                      #
+#                                                                      #
+#   python benchmarks/bench_delete.py --output delete.json             #
+########################################################################
+import argparse
+import random
+import re
+import tempfile
+
+from harness import measure, summarize, emit
+
+from dns.models import SOA, A_rec
+from dns.store import ZoneStore
+
+
+def build_zone(store: ZoneStore, size: int):
+    soa = SOA("bench.zone", "ns1.bench.zone", "admin.bench.zone", "2022110900", "7200", "3600", "1209600", "3600")
+    zone = store.create(soa)
+    for i in range(size):
+        zone.add(A_rec("host%d.bench.zone" % i, "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), "60"))
+    return zone
+
+
+def bench_index(size: int, iterations: int) -> dict:
+    with tempfile.TemporaryDirectory() as files_path:
+        store = ZoneStore(files_path, coalesce=True)
+        build_zone(store, size)
+        names = random.sample(range(size), min(iterations, size))
+        samples = measure(
+            lambda name: store.delete_records("bench.zone", name, "A"),
+            len(names),
+            setup=lambda i: "host%d.bench.zone" % names[i],
+        )
+    return dict(method="index", records=size, **summarize(samples))
+
+
+def bench_regex(size: int, iterations: int) -> dict:
+    with tempfile.TemporaryDirectory() as files_path:
+        zone = build_zone(ZoneStore(files_path), size)
+        content = zone.render()
+    names = random.sample(range(size), min(iterations, size))
+    samples = []
+    for i in names:
+        pattern = r'%s.*\n' % ("host%d.bench.zone" % i)
+        samples.extend(measure(lambda: re.sub(pattern, '', content, re.DOTALL), 1))
+    return dict(method="regex", records=size, **summarize(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record deletion latency as the zone grows.")
+    parser.add_argument("--sizes", default="100,1000,10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--regex-max-size", type=int, default=100000,
+                        help="largest zone for which the regex baseline is run")
+    parser.add_argument("--regex-iterations", type=int, default=20)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.append(bench_index(size, args.iterations))
+        if size <= args.regex_max_size:
+            results.append(bench_regex(size, args.regex_iterations))
+    emit("delete", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Time to go live of the mutations requested with wait=live. main.py   #
+# probes a stub DNS server run by this script, which re-reads the zone #
+# files every --reload seconds as CoreDNS does, so the reported        #
+# liveAfter is spread over the reload interval instead of the fixed    #
+# sleep callers used to do. Concurrent clients show that the SOA       #
+# queries are shared: they grow with time, not with waiting requests.  #
+#                                                                      #
+#   python benchmarks/bench_live.py --output live.json                 #
+########################################################################
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from harness import summarize, emit
+
+from dns.responder import Responder
+from dns.store import ZoneStore
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PREFIX = "/dns_support/v1"
+ZONE = "bench.zone"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer:
+    """
+    DNS server answering from the zone files of a folder as they were at its
+    last reload, like CoreDNS with the reload plugin.
+    """
+    def __init__(self, folder: str, port: int, reload: float):
+        self.folder = folder
+        self.reload = reload
+        self.responder = Responder(ZoneStore(folder))
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(("127.0.0.1", port))
+        self.queries = 0
+        threading.Thread(target=self.serve, daemon=True).start()
+        threading.Thread(target=self.reloader, daemon=True).start()
+
+    def reloader(self):
+        while True:
+            time.sleep(self.reload)
+            self.responder = Responder(ZoneStore(self.folder))
+
+    def serve(self):
+        while True:
+            message, addr = self.socket.recvfrom(4096)
+            self.queries += 1
+            response = self.responder.answer(message)
+            if response:
+                self.socket.sendto(response, addr)
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str):
+    connection.request(method, PREFIX + path, body=b"")
+    response = connection.getresponse()
+    data = response.read()
+    if response.status >= 300 and response.status != 202:
+        raise RuntimeError("%s %s: %d %s" % (method, path, response.status, data))
+    return response.status, data
+
+
+def client(port: int, first: int, mutations: int, samples: list, totals: list):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    for i in range(first, first + mutations):
+        start = time.perf_counter()
+        status, data = request(connection, "POST", "/api/%s/record?name=host%d.%s&ip=10.0.%d.%d&ttl=60&wait=live"
+                               % (ZONE, i, ZONE, i >> 8 & 255, i & 255))
+        totals.append(time.perf_counter() - start)
+        body = json.loads(data)
+        if body["live"]:
+            samples.append(body["liveAfter"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to go live of the mutations requested with wait=live.")
+    parser.add_argument("--reload", type=float, default=1, help="seconds between two reloads of the stub server")
+    parser.add_argument("--clients", default="1,8", help="concurrent clients")
+    parser.add_argument("--mutations", type=int, default=20, help="mutations per client")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_live_")
+    port, dns_port = free_port(), free_port()
+    stub = StubServer(folder, dns_port, args.reload)
+    env = dict(os.environ, DNS_FILES_PATH=folder + "/", DNS_API_PORT=str(port),
+               DNS_LIVE_SERVER="127.0.0.1:%d" % dns_port, DNS_LIVE_TIMEOUT=str(args.reload * 3))
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        request(connection, "POST", "/api/%s?mname=ns.%s&rname=admin.%s&refresh=7200&retry=3600"
+                                    "&expire=1209600&ttl=3600&wait=live" % (ZONE, ZONE, ZONE))
+
+        first = 0
+        for clients in (int(n) for n in args.clients.split(",")):
+            samples, totals = [], []
+            queries = stub.queries
+            threads = [threading.Thread(target=client, args=(port, first + c * args.mutations, args.mutations,
+                                                             samples, totals))
+                       for c in range(clients)]
+            first += clients * args.mutations
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            result = dict(clients=clients, reload_s=args.reload, **summarize(samples))
+            result["p50_live_ms"] = result.pop("p50_us") / 1000
+            result["p99_live_ms"] = result.pop("p99_us") / 1000
+            del result["ops_per_sec"]
+            result["timeouts"] = len(totals) - len(samples)
+            result["p50_request_ms"] = summarize(totals)["p50_us"] / 1000
+            result["soa_queries_per_s"] = (stub.queries - queries) / elapsed
+            results.append(result)
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+    emit("live", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
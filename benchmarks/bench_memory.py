@@ -0,0 +1,93 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Memory held by the records of a zone, per representation.            #
+#                                                                      #
+# "A_rec" is the dict-backed model object and "CompactA" the slotted   #
+# one of dns/records.py, as bare lists and as zones loaded by          #
+# Zone.from_lines: by default, with COMPACT_RECORDS and with           #
+# RECORD_TABLE. The records are built from the same text lines, as     #
+# when a zone file is loaded, and the memory is measured with          #
+# tracemalloc.                                                         #
+#                                                                      #
+#   python benchmarks/bench_memory.py --output memory.json             #
+########################################################################
+import argparse
+import gc
+import time
+import tracemalloc
+
+from harness import emit
+
+from dns.models import A_rec
+from dns.records import CompactA
+from dns.store import Zone
+
+SOA_LINE = "bench.zone. IN SOA ns1.bench.zone. admin.bench.zone. 2022110900 7200 3600 1209600 3600\n"
+
+
+def lines(size: int) -> list:
+    return ["host%d.bench.zone. 60 IN A 10.%d.%d.%d\n" % (i, i >> 16 & 255, i >> 8 & 255, i & 255)
+            for i in range(size)]
+
+
+def build_objects(cls, zone_lines: list):
+    return [cls.from_str(line) for line in zone_lines]
+
+
+def build_zone(zone_lines: list, compact: bool = False, table: bool = False) -> Zone:
+    return Zone.from_lines([SOA_LINE] + zone_lines, "bench.zone", compact, table)
+
+
+def measure_memory(name: str, build, zone_lines: list) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = build(zone_lines)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    gc.collect()
+    return dict(
+        representation=name,
+        records=len(zone_lines),
+        bytes=current,
+        bytes_per_record=current / len(zone_lines),
+        peak_bytes=peak,
+        build_s=elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory held by the records of a zone, per representation.")
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    zone_lines = lines(args.size)
+    results = [
+        measure_memory("A_rec", lambda l: build_objects(A_rec, l), zone_lines),
+        measure_memory("CompactA", lambda l: build_objects(CompactA, l), zone_lines),
+        measure_memory("Zone", lambda l: build_zone(l), zone_lines),
+        measure_memory("Zone compact", lambda l: build_zone(l, compact=True), zone_lines),
+        measure_memory("Zone table", lambda l: build_zone(l, table=True), zone_lines),
+    ]
+    emit("memory", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Replication lag and transfer size. A leader (main.py) and several    #
+# followers (python -m dns.replication) run as local processes, each   #
+# on its own folder. Every mutation of the leader is timed until all   #
+# followers hold the same zone file, and the size of its change record #
+# is compared with the size of the zone file a full copy would send.  #
+#                                                                      #
+#   python benchmarks/bench_replication.py --output replication.json   #
+########################################################################
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import summarize, emit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PREFIX = "/dns_support/v1"
+ZONE = "bench.zone"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str, body: dict = None) -> bytes:
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    connection.request(method, PREFIX + path, body=json.dumps(body) if body is not None else b"", headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    if response.status >= 300:
+        raise RuntimeError("%s %s: %d %s" % (method, path, response.status, data))
+    return data
+
+
+def read(path: str) -> bytes:
+    try:
+        with open(path, mode='rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+
+def wait_converged(leader_dir: str, follower_dirs: list, timeout: float = 30) -> float:
+    """
+    Waits until every follower holds the zone file of the leader.
+    :return: seconds waited
+    """
+    start = time.perf_counter()
+    expected = read(os.path.join(leader_dir, ZONE + ".db"))
+    pending = list(follower_dirs)
+    while pending:
+        pending = [d for d in pending if read(os.path.join(d, ZONE + ".db")) != expected]
+        if pending:
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError("%d follower(s) did not converge" % len(pending))
+            time.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replication lag and transfer size.")
+    parser.add_argument("--followers", type=int, default=3)
+    parser.add_argument("--records", default="1000,100000", help="records of the zone")
+    parser.add_argument("--mutations", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between two syncs of a follower")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(n) for n in args.records.split(",")):
+        base = tempfile.mkdtemp(prefix="bench_replication_")
+        leader_dir = os.path.join(base, "leader")
+        follower_dirs = [os.path.join(base, "follower%d" % i) for i in range(args.followers)]
+        os.makedirs(leader_dir)
+        port = free_port()
+        env = dict(os.environ, DNS_FILES_PATH=leader_dir + "/", DNS_API_PORT=str(port), DNS_LOAD_MODE="lazy",
+                   DNS_CHANGELOG_SIZE="10000")
+        processes = [subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+        try:
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            request(connection, "POST", "/api/%s?mname=ns.%s&rname=admin.%s&refresh=7200&retry=3600"
+                                        "&expire=1209600&ttl=3600" % (ZONE, ZONE, ZONE))
+            for start in range(0, size, 10000):
+                request(connection, "POST", "/api/%s/records" % ZONE, dict(operations=[
+                    dict(action="add", name="host%d.%s" % (i, ZONE), ip="10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255),
+                         ttl="60")
+                    for i in range(start, min(size, start + 10000))
+                ]))
+
+            for folder in follower_dirs:
+                processes.append(subprocess.Popen(
+                    [sys.executable, "-m", "dns.replication", "--leader", "http://127.0.0.1:%d" % port,
+                     "--dir", folder, "--interval", str(args.interval)],
+                    cwd=ROOT, env=dict(env, DNS_FILES_PATH=folder + "/"),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            initial = wait_converged(leader_dir, follower_dirs, timeout=300)
+
+            samples = []
+            delta_bytes = 0
+            for i in range(args.mutations):
+                seq = json.loads(request(connection, "GET", "/replication/changes?since=0&limit=1"))["seq"]
+                request(connection, "POST", "/api/%s/record?name=new%d.%s&ip=10.255.0.%d&ttl=60"
+                        % (ZONE, i, ZONE, i % 250))
+                samples.append(wait_converged(leader_dir, follower_dirs))
+                delta_bytes += len(request(connection, "GET", "/replication/changes?since=%d" % seq))
+            zone_bytes = os.path.getsize(os.path.join(leader_dir, ZONE + ".db"))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+            shutil.rmtree(base, ignore_errors=True)
+
+        result = dict(records=size, followers=args.followers, initial_copy_s=initial, **summarize(samples))
+        result["p50_lag_ms"] = result.pop("p50_us") / 1000
+        result["p99_lag_ms"] = result.pop("p99_us") / 1000
+        del result["ops_per_sec"]
+        result["delta_bytes"] = delta_bytes // args.mutations
+        result["full_copy_bytes"] = zone_bytes
+        results.append(result)
+    emit("replication", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
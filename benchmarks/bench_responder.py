@@ -0,0 +1,192 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Queries per second of the embedded DNS responder, and the delay      #
+# until a record added through the API is resolvable. The answer path  #
+# is first measured in process (precomputed and freshly built answers) #
+# then over UDP against main.py, with a window of queries outstanding. #
+#                                                                      #
+#   python benchmarks/bench_responder.py --output responder.json       #
+########################################################################
+import argparse
+import http.client
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import measure, summarize, emit
+
+from dns import wire
+from dns.models import SOA, A_rec
+from dns.responder import Responder
+from dns.store import ZoneStore
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PREFIX = "/dns_support/v1"
+ZONE = "bench.zone"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str, body: bytes = b"") -> bytes:
+    headers = {"Content-Type": "application/json"} if body else {}
+    connection.request(method, PREFIX + path, body=body, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    if response.status >= 300:
+        raise RuntimeError("%s %s: %d %s" % (method, path, response.status, data))
+    return data
+
+
+def in_process(size: int, iterations: int) -> list:
+    folder = tempfile.mkdtemp(prefix="bench_responder_")
+    try:
+        store = ZoneStore(folder)
+        zone = store.create(SOA(ZONE, "ns." + ZONE, "admin." + ZONE, "1", "7200", "3600", "1209600", "3600"))
+        for i in range(size):
+            zone.add(A_rec("host%d.%s" % (i, ZONE), "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), "60"))
+        responder = Responder(store)
+        queries = [wire.encode_query("host%d.%s" % (random.randrange(size), ZONE), wire.A, i)
+                   for i in range(iterations)]
+        answer = lambda i: responder.answer(queries[i])
+        # Answers built from the zone: the precomputed ones are dropped before each query
+        built = measure(answer, iterations, setup=lambda i: responder.on_zone_event("update", ZONE) or i)
+        for i in range(iterations):
+            answer(i)
+        precomputed = measure(answer, iterations, setup=lambda i: i)
+        results = [dict(case="in-process built", records=size, **summarize(built)),
+                   dict(case="in-process precomputed", records=size, **summarize(precomputed))]
+        return results
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def udp_qps(port: int, names: list, queries: int, window: int) -> dict:
+    """
+    Sends queries over UDP keeping window of them outstanding, and returns the
+    latency summary and the throughput.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect(("127.0.0.1", port))
+        s.settimeout(2)
+        sent = {}
+        samples = []
+        lost = 0
+        start = time.perf_counter()
+        next_id = 0
+        while next_id < queries or sent:
+            while next_id < queries and len(sent) < window:
+                id = next_id & 0xFFFF
+                sent[id] = time.perf_counter()
+                s.send(wire.encode_query(names[next_id % len(names)], wire.A, id))
+                next_id += 1
+            try:
+                response = s.recv(4096)
+            except socket.timeout:
+                lost += len(sent)
+                sent.clear()
+                continue
+            id = wire.HEADER.unpack_from(response)[0]
+            if id in sent:
+                samples.append(time.perf_counter() - sent.pop(id))
+        elapsed = time.perf_counter() - start
+    result = summarize(samples)
+    result["ops_per_sec"] = len(samples) / elapsed
+    result["lost"] = lost
+    return result
+
+
+def resolvable_after(port: int, connection: http.client.HTTPConnection, i: int, timeout: float = 10) -> float:
+    """
+    Adds a record through the API and returns the seconds from the end of the
+    request until the responder answers it.
+    """
+    name = "fresh%d.%s" % (i, ZONE)
+    request(connection, "POST", "/api/%s/record?name=%s&ip=10.254.0.%d&ttl=60" % (ZONE, name, i % 250))
+    start = time.perf_counter()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect(("127.0.0.1", port))
+        s.settimeout(1)
+        while time.perf_counter() - start < timeout:
+            s.send(wire.encode_query(name, wire.A, i))
+            response = s.recv(4096)
+            if wire.HEADER.unpack_from(response)[3] > 0:
+                return time.perf_counter() - start
+            time.sleep(0.001)
+    raise RuntimeError("%s not resolvable after %ss" % (name, timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queries per second of the embedded DNS responder.")
+    parser.add_argument("--records", type=int, default=10000, help="records of the zone")
+    parser.add_argument("--iterations", type=int, default=100000, help="queries answered in process")
+    parser.add_argument("--queries", type=int, default=50000, help="queries sent over UDP")
+    parser.add_argument("--window", default="1,16", help="queries outstanding over UDP")
+    parser.add_argument("--mutations", type=int, default=50)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = in_process(args.records, args.iterations)
+
+    folder = tempfile.mkdtemp(prefix="bench_responder_")
+    port, dns_port = free_port(), free_port()
+    env = dict(os.environ, DNS_FILES_PATH=folder + "/", DNS_API_PORT=str(port), DNS_RESPONDER_PORT=str(dns_port),
+               DNS_RESPONDER_HOST="127.0.0.1", DNS_LOAD_MODE="lazy")
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        request(connection, "POST", "/api/%s?mname=ns.%s&rname=admin.%s&refresh=7200&retry=3600"
+                                    "&expire=1209600&ttl=3600" % (ZONE, ZONE, ZONE))
+        for start in range(0, args.records, 10000):
+            request(connection, "POST", "/api/%s/records" % ZONE, ('{"operations": [%s]}' % ",".join(
+                '{"action": "add", "name": "host%d.%s", "ip": "10.%d.%d.%d", "ttl": "60"}'
+                % (i, ZONE, i >> 16 & 255, i >> 8 & 255, i & 255)
+                for i in range(start, min(args.records, start + 10000)))).encode())
+
+        names = ["host%d.%s" % (random.randrange(args.records), ZONE) for _ in range(1000)]
+        for window in (int(w) for w in args.window.split(",")):
+            # Warm the precomputed answers first
+            udp_qps(dns_port, names, len(names), window)
+            results.append(dict(case="udp window=%d" % window, records=args.records,
+                                **udp_qps(dns_port, names, args.queries, window)))
+
+        samples = [resolvable_after(dns_port, connection, i) for i in range(args.mutations)]
+        results.append(dict(case="resolvable after add_a_record", records=args.records, **summarize(samples)))
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(folder, ignore_errors=True)
+    emit("responder", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Encoding time of record listings and error bodies.                   #
+#                                                                      #
+# "NestedEncoder" is json.dumps with the to_json probing encoder, the  #
+# former json_out path. "json" and "orjson" are the backends of        #
+# dns/serializer.py (orjson only if it is installed).                  #
+#                                                                      #
+#   python benchmarks/bench_serialization.py --output serialization.json
+########################################################################
+import argparse
+import json
+
+from harness import measure, summarize, emit
+
+from dns.models import SOA, A_rec, NotFound, NestedEncoder
+from dns.serializer import Serializer, serializer, orjson
+
+
+def listing(size: int) -> dict:
+    soa = SOA("bench.zone", "ns1.bench.zone", "admin.bench.zone", "2022110900", "7200", "3600", "1209600", "3600")
+    records = [A_rec("host%d.bench.zone" % i, "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), "60")
+               for i in range(size)]
+    return dict(zoneName="bench.zone", soa=soa, records=records, nextCursor=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoding time of record listings and error bodies.")
+    parser.add_argument("--sizes", default="100,1000,100000")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    encoders = [("NestedEncoder", lambda obj: json.dumps(obj, cls=NestedEncoder).encode("utf-8"))]
+    for backend in ("json", "orjson"):
+        if backend == "orjson" and orjson is None:
+            continue
+        other = Serializer(backend)
+        other.register(SOA, SOA.to_json)
+        other.register(A_rec, A_rec.to_json)
+        encoders.append((backend, other.dumps))
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        body = listing(size)
+        iterations = max(3, args.iterations * 1000 // max(size, 1000))
+        for name, dumps in encoders:
+            samples = measure(lambda: dumps(body), iterations)
+            results.append(dict(body="records", records=size, encoder=name, **summarize(samples)))
+
+    error = NotFound("Inexistent zone name.")
+    samples = measure(lambda: json.dumps(error.problem_details(), cls=NestedEncoder).encode("utf-8"), args.iterations)
+    results.append(dict(body="error", records=0, encoder="NestedEncoder", **summarize(samples)))
+    samples = measure(lambda: serializer.dumps(error.problem_details()), args.iterations)
+    results.append(dict(body="error", records=0, encoder=serializer.backend, **summarize(samples)))
+    emit("serialization", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Request latency and throughput of the CherryPy and asyncio servers   #
+# under concurrent clients. Each server runs in its own process on a   #
+# temporary folder; clients keep their connections open and, with      #
+# --idle, that many more connections are held open without requests,   #
+# as slow or parked clients would.                                     #
+#                                                                      #
+#   python benchmarks/bench_servers.py --output servers.json           #
+########################################################################
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from harness import summarize, emit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PREFIX = "/dns_support/v1"
+
+SERVERS = {
+    "cherrypy": """
+import cherrypy, main
+cherrypy.config.update({'log.screen': False})
+update = cherrypy.config.update
+main.cherrypy.config.update = lambda d: update({**d, 'server.socket_port': %(port)d, 'server.thread_pool': %(workers)d})
+main.main()
+cherrypy.engine.block()
+""",
+    "asyncio": """
+import cherrypy, main
+from dns.api import aio_server
+cherrypy.config.update({'log.screen': False})
+aio_server.run(main.dispatcher(), '127.0.0.1', %(port)d, workers=%(workers)d)
+""",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start(server: str, folder: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, DNS_FILES_PATH=folder + "/", DNS_FLUSH_MODE="coalesce")
+    process = subprocess.Popen([sys.executable, "-c", SERVERS[server] % dict(port=port, workers=workers)],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("%s server did not start" % server)
+
+
+def request(connection: http.client.HTTPConnection, method: str, path: str) -> int:
+    connection.request(method, PREFIX + path, body=b"" if method == "POST" else None)
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def run(port: int, clients: int, requests: int, path: str) -> tuple:
+    """
+    Sends requests GETs of path from each of clients threads, one keep-alive
+    connection per thread. Returns the latencies and the wall time.
+    """
+    samples = [[] for _ in range(clients)]
+    barrier = threading.Barrier(clients + 1)
+
+    def client(i):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        barrier.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            request(connection, "GET", path)
+            samples[i].append(time.perf_counter() - start)
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return [s for client_samples in samples for s in client_samples], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request latency and throughput of the CherryPy and asyncio servers.")
+    parser.add_argument("--servers", default="cherrypy,asyncio")
+    parser.add_argument("--clients", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--idle", type=int, default=0, help="connections held open without requests")
+    parser.add_argument("--records", type=int, default=100, help="records of the zone listed")
+    parser.add_argument("--workers", type=int, default=10, help="threads of either server")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for server in args.servers.split(","):
+        folder = tempfile.mkdtemp(prefix="bench_servers_")
+        port = free_port()
+        process = start(server, folder, port, args.workers)
+        idle = []
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            request(connection, "POST", "/api/bench.zone?mname=ns.bench.zone&rname=admin.bench.zone"
+                                        "&refresh=7200&retry=3600&expire=1209600&ttl=3600")
+            for i in range(args.records):
+                request(connection, "POST", "/api/bench.zone/record?name=host%d.bench.zone&ip=10.0.%d.%d&ttl=60"
+                        % (i, i >> 8 & 255, i & 255))
+            connection.close()
+
+            for _ in range(args.idle):
+                try:
+                    idle.append(socket.create_connection(("127.0.0.1", port), timeout=5))
+                except OSError:
+                    break
+
+            for clients in (int(c) for c in args.clients.split(",")):
+                samples, wall = run(port, clients, args.requests, "/api/bench.zone/record")
+                result = dict(server=server, clients=clients, idle=len(idle), **summarize(samples))
+                result["ops_per_sec"] = len(samples) / wall
+                results.append(result)
+        finally:
+            for s in idle:
+                s.close()
+            process.terminate()
+            process.wait()
+            shutil.rmtree(folder, ignore_errors=True)
+    emit("servers", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Bytes written and latency per record mutation, with each zone kept   #
+# in a single zone file (shards=0) and split into shard files included #
+# by the zone file. Mutations go through ZoneStore.add_record in sync  #
+# mode, so every one of them writes the zone.                          #
+#                                                                      #
+#   python benchmarks/bench_sharding.py --output sharding.json         #
+########################################################################
+import argparse
+import random
+import tempfile
+
+from harness import measure, summarize, emit
+
+from dns.metrics import metrics
+from dns.models import SOA, A_rec
+from dns.store import ZoneStore
+
+ZONE = "bench.zone"
+
+
+def bench(size: int, shards: int, iterations: int) -> dict:
+    with tempfile.TemporaryDirectory() as files_path:
+        store = ZoneStore(files_path, shards=shards)
+        store.create(SOA(ZONE, "ns1." + ZONE, "admin." + ZONE, "2022110900", "7200", "3600", "1209600", "3600"))
+        with store.locked(ZONE) as zone:
+            for i in range(size):
+                zone.add(A_rec("host%d.%s" % (i, ZONE), "10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), "60"))
+            zone.stale = None
+            store.write(zone)
+
+        names = random.sample(range(size), min(iterations, size))
+        written = metrics.file_bytes.get((ZONE, "written"), 0)
+        samples = measure(
+            lambda record: store.add_record(ZONE, record),
+            len(names),
+            setup=lambda i: A_rec("host%d.%s" % (names[i], ZONE), "10.255.%d.%d" % (i >> 8 & 255, i & 255), "60"),
+        )
+        written = metrics.file_bytes[(ZONE, "written")] - written
+    result = dict(records=size, shards=shards, **summarize(samples))
+    result["bytes_per_mutation"] = written // len(names)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes written per mutation, single zone file vs shard files.")
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--shards", default="0,16,64,256", help="shard counts, 0 for a single zone file")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for shards in (int(n) for n in args.shards.split(",")):
+            results.append(bench(size, shards, args.iterations))
+    emit("sharding", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Cold start time: from the start of "python main.py" until the first  #
+# request is served, for each server, next to the time taken by the    #
+# interpreter alone and by importing main. See the budget in           #
+# benchmarks/README.md.                                                #
+#                                                                      #
+#   python benchmarks/bench_startup.py --output startup.json           #
+########################################################################
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import summarize, emit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_once(argv: list, env: dict) -> float:
+    start = time.perf_counter()
+    subprocess.run(argv, cwd=ROOT, env=env, check=True)
+    return time.perf_counter() - start
+
+
+def first_request(server: str, env: dict, timeout: float = 30) -> float:
+    """
+    Starts the service and returns the seconds until GET /dns_support/v1/api
+    is answered.
+    """
+    port = free_port()
+    env = dict(env, DNS_SERVER=server, DNS_API_PORT=str(port))
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+                connection.request("GET", "/dns_support/v1/api")
+                status = connection.getresponse().status
+                connection.close()
+                if status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("%s server did not answer in %ss" % (server, timeout))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start time of the DNS API.")
+    parser.add_argument("--servers", default="cherrypy,asyncio")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ, DNS_FILES_PATH=folder + "/")
+    results = []
+    try:
+        phases = [
+            ("interpreter", lambda: run_once([sys.executable, "-c", "pass"], env)),
+            ("import main", lambda: run_once([sys.executable, "-c", "import main"], env)),
+        ]
+        for server in args.servers.split(","):
+            phases.append(("first request (%s)" % server, lambda server=server: first_request(server, env)))
+        for phase, func in phases:
+            # Warm the OS file cache and the bytecode cache first
+            func()
+            samples = [func() for _ in range(args.runs)]
+            result = dict(phase=phase, **summarize(samples))
+            result["p50_ms"] = result.pop("p50_us") / 1000
+            result["p99_ms"] = result.pop("p99_us") / 1000
+            del result["ops_per_sec"]
+            results.append(result)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    emit("startup", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
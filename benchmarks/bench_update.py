@@ -0,0 +1,92 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Bytes written and latency of a record IP change: delete_records then #
+# add_record (two rewrites) vs update_record, whose same-width changes #
+# are patched in place in the zone file and whose wider ones fall back #
+# to a rewrite. The store runs in sync mode.                           #
+#                                                                      #
+#   python benchmarks/bench_update.py --output update.json             #
+########################################################################
+import argparse
+import random
+import tempfile
+
+from harness import measure, summarize, emit
+
+from dns.metrics import metrics
+from dns.models import SOA, A_rec
+from dns.store import ZoneStore
+
+ZONE = "bench.zone"
+
+
+def delete_add(store: ZoneStore, record: A_rec):
+    store.delete_records(ZONE, record.name, "A")
+    store.add_record(ZONE, record)
+
+
+CASES = {
+    "delete + add": (delete_add, "10.1.%d.%d"),
+    "update same width": (lambda store, record: store.update_record(ZONE, record.name, record), "10.2.%d.%d"),
+    "update wider": (lambda store, record: store.update_record(ZONE, record.name, record), "10.222.%d.%d"),
+}
+
+
+def bench(size: int, shards: int, case: str, iterations: int) -> dict:
+    operation, ip = CASES[case]
+    with tempfile.TemporaryDirectory() as files_path:
+        store = ZoneStore(files_path, shards=shards)
+        store.create(SOA(ZONE, "ns1." + ZONE, "admin." + ZONE, "2022110900", "7200", "3600", "1209600", "3600"))
+        with store.locked(ZONE) as zone:
+            for i in range(size):
+                zone.add(A_rec("host%d.%s" % (i, ZONE), "10.0.%d.%d" % (i >> 8 & 255, i & 255), "60"))
+            zone.stale = None
+            store.write(zone)
+
+        # Distinct names, so that every update starts from the initial line width
+        names = random.sample(range(size), min(iterations, size))
+        written = metrics.file_bytes.get((ZONE, "written"), 0)
+        samples = measure(
+            lambda record: operation(store, record),
+            len(names),
+            setup=lambda i: A_rec("host%d.%s" % (names[i], ZONE), ip % (names[i] >> 8 & 255, names[i] & 255), "60"),
+        )
+        written = metrics.file_bytes[(ZONE, "written")] - written
+    result = dict(case=case, records=size, shards=shards, **summarize(samples))
+    result["bytes_per_update"] = written // len(names)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record IP change, delete and add vs in-place update.")
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--shards", default="0,64", help="shard counts, 0 for a single zone file")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    random.seed(0)
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        for shards in (int(n) for n in args.shards.split(",")):
+            for case in CASES:
+                results.append(bench(size, shards, case, args.iterations))
+    emit("update", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
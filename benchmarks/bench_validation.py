@@ -0,0 +1,85 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Request body validation latency.                                     #
+#                                                                      #
+# "per-call" is jsonschema.validate, which checks the schema and       #
+# builds a validator on every call. "cached" goes through the          #
+# validator registry of dns/validation.py.                             #
+#                                                                      #
+#   python benchmarks/bench_validation.py --output validation.json     #
+########################################################################
+import argparse
+
+import jsonschema
+
+from harness import measure, summarize, emit
+
+from dns.schemas import dns_rule_schema, serviceinfo_schema
+from dns.validation import validator_registry
+
+BODIES = {
+    "dns_rule_schema": (dns_rule_schema, {
+        "dnsRuleId": "rule1",
+        "domainName": "www.example.com",
+        "ipAddressType": "IP_V4",
+        "ipAddress": "10.0.0.1",
+        "ttl": 300,
+        "state": "ACTIVE",
+    }),
+    "serviceinfo_schema": (serviceinfo_schema, {
+        "version": "2.2.1",
+        "transportInfo": {
+            "id": "transport1",
+            "name": "REST",
+            "type": "REST_HTTP",
+            "protocol": "HTTP",
+            "version": "2.0",
+            "endpoint": {"uris": ["http://10.0.0.1:8080/api"]},
+            "security": {"oAuth2Info": {"grantTypes": ["OAUTH2_CLIENT_CREDENTIALS"],
+                                        "tokenEndpoint": "http://10.0.0.1/token"}},
+        },
+        "serializer": "JSON",
+        "state": "ACTIVE",
+        "serName": "service1",
+        "scopeOfLocality": "MEC_HOST",
+        "consumedLocalOnly": True,
+        "isLocal": True,
+    }),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request body validation latency.")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name, (schema, body) in BODIES.items():
+        # Both paths must accept the body, otherwise the comparison is meaningless
+        jsonschema.validate(body, schema)
+        validator_registry.validate(body, schema)
+
+        samples = measure(lambda: jsonschema.validate(body, schema), args.iterations)
+        results.append(dict(schema=name, method="per-call", **summarize(samples)))
+        samples = measure(lambda: validator_registry.validate(body, schema), args.iterations)
+        results.append(dict(schema=name, method="cached", **summarize(samples)))
+    emit("validation", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Zone file parsing throughput.                                        #
+#                                                                      #
+# "service" files hold the one-line records written by this service;   #
+# "rfc1035" files use relative names, $ORIGIN/$TTL, blank owners,      #
+# comments and a mix of A, AAAA, CNAME, TXT and SRV records, as zones  #
+# produced by other tools do. "parse" only streams the records,        #
+# "load" also builds the zone store index.                             #
+#                                                                      #
+#   python benchmarks/bench_zonefile.py --output zonefile.json         #
+########################################################################
+import argparse
+import os
+import tempfile
+import time
+
+from harness import emit
+
+from dns import zonefile
+from dns.store import Zone
+
+SOA_LINE = "bench.zone. IN SOA ns1.bench.zone. admin.bench.zone. 2022110900 7200 3600 1209600 3600\n"
+
+
+def write_service(path: str, size: int):
+    with open(path, mode='w') as f:
+        f.write(SOA_LINE)
+        for i in range(size):
+            f.write("host%d.bench.zone. 60 IN A 10.%d.%d.%d\n" % (i, i >> 16 & 255, i >> 8 & 255, i & 255))
+
+
+def write_rfc1035(path: str, size: int):
+    with open(path, mode='w') as f:
+        f.write("$ORIGIN bench.zone.\n$TTL 1h\n")
+        f.write("@ IN SOA ns1 admin (\n    2022110900 ; serial\n    2h 1h 2w 1h )\n")
+        for i in range(size):
+            kind = i % 5
+            if kind == 0:
+                f.write("host%d IN A 10.%d.%d.%d ; host\n" % (i, i >> 16 & 255, i >> 8 & 255, i & 255))
+            elif kind == 1:
+                f.write("  600 IN AAAA 2001:db8::%x\n" % i)
+            elif kind == 2:
+                f.write("alias%d CNAME host%d\n" % (i, i - 2))
+            elif kind == 3:
+                f.write('txt%d TXT "v=spf1 -all" "id=%d"\n' % (i, i))
+            else:
+                f.write("_svc%d._tcp SRV 10 60 5060 host%d\n" % (i, i - 4))
+
+
+def run(name: str, path: str, size: int) -> list:
+    results = []
+    start = time.perf_counter()
+    count = sum(1 for _ in zonefile.parse_file(path, "bench.zone"))
+    elapsed = time.perf_counter() - start
+    results.append(dict(format=name, step="parse", records=count, seconds=elapsed, records_per_sec=count / elapsed))
+
+    start = time.perf_counter()
+    with open(path, mode='r') as f:
+        zone = Zone.from_lines(f, "bench.zone")
+    elapsed = time.perf_counter() - start
+    results.append(dict(format=name, step="load", records=len(zone), seconds=elapsed, records_per_sec=len(zone) / elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zone file parsing throughput.")
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as files_path:
+        for name, write in (("service", write_service), ("rfc1035", write_rfc1035)):
+            path = os.path.join(files_path, "%s.db" % name)
+            write(path, args.size)
+            results.extend(run(name, path, args.size))
+            os.remove(path)
+    emit("zonefile", results, args.output)
+
+
+if __name__ == "__main__":
+    main()
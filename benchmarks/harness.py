@@ -0,0 +1,99 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Helpers shared by the benchmark scripts: latency sampling and        #
+# percentiles, and machine-readable output of the results.             #
+########################################################################
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Make the dns package importable when a benchmark is run as a script
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def percentile(samples: list, p: float) -> float:
+    """
+    Returns the p-th percentile (0-100) of a list of samples, nearest rank.
+    """
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples: list) -> dict:
+    """
+    Summarizes latency samples, in seconds, into p50/p99 (microseconds) and ops/sec.
+    """
+    total = sum(samples)
+    return dict(
+        n=len(samples),
+        p50_us=percentile(samples, 50) * 1e6,
+        p99_us=percentile(samples, 99) * 1e6,
+        ops_per_sec=len(samples) / total if total else float("inf"),
+    )
+
+
+def measure(func, iterations: int, setup=None) -> list:
+    """
+    Calls func iterations times and returns the latency of each call, in seconds.
+    If given, setup(i) is called before each call, outside of the measurement,
+    and its result is passed to func.
+    """
+    samples = []
+    for i in range(iterations):
+        arg = setup(i) if setup is not None else None
+        start = time.perf_counter()
+        if setup is not None:
+            func(arg)
+        else:
+            func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def emit(name: str, results: list, output: str = None):
+    """
+    Prints a results table and, if output is given, writes the results as JSON
+    so that runs on different commits can be compared.
+    """
+    for result in results:
+        print("  ".join("%s=%s" % (k, ("%.2f" % v) if isinstance(v, float) else v)
+                        for k, v in result.items()))
+    if output:
+        document = dict(
+            benchmark=name,
+            revision=git_revision(),
+            python=platform.python_version(),
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            results=results,
+        )
+        with open(output, mode='w') as f:
+            json.dump(document, f, indent=2)
@@ -0,0 +1,215 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Admission control of the mutating requests. Every mutation may force #
+# a zone rewrite, so a client flooding the API is turned away before   #
+# it costs any work:                                                   #
+#   - a token bucket per client (or per zone) limits the request rate, #
+#   - at most MAX_INFLIGHT mutations run at the same time, and up to   #
+#     MAX_QUEUE more wait, for at most QUEUE_TIMEOUT seconds, for one  #
+#     of them to finish.                                               #
+# Requests beyond those limits get a 429 Too Many Requests with a      #
+# Retry-After header, without waiting.                                 #
+########################################################################
+from __future__ import annotations
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import cherrypy
+
+from .config import RATE_LIMIT, RATE_BURST, RATE_KEY, MAX_INFLIGHT, MAX_QUEUE, QUEUE_TIMEOUT
+from .models import TooManyRequests
+
+# Token buckets kept at most; the least recently used client is forgotten first
+MAX_BUCKETS = 10000
+
+
+class Rejected(Exception):
+    """
+    Raised when a request is not admitted.
+    """
+    def __init__(self, reason: str, retry_after: float):
+        """
+        :param reason: "rate" (token bucket empty) or "queue" (wait queue full or timed out)
+        :type reason: str
+        :param retry_after: Seconds after which the request should be retried
+        :type retry_after: float
+        """
+        Exception.__init__(self, reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token bucket of rate tokens per second holding at most burst tokens.
+    Not thread safe: it is used under the lock of AdmissionControl.
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """
+        Takes a token if there is one.
+        :return: 0 if a token was taken, otherwise the seconds until there is one
+        :rtype: float
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionControl:
+    """
+    Rate limits and concurrency cap of the mutating requests. A limit of 0
+    disables it.
+    """
+    def __init__(self, rate: float = 0, burst: float = 0, max_inflight: int = 0,
+                 max_queue: int = 0, queue_timeout: float = 1):
+        """
+        :param rate: Requests per second allowed to each client (or zone)
+        :type rate: float
+        :param burst: Requests a client can send at once, after being idle
+        :type burst: float
+        :param max_inflight: Mutations running at the same time
+        :type max_inflight: int
+        :param max_queue: Mutations waiting for one of the running ones to finish
+        :type max_queue: int
+        :param queue_timeout: Seconds a mutation waits in the queue before being rejected
+        :type queue_timeout: float
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._buckets = OrderedDict()
+        self.inflight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {"rate": 0, "queue": 0}
+        # Average duration of a mutation, to tell the queued clients when to retry
+        self._duration = 0.01
+
+    def _check_rate(self, key: str, now: float):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+            if len(self._buckets) > MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        wait = bucket.take(now)
+        if wait:
+            self.rejected["rate"] += 1
+            raise Rejected("rate", wait)
+
+    def _wait_slot(self):
+        if self.inflight < self.max_inflight:
+            return
+        if self.queued >= self.max_queue:
+            self.rejected["queue"] += 1
+            raise Rejected("queue", self._duration * (self.queued + 1) / self.max_inflight)
+        self.queued += 1
+        try:
+            deadline = time.monotonic() + self.queue_timeout
+            while self.inflight >= self.max_inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._done.wait(remaining):
+                    if self.inflight < self.max_inflight:
+                        break
+                    self.rejected["queue"] += 1
+                    raise Rejected("queue", self._duration * self.queued / self.max_inflight)
+        finally:
+            self.queued -= 1
+
+    @contextmanager
+    def admit(self, key: str):
+        """
+        Runs the body of the with statement if the request is admitted.
+        :param key: Client (or zone) whose token bucket is charged
+        :type key: str
+        :raises Rejected: if the request must be turned away
+        """
+        with self._lock:
+            if self.rate > 0:
+                self._check_rate(key, time.monotonic())
+            if self.max_inflight > 0:
+                self._wait_slot()
+            self.inflight += 1
+            self.admitted += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.inflight -= 1
+                self._duration += (duration - self._duration) * 0.1
+                self._done.notify()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(
+                inflight=self.inflight,
+                queued=self.queued,
+                admitted=self.admitted,
+                rejected=dict(self.rejected),
+            )
+
+
+admission = AdmissionControl(RATE_LIMIT, RATE_BURST, MAX_INFLIGHT, MAX_QUEUE, QUEUE_TIMEOUT)
+
+
+def admitted(func):
+    """
+    Decorator of the controller methods that mutate zones. The request is
+    charged to the client address, or to the zone when RATE_KEY is "zone", and
+    answered with a 429 Too Many Requests if it is not admitted.
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        if RATE_KEY == "zone":
+            key = kwargs.get("zoneName") or kwargs.get("appInstanceId") or ""
+        else:
+            key = cherrypy.request.remote.ip
+        try:
+            with admission.admit(key):
+                return func(*args, **kwargs)
+        except Rejected as e:
+            cherrypy.response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+            if e.reason == "rate":
+                error = TooManyRequests("Request rate limit exceeded.")
+            else:
+                error = TooManyRequests("Too many concurrent updates.")
+            return error.message()
+
+    return inner
@@ -0,0 +1,315 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# asyncio HTTP server mode. Connections and request parsing live on a  #
+# single event loop, so thousands of idle or in-flight requests cost   #
+# no thread; the controllers, which do blocking file I/O, run on a     #
+# bounded thread pool. Routes come from the same RoutesDispatcher the  #
+# CherryPy server mounts, and the controllers are called with the      #
+# CherryPy request/response objects they expect.                       #
+########################################################################
+import asyncio
+import json
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+import cherrypy
+from cherrypy._cpdispatch import test_callable_spec
+from cherrypy._cprequest import Request, Response
+from cherrypy.lib.httputil import HeaderMap
+
+sys.path.append("../../")
+from dns.models import ProblemDetails
+from dns.metrics import metrics, UNMATCHED
+from dns.serializer import serializer
+from dns.api.controllers.metrics_controller import MetricsController
+from dns.api.controllers.readiness_controller import ReadinessController
+
+# Largest request head and body accepted
+MAX_HEAD = 64 * 1024
+MAX_BODY = 16 * 1024 * 1024
+
+
+class HttpResponse:
+    """
+    Status, headers and body of a response to be written on the connection.
+    A streamed body (e.g. Server-Sent Events) is an iterator of chunks, sent
+    with the chunked transfer coding.
+    """
+    def __init__(self, status: int, headers: list = None, body: bytes = b"", stream=None):
+        self.status = status
+        self.headers = headers or []
+        self.body = body
+        self.stream = stream
+
+
+def problem(status: int, detail: str) -> HttpResponse:
+    body = serializer.dumps(ProblemDetails(
+        type="xxx",
+        title=HTTPStatus(status).phrase,
+        status=status,
+        detail=detail,
+        instance="xxx",
+    ))
+    return HttpResponse(status, [("Content-Type", "application/json")], body)
+
+
+class AsyncServer:
+    """
+    Serves the routes of a RoutesDispatcher under a path prefix, plus /metrics and /ready.
+    """
+    def __init__(self, dispatcher, prefix: str = "/dns_support/v1", workers: int = 32):
+        """
+        :param dispatcher: RoutesDispatcher holding the routes of the API
+        :type dispatcher: cherrypy.dispatch.RoutesDispatcher
+        :param prefix: Path under which the routes are served
+        :type prefix: str
+        :param workers: Threads running the controllers
+        :type workers: int
+        """
+        self.mapper = dispatcher.mapper
+        self.controllers = dispatcher.controllers
+        self.prefix = prefix
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dns-worker")
+        self.server = None
+        # Pages served outside of the prefix, as mounted by main()
+        self.pages = {"/metrics": MetricsController().index, "/ready": ReadinessController().index}
+
+    async def start(self, host: str, port: int):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD)
+        return self.server
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername") or ("", 0)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.write(writer, problem(431, "Request header fields too large."), False)
+                    return
+
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self.write(writer, problem(400, "Malformed request line."), False)
+                    return
+                headers = HeaderMap()
+                for line in lines[1:]:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip()] = value.strip()
+
+                if "chunked" in headers.get("Transfer-Encoding", "").lower():
+                    await self.write(writer, problem(411, "Chunked request bodies are not supported."), False)
+                    return
+                length = headers.get("Content-Length", "") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    await self.write(writer, problem(400, "Malformed Content-Length header."), False)
+                    return
+                length = int(length)
+                if length > MAX_BODY:
+                    await self.write(writer, problem(413, "Request body too large."), False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                keep_alive = version == "HTTP/1.1" and headers.get("Connection", "").lower() != "close"
+                response = await self.respond(method, target, headers, body, peer)
+                if response.stream is not None:
+                    await self.write_stream(writer, response)
+                    return
+                await self.write(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            writer.close()
+
+    async def write(self, writer: asyncio.StreamWriter, response: HttpResponse, keep_alive: bool):
+        body = b"" if response.status in (204, 304) else response.body
+        head = ["HTTP/1.1 %d %s" % (response.status, HTTPStatus(response.status).phrase)]
+        for name, value in response.headers:
+            if name.lower() not in ("content-length", "connection"):
+                head.append("%s: %s" % (name, value))
+        head.append("Content-Length: %d" % len(body))
+        head.append("Connection: %s" % ("keep-alive" if keep_alive else "close"))
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def write_stream(self, writer: asyncio.StreamWriter, response: HttpResponse):
+        head = ["HTTP/1.1 %d %s" % (response.status, HTTPStatus(response.status).phrase)]
+        for name, value in response.headers:
+            if name.lower() not in ("content-length", "connection", "transfer-encoding"):
+                head.append("%s: %s" % (name, value))
+        head.append("Transfer-Encoding: chunked")
+        head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # The iterator may block (e.g. waiting for events), so it runs on a worker
+                chunk = await loop.run_in_executor(self.executor, next, response.stream, None)
+                if chunk is None or writer.is_closing():
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if chunk:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            close = getattr(response.stream, "close", None)
+            if close is not None:
+                close()
+
+    async def respond(self, method: str, target: str, headers: HeaderMap, body: bytes, peer) -> HttpResponse:
+        url = urlsplit(target)
+        path = unquote(url.path)
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+        loop = asyncio.get_running_loop()
+
+        if path in self.pages:
+            return await loop.run_in_executor(self.executor, self.call, self.pages[path],
+                                              {}, headers, None, peer, method, path)
+        if not path.startswith(self.prefix):
+            return problem(404, "URI %s cannot be mapped to a valid resource." % path)
+
+        start = time.perf_counter()
+        route_path = path[len(self.prefix):] or "/"
+        match = self.mapper.routematch(route_path, environ=dict(REQUEST_METHOD=method))
+        if not match:
+            response = problem(404, "URI %s cannot be mapped to a valid resource." % path)
+            metrics.observe_request(UNMATCHED, 404, time.perf_counter() - start)
+            return response
+        result, route = match
+        route_name = result["controller"]
+
+        handler = getattr(self.controllers[route_name](), result["action"])
+        params.update((k, v) for k, v in result.items() if k not in ("controller", "action"))
+
+        content_type = headers.get("Content-Type", "")
+        request_json = None
+        form = {}
+        if getattr(handler, "_cp_config", {}).get("tools.json_in.on"):
+            try:
+                request_json = json.loads(body.decode("utf-8"))
+            except (UnicodeDecodeError, ValueError):
+                response = problem(400, "Invalid JSON document")
+                metrics.observe_request(route_name, 400, time.perf_counter() - start)
+                return response
+        elif content_type.startswith("application/x-www-form-urlencoded") and body:
+            # As CherryPy does, form bodies are merged into the parameters
+            form = dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+            params.update(form)
+
+        response = await loop.run_in_executor(self.executor, self.call, handler, params,
+                                              headers, request_json, peer, method, path, form)
+        metrics.observe_request(route_name, response.status, time.perf_counter() - start)
+        return response
+
+    def call(self, handler, params: dict, headers: HeaderMap, request_json, peer, method: str, path: str,
+             form: dict = None) -> HttpResponse:
+        """
+        Runs a controller method on a worker thread, with the CherryPy request and
+        response objects it reads and writes.
+        """
+        request = Request(cherrypy.lib.httputil.Host("", 0), cherrypy.lib.httputil.Host(peer[0], peer[1]))
+        request.method = method
+        request.path_info = path
+        request.headers = headers
+        request.params = params
+        # test_callable_spec tells a 400 from a 404 by the parameters sent in the body
+        request.body = SimpleNamespace(params=form or {})
+        if request_json is not None:
+            request.json = request_json
+        response = Response()
+        response.status = 200
+        cherrypy.serving.load(request, response)
+        try:
+            try:
+                try:
+                    body = handler(**params)
+                except TypeError:
+                    # As CherryPy does, tell missing or unexpected parameters (4xx) from bugs
+                    test_callable_spec(handler, (), params)
+                    raise
+            except cherrypy.HTTPError as error:
+                return problem(error.status, error._message or HTTPStatus(error.status).phrase)
+            except Exception as e:
+                cherrypy.log("Error in %s %s: %r" % (method, path, e), traceback=True)
+                return problem(500, "The server has encountered a situation it does not know how to handle.")
+            status = int(str(response.status).split()[0])
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            elif body is not None and not isinstance(body, bytes):
+                return HttpResponse(status, list(response.headers.items()), stream=iter(body))
+            return HttpResponse(status, list(response.headers.items()), body or b"")
+        finally:
+            cherrypy.serving.clear()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+
+def run(dispatcher, host: str, port: int, workers: int = 32, flush=None, flush_interval: float = None):
+    """
+    Runs the asyncio server until it is interrupted.
+    :param dispatcher: RoutesDispatcher holding the routes of the API
+    :param host: Address to listen on
+    :type host: str
+    :param port: Port to listen on
+    :type port: int
+    :param workers: Threads running the controllers
+    :type workers: int
+    :param flush: function writing the pending zone changes, called every
+                  flush_interval seconds and before exiting, if given
+    :param flush_interval: Seconds between two calls of flush
+    :type flush_interval: float
+    """
+    async def serve():
+        server = AsyncServer(dispatcher, workers=workers)
+        await server.start(host, port)
+        cherrypy.log("asyncio server listening on %s:%d with %d workers" % (host, port, workers))
+        loop = asyncio.get_running_loop()
+        # Stop as on Ctrl+C when the container is stopped
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            while True:
+                await asyncio.sleep(flush_interval or 3600)
+                if flush is not None and flush_interval:
+                    await loop.run_in_executor(server.executor, flush)
+        finally:
+            await server.close()
+            if flush is not None:
+                flush()
+
+    try:
+        asyncio.run(serve())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -0,0 +1,261 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import sys
+import cherrypy
+import ipaddress
+
+sys.path.append("../../")
+from dns.utils import lazy_import, json_out, NestedEncoder
+from dns.models import DnsRule, BadRequest, Conflict, NotFound, InternalServerError
+from dns.schemas import dns_rule_schema, dns_rule_put_schema
+from dns.validation import validate
+from dns.rules import rule_store, RuleNotFound, RuleExists, DEFAULT_TTL
+from dns.store import ZoneNotFound
+from dns.zonefile import ZoneFileError
+from dns.admission import admitted
+
+jsonschema = lazy_import("jsonschema")
+
+
+def validate_address(rule: DnsRule):
+    """
+    This function checks that the IP address of a DNS rule matches its IP address type.
+
+    :param rule: DNS rule to be checked
+    :type rule: DnsRule
+    :raises ValueError: if the address is missing or invalid
+
+    """
+    if rule.ipAddress is None:
+        raise ValueError("ipAddress is required.")
+    if rule.ipAddressType == "IP_V6":
+        ipaddress.IPv6Address(rule.ipAddress)
+    else:
+        ipaddress.IPv4Address(rule.ipAddress)
+
+
+class DnsRulesController:
+    @json_out(cls=NestedEncoder)
+    def get_rules(self, appInstanceId: str, **kwargs):
+        """
+        This function lists the DNS rules of a MEC application instance.
+
+        :param appInstanceId: Identifier of the MEC application instance.
+        :type appInstanceId: str
+        :return: DNS rules of the application instance.
+        :rtype: list
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        return rule_store.rules(appInstanceId)
+
+
+    @json_out(cls=NestedEncoder)
+    def get_rule(self, appInstanceId: str, dnsRuleId: str, **kwargs):
+        """
+        This function returns a DNS rule of a MEC application instance.
+
+        :param appInstanceId: Identifier of the MEC application instance.
+        :type appInstanceId: str
+        :param dnsRuleId: Identifier of the DNS rule.
+        :type dnsRuleId: str
+        :return: DNS rule.
+        :rtype: DnsRule
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        try:
+            rule = rule_store.get(dnsRuleId)
+        except RuleNotFound:
+            rule = None
+        if rule is None or rule.appInstanceId != appInstanceId:
+            error_msg = "Inexistent DNS rule."
+            error = NotFound(error_msg)
+            return error.message()
+
+        return rule
+
+
+    @cherrypy.tools.json_in()
+    @json_out(cls=NestedEncoder)
+    @admitted
+    def post_rule(self, appInstanceId: str, **kwargs):
+        """
+        This function creates a DNS rule for a MEC application instance. An ACTIVE rule
+        adds an A (IP_V4) or AAAA (IP_V6) record to the zone of its domain name.
+
+        :param appInstanceId: Identifier of the MEC application instance.
+        :type appInstanceId: str
+        :return: Created DNS rule.
+        :rtype: DnsRule
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        data = cherrypy.request.json
+        try:
+            validate(data, dns_rule_schema)
+            rule = DnsRule.from_json(data, appInstanceId)
+            validate_address(rule)
+        except (jsonschema.exceptions.ValidationError, ValueError) as e:
+            error = BadRequest(e)
+            return error.message()
+        if rule.ttl is None:
+            rule.ttl = DEFAULT_TTL
+
+        try:
+            rule_store.create(rule)
+        except RuleExists:
+            error_msg = "DNS rule %s already exists." % rule.dnsRuleId
+            error = Conflict(error_msg)
+            return error.message()
+        except ZoneNotFound:
+            error_msg = "No zone holds the domain name %s." % rule.domainName
+            error = NotFound(error_msg)
+            return error.message()
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
+            error = InternalServerError(error_msg)
+            return error.message()
+
+        cherrypy.log("Created DNS rule %s of %s" %(rule.dnsRuleId, appInstanceId))
+        cherrypy.response.status = 201
+        return rule
+
+
+    @cherrypy.tools.json_in()
+    @json_out(cls=NestedEncoder)
+    @admitted
+    def put_rule(self, appInstanceId: str, dnsRuleId: str, **kwargs):
+        """
+        This function updates a DNS rule of a MEC application instance. Changing only the
+        state of the rule adds (ACTIVE) or removes (INACTIVE) its record from the zone.
+
+        :param appInstanceId: Identifier of the MEC application instance.
+        :type appInstanceId: str
+        :param dnsRuleId: Identifier of the DNS rule.
+        :type dnsRuleId: str
+        :return: Updated DNS rule.
+        :rtype: DnsRule
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        try:
+            old = rule_store.get(dnsRuleId)
+        except RuleNotFound:
+            old = None
+        if old is None or old.appInstanceId != appInstanceId:
+            error_msg = "Inexistent DNS rule."
+            error = NotFound(error_msg)
+            return error.message()
+
+        data = cherrypy.request.json
+        try:
+            validate(data, dns_rule_put_schema)
+            if data.get("dnsRuleId", dnsRuleId) != dnsRuleId:
+                raise ValueError("dnsRuleId cannot be changed.")
+            # Attributes absent from the body keep their current value
+            rule = DnsRule.from_json({**old.to_json(), **data}, appInstanceId)
+            validate_address(rule)
+        except (jsonschema.exceptions.ValidationError, ValueError) as e:
+            error = BadRequest(e)
+            return error.message()
+
+        try:
+            rule_store.update(dnsRuleId, rule)
+        except RuleNotFound:
+            # Deleted meanwhile
+            error_msg = "Inexistent DNS rule."
+            error = NotFound(error_msg)
+            return error.message()
+        except ZoneNotFound:
+            error_msg = "No zone holds the domain name %s." % rule.domainName
+            error = NotFound(error_msg)
+            return error.message()
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
+            error = InternalServerError(error_msg)
+            return error.message()
+
+        cherrypy.log("Updated DNS rule %s of %s" %(dnsRuleId, appInstanceId))
+        cherrypy.response.status = 200
+        return rule
+
+
+    @json_out(cls=NestedEncoder)
+    @admitted
+    def delete_rule(self, appInstanceId: str, dnsRuleId: str, **kwargs):
+        """
+        This function deletes a DNS rule of a MEC application instance, and its record.
+
+        :param appInstanceId: Identifier of the MEC application instance.
+        :type appInstanceId: str
+        :param dnsRuleId: Identifier of the DNS rule.
+        :type dnsRuleId: str
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        try:
+            rule = rule_store.get(dnsRuleId)
+        except RuleNotFound:
+            rule = None
+        if rule is None or rule.appInstanceId != appInstanceId:
+            error_msg = "Inexistent DNS rule."
+            error = NotFound(error_msg)
+            return error.message()
+
+        try:
+            rule_store.delete(dnsRuleId)
+        except RuleNotFound:
+            error_msg = "Inexistent DNS rule."
+            error = NotFound(error_msg)
+            return error.message()
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
+            error = InternalServerError(error_msg)
+            return error.message()
+
+        cherrypy.log("Deleted DNS rule %s of %s" %(dnsRuleId, appInstanceId))
+        cherrypy.response.status = 204
@@ -0,0 +1,87 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import sys
+import cherrypy
+
+sys.path.append("../../")
+from dns.metrics import metrics, family
+from dns.store import zone_store
+from dns.locks import lock_manager
+from dns.cache import response_cache
+from dns.validation import validator_registry
+from dns.admission import admission
+from dns.api.controllers.watch_controller import watchers
+from dns.responder import responder
+from dns.live import live_probe
+
+
+class MetricsController:
+    @cherrypy.expose
+    def index(self):
+        """
+        This function returns the metrics of the DNS API in the Prometheus text format.
+
+        :return: Metrics in the Prometheus text exposition format (version 0.0.4).
+        :rtype: bytes
+
+        """
+        cherrypy.response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+
+        locks = sorted(lock_manager.stats().items())
+        schemas = sorted(validator_registry.stats().items())
+        admission_stats = admission.stats()
+        body = "".join([
+            metrics.render(),
+            family("dns_api_zones", "gauge", "Zones, including the ones not loaded yet.",
+                   [("", {}, len(zone_store.names()))]),
+            family("dns_api_zone_records", "gauge", "Records of every zone held in memory.",
+                   [("", dict(zone=zone), n) for zone, n in sorted(zone_store.record_counts().items())]),
+            family("dns_api_lock_acquisitions_total", "counter", "Acquisitions of the zone locks, as a whole, and of the Corefile lock.",
+                   [("", dict(lock=lock), s["acquisitions"]) for lock, s in locks]),
+            family("dns_api_lock_wait_seconds_total", "counter", "Time spent waiting for the lock.",
+                   [("", dict(lock=lock), s["wait_total"]) for lock, s in locks]),
+            family("dns_api_lock_hold_seconds_total", "counter", "Time the lock was held.",
+                   [("", dict(lock=lock), s["hold_total"]) for lock, s in locks]),
+            family("dns_api_schema_validations_total", "counter", "Request body validations, by schema.",
+                   [("", dict(schema=schema), s["validations"]) for schema, s in schemas]),
+            family("dns_api_schema_validation_seconds_total", "counter", "Time spent validating request bodies, by schema.",
+                   [("", dict(schema=schema), s["total_us"] / 1e6) for schema, s in schemas]),
+            family("dns_api_response_cache_hits_total", "counter", "Read API responses served from the cache.",
+                   [("", {}, response_cache.hits)]),
+            family("dns_api_response_cache_misses_total", "counter", "Read API responses built from the zone store.",
+                   [("", {}, response_cache.misses)]),
+            family("dns_api_admission_inflight", "gauge", "Mutations running.",
+                   [("", {}, admission_stats["inflight"])]),
+            family("dns_api_admission_queue_depth", "gauge", "Mutations waiting for a running one to finish.",
+                   [("", {}, admission_stats["queued"])]),
+            family("dns_api_admission_admitted_total", "counter", "Mutations admitted.",
+                   [("", {}, admission_stats["admitted"])]),
+            family("dns_api_admission_rejected_total", "counter", "Mutations rejected with a 429, by limit.",
+                   [("", dict(reason=reason), n) for reason, n in sorted(admission_stats["rejected"].items())]),
+            family("dns_api_watchers", "gauge", "Watch requests of the change feed being answered.",
+                   [("", {}, watchers.count)]),
+            family("dns_api_responder_queries_total", "counter", "DNS queries received by the embedded responder, by outcome.",
+                   [("", dict(result=result), n) for result, n in sorted(responder.queries.items())]),
+            family("dns_api_responder_answers_built_total", "counter", "Answers of the embedded responder encoded from the zone store.",
+                   [("", {}, responder.built)]),
+            family("dns_api_live_waits_total", "counter", "Mutations requested with wait=live, by outcome.",
+                   [("", dict(result=result), n) for result, n in sorted(live_probe.waits.items())]),
+            family("dns_api_live_seconds", "histogram", "Time until the serial of a mutation was served.",
+                   live_probe.latency.samples({})),
+            family("dns_api_live_probe_queries_total", "counter", "SOA queries sent to the DNS server by the live probe.",
+                   [("", {}, live_probe.queries)]),
+        ])
+        return body.encode("utf-8")
@@ -0,0 +1,38 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import sys
+import cherrypy
+
+sys.path.append("../../")
+from dns.serializer import serializer
+from dns.warmup import warm_start, READY
+
+
+class ReadinessController:
+    @cherrypy.expose
+    def index(self):
+        """
+        This function reports whether the zones found at startup are loaded.
+
+        :return: Progress of the warm start, with status 200 once it is "ready"
+                 and 503 while it is "loading".
+        :rtype: bytes
+
+        """
+        cherrypy.response.headers["Content-Type"] = "application/json"
+        report = warm_start.report()
+        if report["status"] != READY:
+            cherrypy.response.status = 503
+        return serializer.dumps(report)
@@ -0,0 +1,129 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import sys
+import cherrypy
+
+sys.path.append("../../")
+from dns.utils import json_out, NestedEncoder
+from dns.models import BadRequest, NotFound
+from dns.serializer import serializer
+from dns.store import zone_store, ZoneNotFound
+from dns.corefile import corefile
+from dns.locks import lock_manager
+
+# Change records returned at most by one request
+MAX_CHANGES = 1000
+
+
+class ReplicationController:
+    @json_out(cls=NestedEncoder)
+    def get_changes(self, since: str = "0", limit: str = str(MAX_CHANGES), **kwargs):
+        """
+        This function returns the change records committed after a sequence number,
+        oldest first, for the replication followers.
+
+        :param since: Sequence number of the last change record applied by the follower.
+        :type since: str
+        :param limit: Change records returned at most.
+        :type limit: str
+        :return: Epoch and last sequence number of the change log, and the change records,
+                 or resync set to true if the follower must copy a snapshot.
+        :rtype: dict
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        changelog = zone_store.changelog
+        if changelog is None:
+            error = NotFound("Replication is disabled.")
+            return error.message()
+
+        try:
+            since = int(since)
+            limit = min(max(int(limit), 1), MAX_CHANGES)
+        except ValueError:
+            error = BadRequest("since and limit must be integers.")
+            return error.message()
+
+        changes = changelog.since(since, limit)
+        if changes is None:
+            return dict(epoch=changelog.epoch, seq=changelog.seq, resync=True)
+        return dict(epoch=changelog.epoch, seq=changelog.seq, resync=False, changes=changes)
+
+
+    def get_snapshot(self, zoneName: str = None, **kwargs):
+        """
+        This function returns the content of every zone, or of a single zone, and the
+        sequence number of the change log it reflects. The zones are rendered and sent
+        one at a time, so a snapshot of many zones is never held in memory.
+
+        :param zoneName: Name of the zone, every zone if omitted.
+        :type zoneName: str
+        :return: Epoch and sequence number of the change log, and the zone files.
+        :rtype: dict
+
+        """
+        cherrypy.response.headers["Content-Type"] = "application/json"
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        changelog = zone_store.changelog
+        if changelog is None:
+            error = NotFound("Replication is disabled.")
+            return error.message()
+
+        if zoneName and not zone_store.exists(zoneName):
+            error = NotFound("Inexistent zone name.")
+            return error.message()
+
+        # Read before the zones: records committed meanwhile are sent again, and
+        # the followers skip the ones their zones already hold
+        seq = changelog.seq
+
+        with lock_manager.corefile():
+            corefile.load()
+            blocks = set(corefile.zones)
+
+        head = b'{"epoch": %s, "seq": %d, "zones": [' % (serializer.dumps(changelog.epoch), seq)
+        cherrypy.response.stream = True
+        return self.zone_stream(head, [zoneName] if zoneName else zone_store.names(), blocks)
+
+    def zone_stream(self, head: bytes, names: list, blocks: set):
+        """
+        Yields the snapshot document a zone at a time. An error reading a zone ends
+        the stream early, so the follower gets an incomplete document and retries.
+        """
+        yield head
+        separator = b""
+        for name in names:
+            try:
+                with zone_store.locked(name) as zone:
+                    body = serializer.dumps(dict(zoneName=name, serial=zone.soa.serial, content=zone.render(),
+                                                 serverBlock=name in blocks))
+            except ZoneNotFound:
+                # Dropped meanwhile, the followers apply the drop from the change log
+                continue
+            yield separator + body
+            separator = b","
+        yield b"]}"
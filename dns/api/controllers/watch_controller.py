@@ -0,0 +1,208 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+import itertools
+import sys
+import threading
+import time
+import cherrypy
+
+sys.path.append("../../")
+from dns.models import BadRequest, NotFound, TooManyRequests
+from dns.serializer import serializer
+from dns.store import zone_store, ZoneNotFound
+from dns.changelog import CREATE, DROP
+from dns.config import MAX_WATCHERS, WATCH_TIMEOUT
+
+# Events sent at most by one answer
+MAX_EVENTS = 1000
+
+# Seconds between two keep-alive comments of an event stream
+HEARTBEAT = 15
+
+EVENT_TYPES = {CREATE: "zoneCreated", DROP: "zoneDeleted"}
+
+
+class Watchers:
+    """
+    Number of watch requests being answered, capped at MAX_WATCHERS.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def enter(self) -> bool:
+        with self._lock:
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.count -= 1
+
+
+watchers = Watchers(MAX_WATCHERS)
+
+
+def change_to_json(change: list) -> dict:
+    """
+    Converts an encoded change (see dns.changelog.encode_changes) to an event change.
+    """
+    if change[0] in ("add", "discard"):
+        name, ttl, _, rtype, data = change[1].split(None, 4)
+        return dict(action=change[0], name=name.rstrip("."), type=rtype, data=data, ttl=ttl)
+    return dict(action=change[0], name=change[1], type=change[2])
+
+
+def record_to_event(record: dict) -> dict:
+    """
+    Converts a change record of the change log to a watch event.
+    """
+    event = dict(seq=record["seq"], zoneName=record["zone"],
+                 type=EVENT_TYPES.get(record["op"], "recordsChanged"))
+    if "serial" in record:
+        event["serial"] = record["serial"]
+    if "fromSerial" in record:
+        event["fromSerial"] = record["fromSerial"]
+    if "changes" in record:
+        event["changes"] = [change_to_json(change) for change in record["changes"]]
+    return event
+
+
+class WatchController:
+    def watch(self, zoneName: str = None, since: str = None, serial: str = None, epoch: str = None,
+              timeout: str = None, **kwargs):
+        """
+        This function returns the zone and record change events following the last
+        one seen by the client, waiting for them if there is none yet. Events are
+        sent as one JSON document (long-poll), or as a stream of Server-Sent Events
+        if the client accepts text/event-stream.
+
+        :param zoneName: Name of the zone watched, every zone if omitted.
+        :type zoneName: str
+        :param since: Sequence number of the last event seen (or the Last-Event-ID header).
+        :type since: str
+        :param serial: SOA serial of the zone last seen, instead of since.
+        :type serial: str
+        :param epoch: Epoch of the last answer; a different one means the server restarted.
+        :type epoch: str
+        :param timeout: Seconds to wait for events, at most WATCH_TIMEOUT.
+        :type timeout: str
+        :return: Epoch, sequence number to resume from, resync flag and events.
+        :rtype: dict
+
+        """
+        cherrypy.response.headers["Content-Type"] = "application/json"
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        changelog = zone_store.changelog
+        if changelog is None:
+            error = NotFound("The change feed is disabled.")
+            return error.message()
+
+        since = cherrypy.request.headers.get("Last-Event-ID", since)
+        try:
+            since = int(since) if since is not None else None
+            timeout = min(max(float(timeout), 0), WATCH_TIMEOUT) if timeout is not None else WATCH_TIMEOUT
+        except ValueError:
+            error = BadRequest("since and timeout must be numbers.")
+            return error.message()
+
+        # Where to resume from; None if the client must resync
+        if epoch is not None and epoch != changelog.epoch:
+            since = None
+        elif since is None and serial is not None:
+            if zoneName is None:
+                error = BadRequest("serial requires zoneName.")
+                return error.message()
+            try:
+                current = zone_store.get(zoneName).soa.serial
+            except ZoneNotFound:
+                error = NotFound("Inexistent zone name.")
+                return error.message()
+            since = changelog.seq if serial == current else changelog.find_serial(zoneName, serial)
+        elif since is None and epoch is None:
+            since = changelog.seq
+
+        if not watchers.enter():
+            cherrypy.response.headers["Retry-After"] = "1"
+            error = TooManyRequests("Too many watchers.")
+            return error.message()
+
+        stream = "text/event-stream" in cherrypy.request.headers.get("Accept", "")
+        if stream:
+            cherrypy.response.headers["Content-Type"] = "text/event-stream"
+            cherrypy.response.headers["Cache-Control"] = "no-cache"
+            cherrypy.response.stream = True
+            events = self.event_stream(changelog, zoneName, since, timeout)
+            # Started here, so that watchers.leave() runs even if the client
+            # leaves before the first event
+            return itertools.chain([next(events)], events)
+        try:
+            return serializer.dumps(self.poll(changelog, zoneName, since, timeout))
+        finally:
+            watchers.leave()
+
+    def poll(self, changelog, zoneName: str, since: int, timeout: float) -> dict:
+        """
+        Waits until there are events following since, or until timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while since is not None:
+            records = changelog.since(since, MAX_EVENTS)
+            if records is None:
+                break
+            events = [record_to_event(r) for r in records if zoneName is None or r["zone"] == zoneName]
+            if records:
+                since = records[-1]["seq"]
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return dict(epoch=changelog.epoch, seq=since, resync=False, events=events)
+            changelog.wait(since, remaining)
+        # Fell behind the change log: re-read the zones, then watch from seq
+        return dict(epoch=changelog.epoch, seq=changelog.seq, resync=True, events=[])
+
+    def event_stream(self, changelog, zoneName: str, since: int, timeout: float):
+        """
+        Yields Server-Sent Events until timeout; the client reconnects with the
+        Last-Event-ID header to resume.
+        """
+        try:
+            # Tells the client to reconnect right away when the stream ends
+            yield b"retry: 1000\n\n"
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                answer = self.poll(changelog, zoneName, since, min(remaining, HEARTBEAT))
+                if answer["resync"]:
+                    yield ("event: resync\ndata: %s\n\n" % serializer.dumps(answer).decode("utf-8")).encode("utf-8")
+                    return
+                for event in answer["events"]:
+                    yield ("id: %d\nevent: %s\ndata: %s\n\n" % (
+                        event["seq"], event["type"], serializer.dumps(event).decode("utf-8"))).encode("utf-8")
+                if not answer["events"]:
+                    yield b": keep-alive\n\n"
+                since = answer["seq"]
+        finally:
+            watchers.leave()
@@ -13,39 +13,81 @@
 #     limitations under the License.
 
 
-import json
 import sys
-import jsonschema
 import cherrypy
 import time
-import re
-import os
+import ipaddress
+import base64
+import bisect
 
 sys.path.append("../../")
-from dns.models import *
-from json.decoder import JSONDecodeError
-from os.path import exists
+from dns.utils import lazy_import, json_out, NestedEncoder
+from dns.models import SOA, A_rec, BadRequest, Forbidden, NotFound, InternalServerError
+from dns.schemas import dns_record_batch_schema
+from dns.validation import validate
+from dns.store import zone_store, ZoneNotFound, ZoneExists, BatchRejected
+from dns.zonefile import ZoneFileError
+from dns.config import PORT
+from dns.locks import lock_manager
+from dns.corefile import corefile
+from dns.cache import response_cache, ZONES
+from dns.serializer import serializer
+from dns.admission import admitted
+from dns.live import live
+
+# Only loaded when a request body is validated
+jsonschema = lazy_import("jsonschema")
+
+# Page size of the records listing
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Distinguishes the ETags of the zones listing across restarts
+BOOT_ID = "%x" % int(time.time())
+
+
+def etag_matches(etag: str) -> bool:
+    """
+    This function sets the ETag header of the response and tells whether the client
+    already has that version of the resource (If-None-Match).
 
-PORT = '1053'
-FILES_PATH = "/tmp/coredns/"
+    :param etag: Entity tag of the resource
+    :type etag: str
+    :return: True if the response can be a 304 Not Modified
+    :rtype: bool
 
-def zone_block_pattern(zoneName: str, port: str):
     """
-    This function returns a string pattern that configures a zone block in the Corefile.
+    cherrypy.response.headers["ETag"] = etag
+    if_none_match = cherrypy.request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
 
-    :param zoneName: name of the zone to be created
-    :type zoneName: str
-    :param port: port of the dns server
-    :type port: str
-    :return: pattern of the zone block
-    :rtype: str
 
-    """
-    return "\n%s:%s {\n    import snip_base\n    file /etc/coredns/%s.db {\n        reload 5s\n    }\n}" %(zoneName, port, zoneName)
+def zone_etag(zone) -> str:
+    # Derived from the SOA serial, which is incremented on every mutation
+    return '"%s.%d"' % (zone.soa.serial, zone.generation)
+
+
+def encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    # Strict, so that characters outside the URL-safe alphabet are an error
+    return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+
+
+def not_modified() -> bytes:
+    # 304 Not Modified, without a body
+    cherrypy.response.status = 304
+    return b""
 
 
 class ZonesController:
     @json_out(cls=NestedEncoder)
+    @live
+    @admitted
     def add_zone(self, zoneName: str, mname: str, rname: str, refresh: str, retry: str, expire: str, ttl: str, **kwargs):
         """
         This function creates a zone in the Corefile and a zone file.
@@ -73,12 +115,6 @@ class ZonesController:
             error = BadRequest(error_msg)
             return error.message()
 
-        # Check if the zone file already exists raising an error if it does
-        if exists(FILES_PATH + zoneName + ".db"):
-            error_msg = "Zone %s already exists." % (zoneName)
-            error = Forbidden(error_msg)
-            return error.message()
-
         # Create the SOA object
         soa = SOA(
                     name=zoneName,
@@ -91,30 +127,34 @@ class ZonesController:
                     ttl=ttl
                     )
 
-        try:
-            # Creates the zone file and writes the SOA record
-            with open(FILES_PATH + "%s.db" %(zoneName), mode='w') as f:
-                f.write(str(soa))
-        except EnvironmentError as e:
-            error_msg = "Error creating zone file:\n" + e
-            error = InternalServerError(error_msg)
-            return error.message()
-
-        try:
-            # Appends the configuration block of the new zone into Corefile
-            core_file_zone = zone_block_pattern(zoneName, PORT)
-            with open(FILES_PATH + "Corefile", mode='a') as f:
-                f.write(core_file_zone)
-        except EnvironmentError as e:
-            error_msg = "Error raised while opening/handling Corefile:\n" + e
-            error = InternalServerError(error_msg)
-            return error.message()
+        # The zone lock is held until both the zone file and the Corefile are updated
+        with lock_manager.zone(zoneName):
+            # Creates the zone, and its zone file, raising an error if it already exists
+            try:
+                zone_store.create(soa)
+            except ZoneExists:
+                error_msg = "Zone %s already exists." % (zoneName)
+                error = Forbidden(error_msg)
+                return error.message()
+            except EnvironmentError as e:
+                error_msg = "Error creating zone file: " + str(e)
+                error = InternalServerError(error_msg)
+                return error.message()
+
+            try:
+                # Adds the configuration block of the new zone into Corefile
+                corefile.add_zone(zoneName, PORT)
+            except (EnvironmentError, ValueError) as e:
+                error_msg = "Error raised while opening/handling Corefile: " + str(e)
+                error = InternalServerError(error_msg)
+                return error.message()
 
         cherrypy.log("Created new zone named %s with SOA %s" %(zoneName, str(soa)))
         cherrypy.response.status = 200
         
 
     @json_out(cls=NestedEncoder)
+    @admitted
     def delete_zone(self, zoneName: str, **kwargs):
         """
         This function deletes a zone from the Corefile and a zone file from the /etc/coredns folder.
@@ -130,35 +170,35 @@ class ZonesController:
             error = BadRequest(error_msg)
             return error.message()
         
-        # Rewrite the Corefile without the zone block
-        try:
-            with open(FILES_PATH + "Corefile", mode='r') as f:
-                content = f.read()
-
-            with open(FILES_PATH + "Corefile", mode='w') as f:
-                new_content = re.sub(zone_block_pattern(zoneName, PORT), '', content, re.MULTILINE)
-                f.write(new_content)
-        except EnvironmentError as e:
-            error_msg = "Error handling Corefile:\n" + e
-            error = InternalServerError(error_msg)
-            return error.message()
-
-        # Delete the zone file
-        try:
-            os.remove(FILES_PATH + "%s.db" %(zoneName))
-        except OSError:
-            error_msg = "Inexistent zone name."
-            error = NotFound(error_msg)
-            return error.message()
+        # The zone lock is held until both the Corefile and the zone file are updated
+        with lock_manager.zone(zoneName):
+            # Rewrite the Corefile without the zone block
+            try:
+                corefile.remove_zone(zoneName)
+            except (EnvironmentError, ValueError) as e:
+                error_msg = "Error handling Corefile: " + str(e)
+                error = InternalServerError(error_msg)
+                return error.message()
+
+            # Delete the zone and its zone file
+            try:
+                zone_store.drop(zoneName)
+            except ZoneNotFound:
+                error_msg = "Inexistent zone name."
+                error = NotFound(error_msg)
+                return error.message()
 
         cherrypy.log("Deleted Zone %s!" %(zoneName))
         cherrypy.response.status = 200
 
 
     @json_out(cls=NestedEncoder)
+    @live
+    @admitted
     def add_a_record(self, zoneName: str, name: str, ip: str, ttl: str, **kwargs):
         """
-        This function adds an A record to a zone file.
+        This function adds an A record to a zone file. The zone must have been created
+        with add_zone: a 404 is answered otherwise, no zone file is created.
 
         :param zoneName: Name of the zone to which the record will be added.
         :type zoneName: str
@@ -177,44 +217,98 @@ class ZonesController:
             error = BadRequest(error_msg)
             return error.message()
 
+        try:
+            ipaddress.IPv4Address(ip)
+        except ValueError:
+            error_msg = "Invalid IPv4 address %s." % ip
+            error = BadRequest(error_msg)
+            return error.message()
+
         # Create the A record object
         a_record = A_rec(name, ip, ttl)
 
-        # Append the A record to the zone file and increment the serial number in the SOA record
+        # Add the A record to the zone, incrementing the serial number in the SOA
+        # record so the zone update is granted, and render the zone file
         try:
-            with open(FILES_PATH + "%s.db" %(zoneName), mode='a') as f:
-                f.write(str(a_record))
-
-            with open(FILES_PATH + "%s.db" %(zoneName), mode='r') as f:
-                # SOA serial increment so zone update is granted
-                content = f.readlines()
-        except EnvironmentError as e:
-            error_msg = "Error handling zone file:\n" + e
+            zone_store.add_record(zoneName, a_record)
+        except ZoneNotFound:
+            error_msg = "Inexistent zone name."
+            error = NotFound(error_msg)
+            return error.message()
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
             error = InternalServerError(error_msg)
             return error.message()
 
-        # Construction of the new SOA record, with the incremented serial number
-        # grating the zone update, into a string, which will be the first line 
-        # of the rewritten zone file.
-        soa = SOA.from_str(content[0])
-        soa.update()
-        content[0] = str(soa)
+        cherrypy.log("Add A record line in zone %s: %s" %(zoneName, str(a_record)))
+
+
+    @json_out(cls=NestedEncoder)
+    @live
+    @admitted
+    def update_a_record(self, zoneName: str, name: str, ip: str, ttl: str, oldIp: str = None, **kwargs):
+        """
+        This function changes the IP address and/or the TTL of the A records of a host
+        in a single operation, incrementing the serial number once. The zone file line
+        is patched in place when the new record fits in it.
+
+        :param zoneName: Name of the zone of the record.
+        :type zoneName: str
+        :param name: Name of the host.
+        :type name: str
+        :param ip: New IP address of the host.
+        :type ip: str
+        :param ttl: New time to live, in seconds.
+        :type ttl: str
+        :param oldIp: IP address of the record to be changed, when the host has several A records. Every A record of the host is replaced if omitted.
+        :type oldIp: str
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
 
         try:
-            with open(FILES_PATH + "%s.db" %(zoneName), mode='w') as f:
-                f.write(''.join(content))
-        except EnvironmentError as e:
-            error_msg = "Error handling zone file:\n" + e
+            ipaddress.IPv4Address(ip)
+        except ValueError:
+            error_msg = "Invalid IPv4 address %s." % ip
+            error = BadRequest(error_msg)
+            return error.message()
+
+        # Create the A record object
+        a_record = A_rec(name, ip, ttl)
+
+        # Replace the A records of the host, incrementing the serial number in the SOA
+        # record, and patch or render the zone file
+        try:
+            replaced = zone_store.update_record(zoneName, name, a_record, oldIp)
+        except ZoneNotFound:
+            error_msg = "Inexistent zone name."
+            error = NotFound(error_msg)
+            return error.message()
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
             error = InternalServerError(error_msg)
             return error.message()
 
-        cherrypy.log("Add A record line in zone %s: %s" %(zoneName, str(a_record)))
+        if not replaced:
+            error_msg = "Inexistent record name."
+            error = NotFound(error_msg)
+            return error.message()
+
+        cherrypy.log("Updated A record line in zone %s: %s" %(zoneName, str(a_record)))
 
 
     @json_out(cls=NestedEncoder)
+    @live
+    @admitted
     def delete_a_record(self, zoneName: str, name: str, **kwargs):
         """
-        This function deletes an A record from a zone file.
+        This function deletes an A record from a zone file. Deleting a host that has no
+        A record succeeds without changing the zone.
 
         :param zoneName: Name of the zone from which the record will be deleted.
         :type zoneName: str
@@ -228,28 +322,294 @@ class ZonesController:
             error = BadRequest(error_msg)
             return error.message()
 
+        # Remove the A records of the host from the zone, updating the SOA record
+        # serial number, and render the zone file
+        try:
+            removed = zone_store.delete_records(zoneName, name, "A")
+        except ZoneNotFound:
+            error_msg = "Inexistent zone name."
+            error = NotFound(error_msg)
+            return error.message()
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
+            error = InternalServerError(error_msg)
+            return error.message()
+
+        if removed:
+            cherrypy.log("Deleted records of %s in zone %s" %(name, zoneName))
+
+
+    @json_out(cls=NestedEncoder)
+    @admitted
+    def flush_zone(self, zoneName: str, **kwargs):
+        """
+        This function writes the zone file of a zone with pending changes right away.
+        It is meant for callers that need the zone file on disk before proceeding when
+        the zone files are written in coalescing mode.
+
+        :param zoneName: Name of the zone to be flushed.
+        :type zoneName: str
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        if not zone_store.exists(zoneName):
+            error_msg = "Inexistent zone name."
+            error = NotFound(error_msg)
+            return error.message()
 
         try:
-            with open(FILES_PATH + zoneName + ".db", mode='r') as f:
-                content = f.readlines()
-        except EnvironmentError as e:
-            error_msg = "Error reading zone file:\n" + e
+            zone_store.flush(zoneName)
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
             error = InternalServerError(error_msg)
             return error.message()
 
+        cherrypy.response.status = 200
+
 
-        # Update the SOA record serial number
-        soa = SOA.from_str(content[0])
-        soa.update()
-        content[0] = str(soa)
-        content = ''.join(content)
+    @cherrypy.tools.json_in()
+    @json_out(cls=NestedEncoder)
+    @live
+    @admitted
+    def batch_records(self, zoneName: str, **kwargs):
+        """
+        This function applies a batch of A record additions and deletions to a zone file.
+        The batch is validated as a whole and applied atomically: the SOA record serial
+        number is incremented once and the zone file is written once.
 
-        # Search for the A record to be deleted and delete it.
+        The request body is a JSON object with a list of operations, e.g.:
+            {"operations": [{"action": "add", "name": "host.zone", "ip": "10.0.0.1", "ttl": "60"},
+                            {"action": "delete", "name": "old.zone"}]}
+
+        :param zoneName: Name of the zone to which the operations are applied.
+        :type zoneName: str
+        :return: Serial number of the zone and the result of each operation.
+        :rtype: dict
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        data = cherrypy.request.json
         try:
-            with open(FILES_PATH + zoneName + ".db", mode='w') as f:
-                new_content = re.sub(r'%s.*\n' %(name), '', content, re.DOTALL)
-                f.write(new_content)
-        except EnvironmentError as e:
-            error_msg = "Error handling zone file:\n" + e
+            validate(data, dns_record_batch_schema)
+        except jsonschema.exceptions.ValidationError as e:
+            error = BadRequest(e)
+            return error.message()
+
+        # Validate every operation before applying any of them
+        operations = []
+        results = []
+        failed = False
+        for op in data["operations"]:
+            result = dict(action=op["action"], name=op["name"], status=200)
+            if op["action"] == "add":
+                try:
+                    ipaddress.IPv4Address(op["ip"])
+                except ValueError:
+                    result.update(status=400, detail="Invalid IPv4 address %s." % op["ip"])
+                    failed = True
+                operations.append(("add", A_rec(op["name"], op["ip"], str(op["ttl"]))))
+            else:
+                operations.append(("delete", op["name"]))
+            results.append(result)
+
+        # The deletions are checked against the zone even if an addition is invalid,
+        # so that every operation is reported with its own status
+        try:
+            if failed:
+                failures = zone_store.check_batch(zoneName, operations)
+            else:
+                serial, _ = zone_store.apply_batch(zoneName, operations)
+                failures = []
+        except ZoneNotFound:
+            error_msg = "Inexistent zone name."
+            error = NotFound(error_msg)
+            return error.message()
+        except BatchRejected as e:
+            failures = e.failures
+        except (EnvironmentError, ZoneFileError) as e:
+            error_msg = "Error handling zone file: " + str(e)
             error = InternalServerError(error_msg)
             return error.message()
+        for index, detail in failures:
+            results[index].update(status=404, detail=detail)
+            failed = True
+
+        if failed:
+            # Nothing was applied, the other operations are reported as not executed
+            for result in results:
+                if result["status"] == 200:
+                    result.update(status=424, detail="Not applied, the batch was rejected.")
+            cherrypy.response.status = 400
+            return dict(zoneName=zoneName, applied=False, results=results)
+
+        cherrypy.log("Applied %d record operations in zone %s" %(len(operations), zoneName))
+        cherrypy.response.status = 200
+        return dict(zoneName=zoneName, applied=True, serial=serial, results=results)
+
+
+    @json_out(cls=NestedEncoder)
+    def get_zones(self, **kwargs):
+        """
+        This function lists the names of the zones.
+
+        :return: Names of the zones.
+        :rtype: dict
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        entry = response_cache.get(ZONES, "zones")
+        if entry is None:
+            version = zone_store.version
+            etag = '"%s-%d"' % (BOOT_ID, version)
+            body = serializer.dumps(dict(zones=zone_store.names()))
+            # Not cached if it raced with a zone creation or deletion
+            response_cache.put(ZONES, "zones", etag, body, version=version)
+            entry = (etag, body)
+
+        etag, body = entry
+        if etag_matches(etag):
+            return not_modified()
+        return body
+
+
+    @json_out(cls=NestedEncoder)
+    def get_records(self, zoneName: str, cursor: str = None, limit: str = None, **kwargs):
+        """
+        This function lists the records of a zone, ordered by name, a page at a time.
+
+        :param zoneName: Name of the zone.
+        :type zoneName: str
+        :param cursor: nextCursor of the previous page, omitted for the first page.
+        :type cursor: str
+        :param limit: Maximum number of names (with all their records) in the page.
+        :type limit: str
+        :return: SOA record, records of the page and cursor of the next page.
+        :rtype: dict
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        try:
+            limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+            start = None if cursor is None else decode_cursor(cursor)
+        except ValueError:
+            error_msg = "Invalid cursor or limit."
+            error = BadRequest(error_msg)
+            return error.message()
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            error_msg = "Limit must be between 1 and %d." % MAX_PAGE_SIZE
+            error = BadRequest(error_msg)
+            return error.message()
+
+        view = ("records", start, limit)
+        entry = response_cache.get(zoneName, view)
+        if entry is None:
+            try:
+                with zone_store.locked(zoneName) as zone:
+                    # Sorted names are computed once per version of the zone
+                    index = response_cache.get(zoneName, "index")
+                    names = index[1] if index is not None else sorted(zone.records)
+                    first = 0 if start is None else bisect.bisect_right(names, start)
+                    page = names[first:first + limit]
+                    records = [record for name in page for record in zone.find(name)]
+                    next_cursor = encode_cursor(page[-1]) if first + limit < len(names) else None
+
+                    etag = zone_etag(zone)
+                    body = serializer.dumps(dict(
+                        zoneName=zoneName,
+                        soa=zone.soa,
+                        records=records,
+                        nextCursor=next_cursor,
+                    ))
+                    response_cache.put(zoneName, "index", etag, names)
+                    # Only the pages of the default size are cached, that clients
+                    # walking the zone share
+                    if limit == DEFAULT_PAGE_SIZE:
+                        response_cache.put(zoneName, view, etag, body)
+            except ZoneNotFound:
+                error_msg = "Inexistent zone name."
+                error = NotFound(error_msg)
+                return error.message()
+            except ZoneFileError as e:
+                error_msg = "Error reading zone file: " + str(e)
+                error = InternalServerError(error_msg)
+                return error.message()
+            entry = (etag, body)
+
+        etag, body = entry
+        if etag_matches(etag):
+            return not_modified()
+        return body
+
+
+    @json_out(cls=NestedEncoder)
+    def get_record(self, zoneName: str, name: str, **kwargs):
+        """
+        This function returns the records of a host.
+
+        :param zoneName: Name of the zone.
+        :type zoneName: str
+        :param name: Name of the host.
+        :type name: str
+        :return: Records of the host.
+        :rtype: dict
+
+        """
+
+        # Make sure that there is no extra parameter
+        if kwargs != {}:
+            error_msg = "Invalid attribute(s): %s" % (str(kwargs))
+            error = BadRequest(error_msg)
+            return error.message()
+
+        view = ("record", name)
+        entry = response_cache.get(zoneName, view)
+        if entry is None:
+            try:
+                with zone_store.locked(zoneName) as zone:
+                    records = zone.find(name)
+                    etag = zone_etag(zone)
+                    body = serializer.dumps(dict(zoneName=zoneName, name=name, records=records))
+                    if records:
+                        response_cache.put(zoneName, view, etag, body)
+            except ZoneNotFound:
+                error_msg = "Inexistent zone name."
+                error = NotFound(error_msg)
+                return error.message()
+            except ZoneFileError as e:
+                error_msg = "Error reading zone file: " + str(e)
+                error = InternalServerError(error_msg)
+                return error.message()
+            if not records:
+                error_msg = "Inexistent record name."
+                error = NotFound(error_msg)
+                return error.message()
+            entry = (etag, body)
+
+        etag, body = entry
+        if etag_matches(etag):
+            return not_modified()
+        return body
@@ -0,0 +1,90 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Cache of the serialized responses of the read API. Entries are kept  #
+# per zone and dropped as soon as the zone store reports a mutation,   #
+# so a cached response is always current.                              #
+########################################################################
+import threading
+
+from .store import zone_store
+
+# Key of the zones listing, which is invalidated when zones are created or deleted
+ZONES = None
+
+# Views cached per zone until its next mutation, so that views requested with
+# arbitrary parameters do not grow the cache without bound
+MAX_VIEWS = 256
+
+
+class ResponseCache:
+    """
+    Serialized responses, with their ETag, indexed by zone name and view.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, zoneName: str, view):
+        """
+        Returns the cached (etag, value) tuple of a view of a zone, or None.
+        :param zoneName: Name of the zone, or ZONES for the zones listing
+        :type zoneName: str
+        :param view: hashable description of the response (e.g. page cursor)
+        """
+        entry = self._entries.get(zoneName, {}).get(view)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(self, zoneName: str, view, etag: str, value, version: int = None):
+        """
+        Caches a view of a zone, unless MAX_VIEWS views of the zone are cached
+        already. Must be called holding the zone lock, so that an entry built
+        before a mutation is never stored after its invalidation.
+        :param version: zone_store.version the zones listing was built from, it
+                        is not cached if zones were created or deleted since then
+        :type version: int
+        """
+        with self._lock:
+            # Checked holding the lock taken by the invalidation that follows a
+            # version increment, so a stale listing is either skipped or dropped
+            if version is not None and version != zone_store.version:
+                return
+            views = self._entries.setdefault(zoneName, {})
+            if len(views) < MAX_VIEWS or view in views:
+                views[view] = (etag, value)
+
+    def invalidate(self, zoneName: str):
+        with self._lock:
+            self._entries.pop(zoneName, None)
+
+    def on_zone_event(self, event: str, zoneName: str):
+        """
+        Zone store listener dropping the entries of a mutated zone.
+        """
+        self.invalidate(zoneName)
+        if event != "update":
+            self.invalidate(ZONES)
+
+
+# Cache shared by every controller of the process
+response_cache = ResponseCache()
+zone_store.subscribe(response_cache.on_zone_event)
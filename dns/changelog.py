@@ -0,0 +1,154 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Replication change log. Every committed mutation of the zone store   #
+# becomes a change record with a global sequence number, the zone      #
+# serial before and after it and the records added and removed, like  #
+# an IXFR delta. Followers (dns/replication.py) and watchers (/watch)  #
+# read the records after the last one they saw; the log keeps the most #
+# recent ones only, and a reader that fell further behind must resync. #
+########################################################################
+import os
+import threading
+from collections import deque
+
+# Operations of the change records
+CREATE = "create"
+UPDATE = "update"
+DROP = "drop"
+
+
+def encode_changes(changes: list) -> list:
+    """
+    Encodes the changes of a commit as JSON lists, as the journal does:
+    ["add", record line], ["discard", record line] or ["delete", name, type].
+    """
+    return [[change[0], str(change[1]).rstrip("\n")] if change[0] in ("add", "discard") else list(change)
+            for change in changes]
+
+
+class ChangeLog:
+    """
+    Bounded, in-memory sequence of change records. Records of a zone are
+    appended holding the zone lock, so they are in the order of the commits.
+    """
+    def __init__(self, size: int = 10000):
+        """
+        :param size: Change records kept
+        :type size: int
+        """
+        self.size = size
+        # Identifies this log: sequence numbers restart with the process
+        self.epoch = os.urandom(8).hex()
+        self.seq = 0
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+        # Wakes up the readers waiting for new records
+        self._appended = threading.Condition(self._lock)
+
+    def append(self, zoneName: str, op: str, serial: str = None, fromSerial: str = None,
+               changes: list = None, soa: str = None) -> int:
+        """
+        Appends a change record.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param op: "create", "update" or "drop"
+        :type op: str
+        :param serial: Zone serial after the change
+        :type serial: str
+        :param fromSerial: Zone serial before the change
+        :type fromSerial: str
+        :param changes: encoded changes (see encode_changes) of an update
+        :type changes: list
+        :param soa: SOA record of a created zone
+        :type soa: str
+        :return: sequence number of the record
+        :rtype: int
+        """
+        record = dict(zone=zoneName, op=op)
+        if serial is not None:
+            record["serial"] = serial
+        if fromSerial is not None:
+            record["fromSerial"] = fromSerial
+        if changes is not None:
+            record["changes"] = changes
+        if soa is not None:
+            record["soa"] = soa
+        with self._lock:
+            self.seq += 1
+            record["seq"] = self.seq
+            self._records.append(record)
+            self._appended.notify_all()
+            return self.seq
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        """
+        Waits until a record follows a sequence number.
+        :param seq: Sequence number of the last record seen by the reader
+        :type seq: int
+        :param timeout: Seconds to wait at most
+        :type timeout: float
+        :return: True if there are records following seq
+        :rtype: bool
+        """
+        with self._lock:
+            return self._appended.wait_for(lambda: self.seq != seq, timeout)
+
+    def find_serial(self, zoneName: str, serial: str):
+        """
+        Returns the sequence number to resume from for a reader that saw a zone at
+        a serial: the one preceding the first record changing that serial.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param serial: Zone serial seen by the reader
+        :type serial: str
+        :return: sequence number, or None if no record kept changes that serial
+        """
+        with self._lock:
+            for record in self._records:
+                if record["zone"] == zoneName and record.get("fromSerial") == serial:
+                    return record["seq"] - 1
+        return None
+
+    def first(self) -> int:
+        """
+        Returns the sequence number of the oldest record kept, or the next one if
+        the log is empty.
+        """
+        with self._lock:
+            return self._records[0]["seq"] if self._records else self.seq + 1
+
+    def since(self, seq: int, limit: int = 1000):
+        """
+        Returns the records following a sequence number.
+        :param seq: Sequence number of the last record applied by the reader
+        :type seq: int
+        :param limit: Records returned at most
+        :type limit: int
+        :return: list of records, or None if some of the records following seq
+                 are no longer kept (or seq is from the future), so the reader
+                 must copy a snapshot
+        """
+        with self._lock:
+            if seq > self.seq:
+                return None
+            if seq == self.seq:
+                return []
+            first = self._records[0]["seq"] if self._records else self.seq + 1
+            if seq + 1 < first:
+                return None
+            start = seq + 1 - first
+            return [self._records[i] for i in range(start, min(start + limit, len(self._records)))]
@@ -0,0 +1,122 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Runtime configuration of the DNS API. Every value can be overridden  #
+# through an environment variable so the container can be tuned        #
+# without rebuilding the image.                                        #
+########################################################################
+import os
+
+# Folder shared with CoreDNS where the Corefile and zone files live
+FILES_PATH = os.environ.get("DNS_FILES_PATH", "/tmp/coredns/")
+
+# Port on which CoreDNS serves the zones
+PORT = os.environ.get("DNS_PORT", "1053")
+
+# Port on which the API is served
+API_PORT = int(os.environ.get("DNS_API_PORT", "8082"))
+
+# How zone files are written after a mutation:
+#   "sync"     - the zone file is rewritten before the request returns
+#   "coalesce" - mutations only mark the zone dirty and a background flusher
+#                writes each dirty zone at most once per FLUSH_INTERVAL
+FLUSH_MODE = os.environ.get("DNS_FLUSH_MODE", "sync")
+
+# Seconds between two flushes of dirty zones in "coalesce" mode. CoreDNS only
+# reloads zone files every 5s, so flushing more often than that buys nothing.
+FLUSH_INTERVAL = float(os.environ.get("DNS_FLUSH_INTERVAL", "1"))
+
+# Write-ahead journal of zone mutations ("on" or "off"). When enabled, every
+# mutation is appended to <zone>.journal before the request returns and zone
+# files are only rewritten when the journal is compacted.
+JOURNAL = os.environ.get("DNS_JOURNAL", "off") == "on"
+
+# When journal appends reach stable storage: "none" (never fsync), "group"
+# (concurrent appends share one fsync) or "always" (one fsync per append)
+JOURNAL_FSYNC = os.environ.get("DNS_JOURNAL_FSYNC", "group")
+
+# Seconds between two compactions of the journals into the zone files
+COMPACT_INTERVAL = float(os.environ.get("DNS_COMPACT_INTERVAL", "5"))
+
+# JSON encoder of the responses: "orjson", "json" (standard library) or "auto"
+# (orjson when it is installed)
+JSON_BACKEND = os.environ.get("DNS_JSON_BACKEND", "auto")
+
+# HTTP server: "cherrypy" (thread pool) or "asyncio" (event loop, controllers
+# running on a pool of AIO_WORKERS threads)
+SERVER = os.environ.get("DNS_SERVER", "cherrypy")
+
+# Threads running the controllers in the asyncio server
+AIO_WORKERS = int(os.environ.get("DNS_AIO_WORKERS", "32"))
+
+# Admission control of the mutating requests (0 disables a limit). Each client
+# address, or each zone when RATE_KEY is "zone", may send RATE_LIMIT requests
+# per second, RATE_BURST of them at once
+RATE_LIMIT = float(os.environ.get("DNS_RATE_LIMIT", "0"))
+RATE_BURST = float(os.environ.get("DNS_RATE_BURST", "20"))
+RATE_KEY = os.environ.get("DNS_RATE_KEY", "client")
+
+# Mutations running at the same time, and mutations waiting at most
+# QUEUE_TIMEOUT seconds for one of them to finish; any other is rejected
+MAX_INFLIGHT = int(os.environ.get("DNS_MAX_INFLIGHT", "0"))
+MAX_QUEUE = int(os.environ.get("DNS_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.environ.get("DNS_QUEUE_TIMEOUT", "1"))
+
+# How the zones found in FILES_PATH are loaded at startup: "eager" (parsed in
+# parallel by LOAD_WORKERS processes before the service reports ready) or
+# "lazy" (indexed only, each zone is parsed the first time it is accessed)
+LOAD_MODE = os.environ.get("DNS_LOAD_MODE", "eager")
+LOAD_WORKERS = int(os.environ.get("DNS_LOAD_WORKERS", str(os.cpu_count() or 1)))
+
+# Change records kept for the replication followers and the change feed (/watch).
+# Off (0) by default; a follower more than CHANGELOG_SIZE changes behind copies a
+# snapshot instead, so e.g. 10000 on a leader
+CHANGELOG_SIZE = int(os.environ.get("DNS_CHANGELOG_SIZE", "0"))
+
+# Watchers of the change feed (/watch) connected at the same time; each one
+# holds a server thread while it waits, so keep it below the thread pool size
+MAX_WATCHERS = int(os.environ.get("DNS_MAX_WATCHERS", "5"))
+
+# Seconds a watch request waits for changes, at most
+WATCH_TIMEOUT = float(os.environ.get("DNS_WATCH_TIMEOUT", "30"))
+
+# Embedded DNS responder answering A, AAAA and SOA queries from the zone store
+# (0 disables it). Queries for other names are forwarded to RESPONDER_UPSTREAM
+# ("host:port", e.g. the CoreDNS serving the zone files) or refused if empty
+RESPONDER_PORT = int(os.environ.get("DNS_RESPONDER_PORT", "0"))
+RESPONDER_HOST = os.environ.get("DNS_RESPONDER_HOST", "0.0.0.0")
+RESPONDER_UPSTREAM = os.environ.get("DNS_RESPONDER_UPSTREAM", "")
+
+# DNS server ("host:port") probed by the mutations requested with wait=live:
+# they return once it answers the SOA query of the zone with the new serial,
+# or after LIVE_TIMEOUT seconds. Zones waited for are probed every LIVE_INTERVAL
+LIVE_SERVER = os.environ.get("DNS_LIVE_SERVER", "127.0.0.1:" + PORT)
+LIVE_TIMEOUT = float(os.environ.get("DNS_LIVE_TIMEOUT", "10"))
+LIVE_INTERVAL = float(os.environ.get("DNS_LIVE_INTERVAL", "0.05"))
+
+# Records of the zones held in memory as slotted objects with a packed address
+# and an int TTL ("on"), about a third smaller than the default model objects
+COMPACT_RECORDS = os.environ.get("DNS_COMPACT_RECORDS", "off") == "on"
+
+# A and AAAA records of the zones held in the columns of a record table ("on"),
+# one row of a few arrays per record instead of one object. Takes precedence
+# over COMPACT_RECORDS.
+RECORD_TABLE = os.environ.get("DNS_RECORD_TABLE", "off") == "on"
+
+# Shard files of every zone (0 keeps each zone in a single file). The records
+# of a zone are split by a hash of their owner name into <zone>.d/<n>.db files
+# included by <zone>.db, and a mutation only rewrites the shards it changed
+ZONE_SHARDS = int(os.environ.get("DNS_ZONE_SHARDS", "0"))
@@ -0,0 +1,178 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Structured representation of the CoreDNS Corefile. The file is       #
+# parsed once into its snippets, the root server block and one server  #
+# block per zone, so adding or removing a zone is a dictionary         #
+# operation and the Corefile is rendered back from the model.          #
+########################################################################
+from __future__ import annotations
+import os
+
+from . import config
+from .locks import lock_manager
+from .utils import write_atomic
+from .metrics import metrics
+
+
+def zone_block_pattern(zoneName: str, port: str):
+    """
+    This function returns a string pattern that configures a zone block in the Corefile.
+    Zones stored in shards (DNS_ZONE_SHARDS) need nothing more: their zone file
+    includes the shard files of the <zone>.d folder next to it, which CoreDNS
+    reads again whenever the SOA serial of the zone file changes.
+
+    :param zoneName: name of the zone to be created
+    :type zoneName: str
+    :param port: port of the dns server
+    :type port: str
+    :return: pattern of the zone block
+    :rtype: str
+
+    """
+    return "\n%s:%s {\n    import snip_base\n    file /etc/coredns/%s.db {\n        reload 5s\n    }\n}" %(zoneName, port, zoneName)
+
+
+def split_blocks(text: str) -> list:
+    """
+    Splits a Corefile into its top level blocks. Comment lines preceding a block
+    are kept with it.
+    :param text: Corefile content
+    :type text: str
+    :return: (key, block) tuples, where key is the text before the opening brace
+    :rtype: list
+    """
+    blocks = []
+    lines = []
+    depth = 0
+    opened = False
+    for line in text.splitlines():
+        if not lines and not line.strip():
+            continue
+        lines.append(line)
+        depth += line.count("{") - line.count("}")
+        opened = opened or "{" in line
+        if depth < 0:
+            raise ValueError("Unbalanced braces in Corefile")
+        if opened and depth == 0:
+            block = "\n".join(lines)
+            key = block[:block.index("{")].splitlines()[-1].strip()
+            blocks.append((key, block))
+            lines = []
+            opened = False
+    if lines:
+        raise ValueError("Unterminated block in Corefile")
+    return blocks
+
+
+class Corefile:
+    """
+    This type represents the Corefile read by CoreDNS. It contains:
+        - the snippets (e.g. "(snip_base)") imported by the server blocks,
+        - the root server block (".:<port>"),
+        - the server block of every zone, indexed by zone name.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Path of the Corefile
+        :type path: str
+        """
+        self.path = path
+        self.snippets = []
+        self.root = None
+        self.zones = {}
+        self._loaded = False
+
+    def parse(self, text: str):
+        """
+        Replaces the model with the content of a Corefile.
+        :param text: Corefile content
+        :type text: str
+        """
+        self.snippets = []
+        self.root = None
+        self.zones = {}
+        for key, block in split_blocks(text):
+            if key.startswith("("):
+                self.snippets.append(block)
+            elif key.split(":")[0] == "." and self.root is None:
+                self.root = block
+            else:
+                self.zones[key.split(":")[0]] = block
+        self._loaded = True
+
+    def render(self) -> str:
+        """
+        Returns the Corefile content: snippets, root block and zone blocks, in that order.
+        :rtype: str
+        """
+        blocks = list(self.snippets)
+        if self.root is not None:
+            blocks.append(self.root)
+        blocks.extend(self.zones.values())
+        return "\n\n".join(blocks) + "\n"
+
+    def load(self):
+        """
+        Parses the Corefile from disk, if it was not parsed yet.
+        """
+        if not self._loaded:
+            with open(self.path, mode='r') as f:
+                self.parse(f.read())
+
+    def save(self):
+        """
+        Renders the model into the Corefile, atomically replacing the previous one.
+        """
+        write_atomic(self.path, self.render())
+        metrics.corefile_rewrite()
+
+    def add_zone(self, zoneName: str, port: str) -> bool:
+        """
+        Adds the server block of a zone and rewrites the Corefile.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param port: port of the dns server
+        :type port: str
+        :return: False if the zone already had a server block
+        :rtype: bool
+        """
+        with lock_manager.corefile():
+            self.load()
+            if zoneName in self.zones:
+                return False
+            self.zones[zoneName] = zone_block_pattern(zoneName, port).lstrip("\n")
+            self.save()
+            return True
+
+    def remove_zone(self, zoneName: str) -> bool:
+        """
+        Removes the server block of a zone and rewrites the Corefile.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :return: False if the zone had no server block
+        :rtype: bool
+        """
+        with lock_manager.corefile():
+            self.load()
+            if self.zones.pop(zoneName, None) is None:
+                return False
+            self.save()
+            return True
+
+
+# Corefile shared by every controller of the process
+corefile = Corefile(os.path.join(config.FILES_PATH, "Corefile"))
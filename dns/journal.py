@@ -0,0 +1,238 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Write-ahead journal of zone mutations. Every committed mutation is   #
+# appended, as one JSON line, to <zone>.journal before the request     #
+# returns. The zone file itself is only rewritten when the journal is  #
+# compacted, and any journal tail left by a crash is replayed over the #
+# zone file when the zone is loaded.                                   #
+########################################################################
+import json
+import os
+import threading
+
+# fsync policies
+FSYNC_NONE = "none"      # rely on the OS page cache, survives process crashes only
+FSYNC_GROUP = "group"    # concurrent appends share a single fsync
+FSYNC_ALWAYS = "always"  # one fsync per append
+
+
+class ZoneJournal:
+    """
+    Append-only journal file of a single zone.
+    """
+    def __init__(self, path: str):
+        """
+        :param path: Path of the journal file
+        :type path: str
+        """
+        self.path = path
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Sequence numbers of the last appended and of the last synced entries
+        self.appended = 0
+        self.synced = 0
+        # Error of a failed fsync: the entries not synced before it may be lost,
+        # so waiting for them fails until the journal is folded into the zone file
+        self.error = None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Journal:
+    """
+    Manages the journals of every zone. Appends and truncations of a zone
+    journal must be done holding the zone lock.
+    """
+    def __init__(self, files_path: str, fsync: str = FSYNC_GROUP):
+        """
+        :param files_path: Folder where the journal files are written
+        :type files_path: str
+        :param fsync: fsync policy, one of "none", "group" or "always"
+        :type fsync: str
+        """
+        if fsync not in (FSYNC_NONE, FSYNC_GROUP, FSYNC_ALWAYS):
+            raise ValueError("Invalid journal fsync policy: %s" % fsync)
+        self.files_path = files_path
+        self.fsync = fsync
+        self._journals = {}
+        # Protects the sequence numbers and the pending set of the group commit
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._syncer = None
+
+    def path(self, zoneName: str) -> str:
+        return os.path.join(self.files_path, "%s.journal" % zoneName)
+
+    def _get(self, zoneName: str) -> ZoneJournal:
+        journal = self._journals.get(zoneName)
+        if journal is None:
+            journal = self._journals[zoneName] = ZoneJournal(self.path(zoneName))
+        return journal
+
+    def append(self, zoneName: str, serial: str, changes: list) -> int:
+        """
+        Appends a committed mutation to the journal of a zone.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param serial: Zone serial after the mutation
+        :type serial: str
+        :param changes: ["add", <record line>] and ["delete", <name>, <type>] lists
+        :type changes: list
+        :return: sequence number of the entry, to be passed to wait()
+        :rtype: int
+        """
+        journal = self._get(zoneName)
+        entry = json.dumps(dict(serial=serial, changes=changes), separators=(",", ":")) + "\n"
+        # A single write() on an O_APPEND descriptor, so entries never interleave
+        os.write(journal.fd, entry.encode("utf-8"))
+
+        with self._cond:
+            journal.appended += 1
+            seq = journal.appended
+            if self.fsync == FSYNC_GROUP:
+                self._pending.add(journal)
+                self._start_syncer()
+                self._cond.notify_all()
+            elif self.fsync == FSYNC_NONE:
+                journal.synced = seq
+
+        if self.fsync == FSYNC_ALWAYS:
+            # Outside self._cond, so that only the appends to this zone wait for it
+            os.fsync(journal.fd)
+            with self._cond:
+                journal.synced = max(journal.synced, seq)
+                self._cond.notify_all()
+        return seq
+
+    def wait(self, zoneName: str, seq: int):
+        """
+        Blocks until the entry with the given sequence number is on stable storage.
+        Meant to be called after releasing the zone lock, so that concurrent
+        appends share the same group commit.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param seq: sequence number returned by append()
+        :type seq: int
+        :raises OSError: if the fsync of the entry failed
+        """
+        with self._cond:
+            journal = self._journals.get(zoneName)
+            while journal is not None and journal.synced < seq and journal.fd is not None:
+                if journal.error is not None:
+                    # A new exception per waiter, as several threads raise it
+                    raise OSError(journal.error.errno, "Journal fsync failed: %s" % journal.error.strerror,
+                                  journal.path)
+                self._cond.wait()
+
+    def _start_syncer(self):
+        # Must be called holding self._cond
+        if self._syncer is None:
+            self._syncer = threading.Thread(target=self._sync_loop, name="JournalSyncer", daemon=True)
+            self._syncer.start()
+
+    def _sync_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Appends arriving while this round is synced wait for the next one
+                pending = [(journal, journal.fd, journal.appended) for journal in self._pending
+                           if journal.fd is not None]
+                self._pending.clear()
+
+            # Appends are made holding their zone lock: they must not wait for the
+            # fsyncs, only the requests waiting for their entry to be durable do
+            failed = {}
+            for journal, fd, appended in pending:
+                try:
+                    os.fsync(fd)
+                except OSError as e:
+                    # Unless the journal was removed with its zone meanwhile, the
+                    # requests waiting for it fail; this thread keeps syncing the others
+                    if journal.fd is not None:
+                        failed[journal] = e
+
+            with self._cond:
+                for journal, fd, appended in pending:
+                    if journal in failed:
+                        journal.error = failed[journal]
+                    elif journal.error is None:
+                        journal.synced = max(journal.synced, appended)
+                self._cond.notify_all()
+
+    def replay(self, zoneName: str):
+        """
+        Yields the entries of the journal of a zone, oldest first. A torn entry at
+        the end of the journal, left by a crash while appending, is ignored.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        """
+        try:
+            with open(self.path(zoneName), mode='r') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        return
+        except FileNotFoundError:
+            return
+
+    def truncate(self, zoneName: str):
+        """
+        Empties the journal of a zone once its entries are folded into the zone file.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        """
+        with self._cond:
+            journal = self._journals.get(zoneName)
+            if journal is not None:
+                os.ftruncate(journal.fd, 0)
+                journal.synced = journal.appended
+                journal.error = None
+                self._cond.notify_all()
+            elif os.path.exists(self.path(zoneName)):
+                os.truncate(self.path(zoneName), 0)
+
+    def remove(self, zoneName: str):
+        """
+        Deletes the journal of a zone.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        """
+        with self._cond:
+            journal = self._journals.pop(zoneName, None)
+            if journal is not None:
+                self._pending.discard(journal)
+                journal.close()
+                self._cond.notify_all()
+        try:
+            os.remove(self.path(zoneName))
+        except FileNotFoundError:
+            pass
+
+    def tails(self) -> list:
+        """
+        Returns the names of the zones whose journal has entries not yet compacted.
+        :rtype: list
+        """
+        return [
+            entry.name[:-len(".journal")]
+            for entry in os.scandir(self.files_path)
+            if entry.name.endswith(".journal") and entry.stat().st_size > 0
+        ]
@@ -0,0 +1,213 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Propagation-aware mutations. A mutation requested with wait=live     #
+# returns once the DNS server serving the zones (LIVE_SERVER, CoreDNS  #
+# by default) answers the SOA query of the zone with the new serial,   #
+# or once LIVE_TIMEOUT expires, and reports how long that took.        #
+# A single thread probes the zones waited for: one SOA query per zone  #
+# every LIVE_INTERVAL, whatever the number of requests waiting.        #
+########################################################################
+from __future__ import annotations
+import functools
+import socket
+import threading
+import time
+
+import cherrypy
+
+from . import wire
+from .config import LIVE_SERVER, LIVE_TIMEOUT, LIVE_INTERVAL
+from .metrics import Histogram
+from .models import BadRequest
+from .responder import parse_address
+from .store import zone_store, ZoneNotFound
+
+
+def serial_reached(serial: int, target: int) -> bool:
+    """
+    Tells whether a zone serial is at or after a target serial, in serial
+    number arithmetic (RFC 1982), so serials wrapping around 2^32 compare right.
+    """
+    return (serial - target) % 2 ** 32 < 2 ** 31
+
+
+class Waiter:
+    __slots__ = ("serial", "event", "live_at")
+
+    def __init__(self, serial: int):
+        self.serial = serial
+        self.event = threading.Event()
+        self.live_at = None
+
+
+class LiveProbe:
+    """
+    Waits for zone serials to be served by a DNS server, probing its SOA answers
+    from a background thread started on the first wait.
+    """
+    def __init__(self, server: tuple, interval: float = 0.05):
+        """
+        :param server: (host, port) of the DNS server
+        :type server: tuple
+        :param interval: Seconds between two SOA queries for a zone
+        :type interval: float
+        """
+        self.server = server
+        self.interval = interval
+        # Zone apex -> waiters
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._pending = threading.Condition(self._lock)
+        self._thread = None
+        self.queries = 0
+        self.waits = dict(live=0, timeout=0)
+        # Seconds until the serial was served, of the waits that did not time out
+        self.latency = Histogram()
+
+    def wait(self, apex: str, serial: str, timeout: float):
+        """
+        Waits until the DNS server answers the SOA query of a zone with a serial
+        at or after the given one.
+        :param apex: Name of the zone apex, as in its SOA record
+        :type apex: str
+        :param serial: Serial to be served
+        :type serial: str
+        :param timeout: Seconds to wait at most
+        :type timeout: float
+        :return: seconds waited until the serial was served, or None on timeout
+        """
+        apex = apex.rstrip(".").lower()
+        waiter = Waiter(int(serial))
+        start = time.perf_counter()
+        with self._lock:
+            if apex not in self._waiters:
+                # Probed right away, the zones already waited for are probed every interval
+                self._waiters[apex] = []
+                self._pending.notify()
+            self._waiters[apex].append(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name="LiveProbe", daemon=True)
+                self._thread.start()
+        try:
+            live = waiter.event.wait(timeout)
+        finally:
+            with self._lock:
+                waiters = self._waiters[apex]
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[apex]
+                if live:
+                    self.waits["live"] += 1
+                    self.latency.observe(waiter.live_at - start)
+                else:
+                    self.waits["timeout"] += 1
+        return waiter.live_at - start if live else None
+
+    def observed(self, apex: str, serial: int, at: float):
+        """
+        Wakes up the waiters of a zone whose serial is served.
+        """
+        with self._lock:
+            for waiter in self._waiters.get(apex, ()):
+                if waiter.live_at is None and serial_reached(serial, waiter.serial):
+                    waiter.live_at = at
+                    waiter.event.set()
+
+    def run(self):
+        """
+        Sends the SOA queries of the zones waited for every interval, and reads
+        their answers until the next round.
+        """
+        family = socket.AF_INET6 if ":" in self.server[0] else socket.AF_INET
+        with socket.socket(family, socket.SOCK_DGRAM) as s:
+            id = 0
+            while True:
+                with self._lock:
+                    self._pending.wait_for(lambda: self._waiters)
+                    apexes = list(self._waiters)
+
+                sent = {}
+                for apex in apexes:
+                    id = (id + 1) & 0xFFFF
+                    sent[id] = apex
+                    try:
+                        s.sendto(wire.encode_query(apex, wire.SOA, id), self.server)
+                        self.queries += 1
+                    except (OSError, ValueError) as e:
+                        cherrypy.log("SOA query of %s to %s:%d failed: %s" % ((apex,) + self.server + (e,)))
+
+                deadline = time.perf_counter() + self.interval
+                while sent:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    s.settimeout(remaining)
+                    try:
+                        response = s.recv(65535)
+                    except OSError:
+                        # Timed out, or the server is not listening (yet)
+                        break
+                    at = time.perf_counter()
+                    apex = sent.pop(wire.HEADER.unpack_from(response)[0], None) if len(response) >= 12 else None
+                    serial = wire.soa_serial(response)
+                    if apex is not None and serial is not None:
+                        self.observed(apex, serial, at)
+                with self._lock:
+                    self._pending.wait(max(0, deadline - time.perf_counter()))
+
+
+# Probe shared by every request waiting for its mutation to be live
+live_probe = LiveProbe(parse_address(LIVE_SERVER), LIVE_INTERVAL)
+
+
+def live(func):
+    """
+    Decorator of the controller methods that mutate a zone, adding the optional
+    wait=live parameter: once the mutation succeeded, the request waits until
+    the zone serial is served (see LiveProbe) and reports, in the response body,
+    whether it is live and after how many seconds. A 202 Accepted is answered
+    when the serial is not served after LIVE_TIMEOUT seconds.
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        wait = kwargs.pop("wait", None)
+        if wait not in (None, "live"):
+            error = BadRequest("Invalid wait mode %s, must be live." % wait)
+            return error.message()
+        result = func(*args, **kwargs)
+        if wait is None or int(str(cherrypy.response.status or 200)[:3]) >= 300:
+            return result
+
+        zoneName = kwargs["zoneName"]
+        try:
+            soa = zone_store.get(zoneName).soa
+        except ZoneNotFound:
+            # Deleted meanwhile
+            return result
+        if isinstance(result, dict) and "serial" in result:
+            serial = result["serial"]
+        else:
+            # A later mutation may have bumped the serial already: it includes this one
+            serial = soa.serial
+        waited = live_probe.wait(soa.name, serial, LIVE_TIMEOUT)
+        body = result if isinstance(result, dict) else dict(zoneName=zoneName)
+        body.update(serial=serial, live=waited is not None, liveAfter=waited)
+        if waited is None:
+            cherrypy.response.status = 202
+        return body
+
+    return inner
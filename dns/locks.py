@@ -0,0 +1,133 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Sharded locks for the CherryPy worker threads. Every zone has its    #
+# own lock, so operations on different zones run in parallel, and the  #
+# shared Corefile has a separate one. When both are needed the zone    #
+# lock must be acquired first.                                         #
+########################################################################
+import threading
+import time
+from contextlib import contextmanager
+
+CORE_FILE_LOCK = "Corefile"
+ZONE_LOCKS = "zone"
+
+
+class LockStats:
+    """
+    Wait and hold times of a lock, in seconds.
+    """
+    def __init__(self):
+        self.acquisitions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+        self.hold_max = 0.0
+
+    def to_json(self):
+        return dict(
+            acquisitions=self.acquisitions,
+            wait_total=self.wait_total,
+            wait_max=self.wait_max,
+            hold_total=self.hold_total,
+            hold_max=self.hold_max,
+        )
+
+
+class LockManager:
+    """
+    Hands out one lock per zone plus the Corefile lock, and keeps wait and hold
+    time statistics for the zone locks as a whole and for the Corefile lock.
+    A zone lock only exists while threads hold it or wait for it, so the names
+    requested by clients (e.g. of zones that do not exist) do not accumulate.
+    Nested acquisitions of a lock already held by the thread are not accounted
+    twice.
+    """
+    def __init__(self):
+        # Lock name -> [lock, threads holding or waiting for it]
+        self._locks = {}
+        self._stats = {ZONE_LOCKS: LockStats(), CORE_FILE_LOCK: LockStats()}
+        # Protects self._locks and self._stats
+        self._lock = threading.Lock()
+        self._held = threading.local()
+
+    @contextmanager
+    def _acquire(self, key: str, kind: str):
+        held = self._held.__dict__.setdefault("keys", set())
+        if key in held:
+            # Nested acquisition, the lock is already held by this thread
+            yield
+            return
+
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        lock = entry[0]
+        start = time.perf_counter()
+        lock.acquire()
+        acquired = time.perf_counter()
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            lock.release()
+            released = time.perf_counter()
+            wait, hold = acquired - start, released - acquired
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+                stats = self._stats[kind]
+                stats.acquisitions += 1
+                stats.wait_total += wait
+                stats.wait_max = max(stats.wait_max, wait)
+                stats.hold_total += hold
+                stats.hold_max = max(stats.hold_max, hold)
+
+    def zone(self, zoneName: str):
+        """
+        Context manager holding the lock of a zone.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        """
+        return self._acquire("zone:" + zoneName, ZONE_LOCKS)
+
+    def corefile(self):
+        """
+        Context manager holding the Corefile lock.
+        """
+        return self._acquire(CORE_FILE_LOCK, CORE_FILE_LOCK)
+
+    def stats(self) -> dict:
+        """
+        Returns a snapshot of the statistics of the zone locks, summed over every
+        zone, and of the Corefile lock, keyed by "zone" and "Corefile".
+        :rtype: dict
+        """
+        with self._lock:
+            return {key: stats.to_json() for key, stats in self._stats.items()}
+
+    def __len__(self):
+        # Locks currently held or waited for
+        return len(self._locks)
+
+
+# Locks shared by every controller of the process
+lock_manager = LockManager()
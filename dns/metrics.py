@@ -0,0 +1,208 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Process metrics, exposed in the Prometheus text format by the        #
+# /metrics endpoint. Requests are timed by the "metrics" CherryPy tool #
+# and labelled with the name of the route registered in main.py; the   #
+# zone store, the Corefile and the Error classes report their own      #
+# counters here.                                                       #
+########################################################################
+import threading
+import time
+
+import cherrypy
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Route label of the requests that did not match any route
+UNMATCHED = "unmatched"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def family(name: str, type: str, help: str, samples: list) -> str:
+    """
+    Renders a metric family in the Prometheus text format.
+    :param name: Metric name
+    :type name: str
+    :param type: counter, gauge or histogram
+    :type type: str
+    :param help: Description of the metric
+    :type help: str
+    :param samples: (suffix, labels dict, value) tuples
+    :type samples: list
+    :rtype: str
+    """
+    lines = ["# HELP %s %s" % (name, help), "# TYPE %s %s" % (name, type)]
+    for suffix, labels, value in samples:
+        if labels:
+            label_str = "{%s}" % ",".join('%s="%s"' % (k, escape(v)) for k, v in labels.items())
+        else:
+            label_str = ""
+        lines.append("%s%s%s %s" % (name, suffix, label_str, format_value(value)))
+    return "\n".join(lines) + "\n"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Histogram:
+    """
+    Cumulative histogram of observations, in seconds.
+    """
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def samples(self, labels: dict) -> list:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append(("_bucket", dict(labels, le=format_value(float(bound))), cumulative))
+        samples.append(("_bucket", dict(labels, le="+Inf"), self.count))
+        samples.append(("_sum", labels, self.sum))
+        samples.append(("_count", labels, self.count))
+        return samples
+
+
+class Metrics:
+    """
+    Counters and histograms updated by the request path. Every update holds a
+    single lock for a few dictionary operations.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.file_bytes = {}
+        self.corefile_rewrites = 0
+        self.errors = {}
+
+    def observe_request(self, route: str, status: int, seconds: float):
+        with self._lock:
+            key = (route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get(route)
+            if histogram is None:
+                histogram = self.latency[route] = Histogram()
+            histogram.observe(seconds)
+
+    def file_io(self, zoneName: str, read: int = 0, written: int = 0):
+        """
+        Accounts the bytes read from or written to the zone file of a zone.
+        """
+        with self._lock:
+            if read:
+                key = (zoneName, "read")
+                self.file_bytes[key] = self.file_bytes.get(key, 0) + read
+            if written:
+                key = (zoneName, "written")
+                self.file_bytes[key] = self.file_bytes.get(key, 0) + written
+
+    def corefile_rewrite(self):
+        with self._lock:
+            self.corefile_rewrites += 1
+
+    def error(self, name: str):
+        """
+        Accounts an error response, by name of its Error subclass.
+        """
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def render(self) -> str:
+        """
+        Renders the counters and histograms in the Prometheus text format.
+        :rtype: str
+        """
+        with self._lock:
+            requests = sorted(self.requests.items())
+            latency = sorted((route, h.samples(dict(route=route))) for route, h in self.latency.items())
+            file_bytes = sorted(self.file_bytes.items())
+            corefile_rewrites = self.corefile_rewrites
+            errors = sorted(self.errors.items())
+
+        return "".join([
+            family("dns_api_requests_total", "counter", "Requests handled, by route and status code.",
+                   [("", dict(route=route, status=status), n) for (route, status), n in requests]),
+            family("dns_api_request_duration_seconds", "histogram", "Request latency, by route.",
+                   [sample for _, samples in latency for sample in samples]),
+            family("dns_api_zone_file_bytes_total", "counter", "Bytes read from and written to zone files.",
+                   [("", dict(zone=zone, direction=direction), n) for (zone, direction), n in file_bytes]),
+            family("dns_api_corefile_rewrites_total", "counter", "Rewrites of the Corefile.",
+                   [("", {}, corefile_rewrites)]),
+            family("dns_api_errors_total", "counter", "Error responses, by Error class.",
+                   [("", dict(error=name), n) for name, n in errors]),
+        ])
+
+
+# Metrics shared by every controller of the process
+metrics = Metrics()
+
+
+class MetricsTool(cherrypy.Tool):
+    """
+    Times every request of the application it is enabled on ("tools.metrics.on")
+    and accounts it under the name of the route it matched.
+    """
+    def __init__(self):
+        cherrypy.Tool.__init__(self, "on_start_resource", self._start, priority=10)
+
+    def _setup(self):
+        cherrypy.Tool._setup(self)
+        cherrypy.serving.request.hooks.attach("on_end_request", self._record)
+
+    def _start(self):
+        import routes
+        request = cherrypy.serving.request
+        request.metrics_start = time.perf_counter()
+        # RoutesDispatcher uses the route name as the controller key of the mapper
+        mapper_dict = routes.request_config().mapper_dict
+        request.metrics_route = (mapper_dict or {}).get("controller", UNMATCHED)
+
+    def _record(self):
+        request = cherrypy.serving.request
+        start = getattr(request, "metrics_start", None)
+        if start is None:
+            return
+        status = cherrypy.serving.response.status
+        metrics.observe_request(
+            request.metrics_route,
+            int(str(status).split()[0]) if status else 200,
+            time.perf_counter() - start,
+        )
+
+
+cherrypy.tools.metrics = MetricsTool()
@@ -15,15 +15,14 @@
 
 from __future__ import annotations
 from typing import List, Union
-from jsonschema import validate
+from .validation import validate
+from .metrics import metrics
+from .serializer import serializer
 import cherrypy
 
 from .schemas import *
 from .utils import *
 
-# Dictionaries pretty print (for testing purposes)
-import pprint 
-
 ###################################
 # Classes used by the controllers #
 ###################################
@@ -121,6 +120,18 @@ class SOA:
                self.expire + ' ' +                                              \
                self.ttl + '\n'
 
+    def to_json(self):
+        return dict(
+            name=self.name,
+            mname=self.mname,
+            rname=self.rname,
+            serial=self.serial,
+            refresh=self.refresh,
+            retry=self.retry,
+            expire=self.expire,
+            ttl=self.ttl,
+        )
+
 
 class A_rec:
     """
@@ -147,6 +158,21 @@ class A_rec:
         self.ip = ip
         self.ttl = ttl
 
+    @staticmethod
+    def from_str(a_str: str) -> A_rec:
+        """
+        Creates an A record object from a string.
+        :param a_str: A record in string format
+        :type a_str: str
+        :return: A record object
+        :rtype: A_rec
+        """
+        a = a_str.split()
+        return A_rec(
+            name=a[0][:-1],
+            ip=a[4],
+            ttl=a[1])
+
     def __str__(self):
         """
         Returns the A record in string format.
@@ -159,6 +185,140 @@ class A_rec:
                self.type + ' ' +                                                \
                self.ip + '\n'
 
+    def to_json(self):
+        return dict(
+            name=self.name,
+            type=self.type,
+            ip=self.ip,
+            ttl=self.ttl,
+        )
+
+
+class AAAA_rec(A_rec):
+    """
+    This type represents the AAAA record which is used to map a domain name to an IPv6 address.
+    It contains the same fields as the A record.
+    """
+    def __init__(self, name: str, ip: str, ttl: str):
+        """
+        :param name: Name of the domain
+        :type name: str
+        :param ip: IPv6 address
+        :type ip: str
+        :param ttl: (Time to live) Amount of time in seconds that a DNS record will be cached by an outside DNS server or resolver.
+        :type ttl: str
+        """
+        A_rec.__init__(self, name, ip, ttl)
+        self.type = "AAAA"
+
+    @staticmethod
+    def from_str(aaaa_str: str) -> AAAA_rec:
+        """
+        Creates an AAAA record object from a string.
+        :param aaaa_str: AAAA record in string format
+        :type aaaa_str: str
+        :return: AAAA record object
+        :rtype: AAAA_rec
+        """
+        a = aaaa_str.split()
+        return AAAA_rec(
+            name=a[0][:-1],
+            ip=a[4],
+            ttl=a[1])
+
+
+def record_from_str(record_str: str) -> A_rec:
+    """
+    Creates a record object from a line written by its __str__ method: A_rec or
+    AAAA_rec, or a zonefile.ResourceRecord for the other types.
+    :param record_str: record in string format
+    :type record_str: str
+    :return: record object
+    :rtype: A_rec
+    """
+    record_type = record_str.split(None, 4)[3]
+    if record_type == "A":
+        return A_rec.from_str(record_str)
+    if record_type == "AAAA":
+        return AAAA_rec.from_str(record_str)
+    from .zonefile import parse
+    return next(parse([record_str]))
+
+
+class DnsRule:
+    """
+    This type represents the ETSI GS MEC 011 DnsRule data type, the general DNS
+    configuration of a MEC application. An ACTIVE rule is served as an A (IP_V4)
+    or AAAA (IP_V6) record of the zone its domain name belongs to.
+    """
+    def __init__(
+        self,
+        dnsRuleId: str,
+        domainName: str,
+        ipAddressType: str,
+        ipAddress: str,
+        ttl: int,
+        state: str,
+        appInstanceId: str = None
+    ):
+        """
+        :param dnsRuleId: Identifier of the DNS rule
+        :type dnsRuleId: str
+        :param domainName: FQDN resolved by the DNS rule
+        :type domainName: str
+        :param ipAddressType: IP address type, IP_V4 or IP_V6
+        :type ipAddressType: str
+        :param ipAddress: IP address associated with the FQDN
+        :type ipAddress: str
+        :param ttl: Time to live value, in seconds
+        :type ttl: int
+        :param state: DNS rule state, ACTIVE or INACTIVE
+        :type state: str
+        :param appInstanceId: Identifier of the MEC application instance owning the rule
+        :type appInstanceId: str
+        """
+        self.dnsRuleId = dnsRuleId
+        self.domainName = domainName
+        self.ipAddressType = ipAddressType
+        self.ipAddress = ipAddress
+        self.ttl = ttl
+        self.state = state
+        self.appInstanceId = appInstanceId
+
+    @property
+    def active(self) -> bool:
+        return self.state == "ACTIVE"
+
+    def record(self) -> A_rec:
+        """
+        Returns the record that serves the rule.
+        :rtype: A_rec
+        """
+        record_type = AAAA_rec if self.ipAddressType == "IP_V6" else A_rec
+        return record_type(self.domainName.rstrip('.'), self.ipAddress, str(self.ttl))
+
+    @staticmethod
+    def from_json(data: dict, appInstanceId: str = None) -> DnsRule:
+        return DnsRule(
+            dnsRuleId=data["dnsRuleId"],
+            domainName=data["domainName"],
+            ipAddressType=data["ipAddressType"],
+            ipAddress=data.get("ipAddress"),
+            ttl=data.get("ttl"),
+            state=data["state"],
+            appInstanceId=appInstanceId,
+        )
+
+    def to_json(self):
+        return dict(
+            dnsRuleId=self.dnsRuleId,
+            domainName=self.domainName,
+            ipAddressType=self.ipAddressType,
+            ipAddress=self.ipAddress,
+            ttl=self.ttl,
+            state=self.state,
+        )
+
 
 #################
 # ERROR CLASSES #
@@ -199,7 +359,13 @@ class Error:
 
     def message(self):
         cherrypy.response.status = self.status
+        metrics.error(type(self).__name__)
+
+        # The detail often holds request values (names, attributes), so the
+        # body is encoded for every error
+        return serializer.dumps(self.problem_details())
 
+    def problem_details(self):
         return ProblemDetails(
             type=self.type,
             title=self.title,
@@ -286,4 +452,11 @@ class InternalServerError(Error):
             status=500,
             detail=str(e).split('\n')[0],
             instance="xxx"
-        )
\ No newline at end of file
+        )
+
+
+# Encoders of the model objects sent in the responses
+serializer.register(SOA, SOA.to_json)
+serializer.register(A_rec, A_rec.to_json)
+serializer.register(DnsRule, DnsRule.to_json)
+serializer.register(ProblemDetails, ProblemDetails.to_json)
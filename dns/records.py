@@ -0,0 +1,248 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Compact record representation for zones of millions of records.      #
+# A_rec keeps every field as a str in a per-object __dict__; the types #
+# below keep the TTL as an int, the address packed in bytes and the    #
+# owner name interned, in __slots__. Zones hold them instead of A_rec  #
+# when COMPACT_RECORDS is on. With RECORD_TABLE on, zones keep those   #
+# fields in the columns of a RecordTable instead, one row per record.  #
+########################################################################
+from __future__ import annotations
+import socket
+from array import array
+import sys
+
+from .models import A_rec, AAAA_rec
+from .serializer import serializer
+
+
+class CompactA:
+    """
+    A record with the same interface as A_rec (name, class_, type, ip, ttl,
+    __str__ and to_json), stored in a fraction of its memory.
+    """
+    __slots__ = ("name", "_ttl", "address")
+    class_ = "IN"
+    type = "A"
+    family = socket.AF_INET
+
+    def __init__(self, name: str, ip: str, ttl):
+        """
+        :param name: Name of the domain
+        :type name: str
+        :param ip: IP address
+        :type ip: str
+        :param ttl: Time to live, in seconds
+        :type ttl: int or str
+        """
+        # Zones repeat the same owner names across record types and zones
+        self.name = sys.intern(name)
+        self._ttl = int(ttl)
+        self.address = socket.inet_pton(self.family, ip)
+
+    @property
+    def ip(self) -> str:
+        return socket.inet_ntop(self.family, self.address)
+
+    @property
+    def ttl(self) -> str:
+        # Same type as A_rec.ttl, so the rendering and the API do not change
+        return str(self._ttl)
+
+    @classmethod
+    def from_record(cls, record: A_rec) -> CompactA:
+        return cls(record.name, record.ip, record.ttl)
+
+    @classmethod
+    def from_str(cls, a_str: str) -> CompactA:
+        """
+        Creates a compact record from a line written by __str__.
+        :param a_str: record in string format
+        :type a_str: str
+        """
+        a = a_str.split()
+        return cls(a[0][:-1], a[4], a[1])
+
+    def __str__(self):
+        return "%s. %d %s %s %s\n" % (self.name, self._ttl, self.class_, self.type, self.ip)
+
+    def to_json(self):
+        return dict(
+            name=self.name,
+            type=self.type,
+            ip=self.ip,
+            ttl=self.ttl,
+        )
+
+
+class CompactAAAA(CompactA):
+    """
+    AAAA record counterpart of CompactA.
+    """
+    __slots__ = ()
+    type = "AAAA"
+    family = socket.AF_INET6
+
+
+def compact(record: A_rec) -> A_rec:
+    """
+    Returns the compact counterpart of an A or AAAA record. Records of other
+    types, already compact ones and the ones whose address or TTL cannot be
+    packed are returned as they are, so they are kept and rendered unchanged.
+    :param record: record to be converted
+    :type record: A_rec
+    :rtype: CompactA or A_rec
+    """
+    if type(record) is A_rec:
+        cls = CompactA
+    elif type(record) is AAAA_rec:
+        cls = CompactAAAA
+    else:
+        return record
+    try:
+        return cls(record.name, record.ip, record.ttl)
+    except (ValueError, OSError):
+        return record
+
+
+class RecordTable:
+    """
+    Column store of the A and AAAA records of a zone. Each record is a row of
+    the columns below, so a record costs its share of a few arrays instead of
+    one Python object:
+        - names: interned owner names (list),
+        - ttls: TTLs (unsigned 32 bit array),
+        - families: 4 or 6 (byte array),
+        - addresses: packed addresses, 16 bytes per row (IPv4 in the first 4).
+    Rows are appended at the end, and removing a row moves the last row into
+    it, so the rows stay dense; remove() reports the move so that the owner of
+    the table can update the index of the moved record.
+    """
+    def __init__(self):
+        self.names = []
+        self.ttls = array("I")
+        self.families = array("B")
+        self.addresses = bytearray()
+
+    @staticmethod
+    def pack(record: A_rec) -> tuple:
+        """
+        Returns the columns of an A or AAAA record.
+        :param record: record to be stored
+        :type record: A_rec
+        :return: family, packed address and TTL
+        :rtype: tuple
+        :raises ValueError: if the address or the TTL cannot be packed
+        """
+        if record.type == "AAAA":
+            family, address = 6, socket.inet_pton(socket.AF_INET6, record.ip)
+        else:
+            family, address = 4, socket.inet_pton(socket.AF_INET, record.ip)
+        ttl = int(record.ttl)
+        if not 0 <= ttl < 1 << 32:
+            raise ValueError("TTL out of range: %d" % ttl)
+        return family, address, ttl
+
+    def add(self, record: A_rec) -> int:
+        """
+        Appends a record to the table.
+        :param record: A or AAAA record
+        :type record: A_rec
+        :return: row of the record
+        :rtype: int
+        :raises ValueError: if the address or the TTL cannot be packed
+        """
+        family, address, ttl = self.pack(record)
+        self.families.append(family)
+        self.addresses += address.ljust(16, b"\0")
+        self.ttls.append(ttl)
+        self.names.append(sys.intern(record.name))
+        return len(self.names) - 1
+
+    def replace(self, row: int, record: A_rec):
+        """
+        Stores a record in an existing row, e.g. to change its TTL.
+        :param row: row of the record
+        :type row: int
+        :param record: A or AAAA record
+        :type record: A_rec
+        :raises ValueError: if the address or the TTL cannot be packed
+        """
+        family, address, ttl = self.pack(record)
+        self.families[row] = family
+        self.addresses[row * 16:row * 16 + 16] = address.ljust(16, b"\0")
+        self.ttls[row] = ttl
+        self.names[row] = sys.intern(record.name)
+
+    def address(self, row: int) -> bytes:
+        """
+        Returns the packed address of a row, 4 or 16 bytes long.
+        :param row: row of the record
+        :type row: int
+        :rtype: bytes
+        """
+        offset = row * 16
+        return bytes(self.addresses[offset:offset + (16 if self.families[row] == 6 else 4)])
+
+    def type(self, row: int) -> str:
+        return "AAAA" if self.families[row] == 6 else "A"
+
+    def ip(self, row: int) -> str:
+        family = socket.AF_INET6 if self.families[row] == 6 else socket.AF_INET
+        return socket.inet_ntop(family, self.address(row))
+
+    def record(self, row: int) -> A_rec:
+        """
+        Returns the record of a row as an A_rec or AAAA_rec object.
+        :param row: row of the record
+        :type row: int
+        :rtype: A_rec
+        """
+        record_type = AAAA_rec if self.families[row] == 6 else A_rec
+        return record_type(self.names[row], self.ip(row), str(self.ttls[row]))
+
+    def remove(self, row: int) -> int:
+        """
+        Removes a row, moving the last row into its place.
+        :param row: row of the record
+        :type row: int
+        :return: former row of the record moved into row, None if no record moved
+        :rtype: int
+        """
+        last = len(self.names) - 1
+        moved = None
+        if row != last:
+            self.names[row] = self.names[last]
+            self.ttls[row] = self.ttls[last]
+            self.families[row] = self.families[last]
+            self.addresses[row * 16:row * 16 + 16] = self.addresses[last * 16:last * 16 + 16]
+            moved = last
+        self.names.pop()
+        self.ttls.pop()
+        self.families.pop()
+        del self.addresses[last * 16:]
+        return moved
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        for row in range(len(self.names)):
+            yield self.record(row)
+
+
+serializer.register(CompactA, CompactA.to_json)
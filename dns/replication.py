@@ -0,0 +1,223 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Replication follower. Keeps the zone files and the Corefile of a     #
+# folder read by a local CoreDNS in sync with a leader DNS API:        #
+#   - the change records committed by the leader after the last one    #
+#     applied are fetched from /replication/changes and applied as     #
+#     deltas, an update only if the local zone is at its base serial,  #
+#   - a zone that diverged is copied from /replication/snapshot, and   #
+#     every zone is copied when the follower starts, fell behind the   #
+#     change log or the leader restarted (new epoch).                  #
+# The last applied sequence number is kept in replication.json.        #
+#                                                                      #
+#   python -m dns.replication --leader http://leader:8082 \            #
+#                             --dir /tmp/coredns                       #
+########################################################################
+from __future__ import annotations
+import argparse
+import http.client
+import json
+import os
+import shutil
+import time
+import urllib.request
+from urllib.parse import urlencode
+
+import cherrypy
+
+from .changelog import CREATE, UPDATE, DROP
+from .config import PORT
+from .corefile import Corefile
+from .live import serial_reached
+from .models import SOA
+from .store import ZoneStore, ZoneNotFound, apply_changes
+from .utils import write_atomic
+
+PREFIX = "/dns_support/v1/replication"
+STATE_FILE = "replication.json"
+TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "temp_files")
+
+
+class Follower:
+    """
+    Applies the change records of a leader to the zone files of a folder.
+    """
+    def __init__(self, leader: str, files_path: str, port: str = PORT, timeout: float = 30):
+        """
+        :param leader: Base URL of the leader API, e.g. http://10.0.0.1:8082
+        :type leader: str
+        :param files_path: Folder of the zone files and of the Corefile
+        :type files_path: str
+        :param port: Port on which the local CoreDNS serves the zones
+        :type port: str
+        :param timeout: Seconds to wait for an answer of the leader
+        :type timeout: float
+        """
+        self.leader = leader.rstrip("/")
+        self.files_path = files_path
+        self.port = port
+        self.timeout = timeout
+        os.makedirs(files_path, exist_ok=True)
+        self.store = ZoneStore(files_path)
+        self.corefile = Corefile(os.path.join(files_path, "Corefile"))
+        if not os.path.exists(self.corefile.path):
+            shutil.copyfile(os.path.join(TEMPLATES_PATH, "Corefile"), self.corefile.path)
+
+        self.state_path = os.path.join(files_path, STATE_FILE)
+        self.epoch, self.seq = None, 0
+        if os.path.exists(self.state_path):
+            with open(self.state_path, mode='r') as f:
+                state = json.load(f)
+            self.epoch, self.seq = state["epoch"], state["seq"]
+
+        self.applied = 0
+        self.resyncs = 0
+        self.bytes = 0
+
+    def fetch(self, path: str, **params) -> dict:
+        url = "%s%s/%s?%s" % (self.leader, PREFIX, path, urlencode(params))
+        with urllib.request.urlopen(url, timeout=self.timeout) as response:
+            body = response.read()
+        self.bytes += len(body)
+        return json.loads(body)
+
+    def save(self):
+        write_atomic(self.state_path, json.dumps(dict(epoch=self.epoch, seq=self.seq)))
+
+    def sync(self) -> int:
+        """
+        Applies every change record committed by the leader since the last sync.
+        :return: change records applied
+        :rtype: int
+        """
+        applied = 0
+        while True:
+            answer = self.fetch("changes", since=self.seq)
+            if answer["resync"] or answer["epoch"] != self.epoch:
+                self.resync()
+                continue
+            for record in answer["changes"]:
+                self.apply(record)
+                self.seq = record["seq"]
+                applied += 1
+            self.save()
+            if not answer["changes"] or self.seq >= answer["seq"]:
+                break
+        self.applied += applied
+        return applied
+
+    def apply(self, record: dict):
+        """
+        Applies a change record.
+        :param record: change record, as built by ChangeLog.append
+        :type record: dict
+        """
+        zoneName = record["zone"]
+        if record["op"] == CREATE:
+            soa = SOA.from_str(record["soa"])
+            self.store.restore(zoneName, str(soa))
+            self.corefile.add_zone(zoneName, self.port)
+        elif record["op"] == DROP:
+            try:
+                self.store.drop(zoneName)
+            except ZoneNotFound:
+                pass
+            self.corefile.remove_zone(zoneName)
+        elif record["op"] == UPDATE:
+            try:
+                with self.store.locked(zoneName) as zone:
+                    if zone.soa.serial == record["fromSerial"]:
+                        apply_changes(zone, record["changes"])
+                        zone.soa.serial = record["serial"]
+                        self.store.commit(zone, [])
+                        return
+                    if serial_reached(int(zone.soa.serial), int(record["serial"])):
+                        # Already in the zone, copied by a snapshot
+                        return
+            except ZoneNotFound:
+                pass
+            # The zone diverged from the leader: copy it
+            self.resync(zoneName)
+
+    def resync(self, zoneName: str = None):
+        """
+        Copies every zone, or a single zone, from a snapshot of the leader.
+        :param zoneName: Name of the zone, every zone if omitted
+        :type zoneName: str
+        """
+        if zoneName is None:
+            snapshot = self.fetch("snapshot")
+        else:
+            snapshot = self.fetch("snapshot", zoneName=zoneName)
+        names = set()
+        for zone in snapshot["zones"]:
+            names.add(zone["zoneName"])
+            self.store.restore(zone["zoneName"], zone["content"])
+            if zone["serverBlock"]:
+                self.corefile.add_zone(zone["zoneName"], self.port)
+
+        if zoneName is None:
+            for name in self.store.names():
+                if name not in names:
+                    self.store.drop(name)
+                    self.corefile.remove_zone(name)
+            self.epoch, self.seq = snapshot["epoch"], snapshot["seq"]
+            self.save()
+        self.resyncs += 1
+        cherrypy.log("Copied %d zone(s) from %s" % (len(names), self.leader))
+
+    def run(self, interval: float = 1):
+        """
+        Syncs every interval seconds until interrupted. Errors reaching the leader
+        are logged and the sync is retried.
+        :param interval: Seconds between two syncs
+        :type interval: float
+        """
+        while True:
+            try:
+                applied = self.sync()
+                if applied:
+                    cherrypy.log("Applied %d change(s), at %d" % (applied, self.seq))
+            except (OSError, http.client.HTTPException, ValueError, KeyError) as e:
+                cherrypy.log("Replication from %s failed: %s" % (self.leader, e))
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replicates the zones of a DNS API leader into a local folder.")
+    parser.add_argument("--leader", required=True, help="base URL of the leader, e.g. http://10.0.0.1:8082")
+    parser.add_argument("--dir", required=True, help="folder of the zone files read by the local CoreDNS")
+    parser.add_argument("--port", default=PORT, help="port on which the local CoreDNS serves the zones")
+    parser.add_argument("--interval", type=float, default=1, help="seconds between two syncs")
+    parser.add_argument("--once", action="store_true", help="sync once and exit")
+    args = parser.parse_args()
+
+    cherrypy.log.screen = True
+    follower = Follower(args.leader, args.dir, args.port)
+    if args.once:
+        follower.sync()
+        cherrypy.log("At change %d, %d applied, %d snapshot(s), %d bytes received" % (
+            follower.seq, follower.applied, follower.resyncs, follower.bytes))
+    else:
+        try:
+            follower.run(args.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
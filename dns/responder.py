@@ -0,0 +1,426 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Embedded authoritative DNS responder. Answers A, AAAA and SOA        #
+# queries over UDP and TCP straight from the zone store, so a record   #
+# is resolvable as soon as the API request adding it returns, instead  #
+# of after the next zone file reload of CoreDNS. The wire format of    #
+# every answer is built once per name and type, in a worker thread so  #
+# that a locked zone never stalls the event loop, and dropped when the #
+# zone store reports a mutation of the zone.                           #
+# Queries for names outside the zones are forwarded to an upstream     #
+# server (e.g. CoreDNS, to sit in front of it) or refused (to replace  #
+# it). It runs in the API process (DNS_RESPONDER_PORT) or standalone:  #
+#                                                                      #
+#   python -m dns.responder --dir /tmp/coredns --port 53 \             #
+#                           [--upstream 127.0.0.1:1053] [--leader URL] #
+########################################################################
+from __future__ import annotations
+import argparse
+import functools
+import socket
+import struct
+import threading
+
+import cherrypy
+
+from . import config
+from . import wire
+from .store import ZoneStore, ZoneNotFound, fqdn, zone_store
+
+# Answers kept per zone; the answers of a zone are dropped when it is full, so
+# queries for random names cannot grow the cache without bound
+MAX_ANSWERS = 100000
+
+# Seconds to wait for an answer of the upstream server
+UPSTREAM_TIMEOUT = 2
+
+# Returned by answer() when the answer is not cached and must be built first,
+# which takes the zone lock, so the event loop runs resolve() in a thread instead
+UNCACHED = object()
+
+
+def parse_address(address: str, default_port: int = 53):
+    """
+    Parses a "host[:port]" address.
+    :return: (host, port) tuple, or None if address is empty
+    """
+    if not address:
+        return None
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, default_port
+    return host.strip("[]"), int(port)
+
+
+class Responder:
+    """
+    Answers DNS queries from the zones of a zone store.
+    """
+    def __init__(self, store: ZoneStore, upstream: tuple = None):
+        """
+        :param store: Zone store holding the zones to be served
+        :type store: ZoneStore
+        :param upstream: (host, port) of the server answering the queries for
+                         other names, refused if omitted
+        :type upstream: tuple
+        """
+        self.store = store
+        self.upstream = upstream
+        # (store version, {apex: zone name}), rebuilt when zones are created or deleted
+        self._apexes = (None, {})
+        # zone name -> (name, qtype) -> wire.Section
+        self._answers = {}
+        # zone name -> number of mutations, to tell whether an answer built
+        # while the zone was mutated may be kept
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.queries = dict(answered=0, forwarded=0, refused=0, error=0)
+        self.built = 0
+        store.subscribe(self.on_zone_event)
+
+    def on_zone_event(self, event: str, zoneName: str):
+        """
+        Zone store listener dropping the answers of a mutated zone.
+        """
+        with self._lock:
+            self._answers.pop(zoneName, None)
+            self._versions[zoneName] = self._versions.get(zoneName, 0) + 1
+
+    def zone_of(self, name: str):
+        """
+        Returns the name of the zone a name belongs to, the one with the longest
+        matching apex, or None. Zones are not loaded to find their apex: the apex
+        of a zone not in memory yet is taken to be its name, and is corrected by
+        build() when the zone is loaded.
+        :param name: domain name, in lower case without the trailing dot
+        :type name: str
+        """
+        version, apexes = self._apexes
+        if version != self.store.version:
+            version = self.store.version
+            apexes = {}
+            for zoneName in self.store.names():
+                zone = self.store.loaded(zoneName)
+                apexes[fqdn(zone.soa.name) if zone is not None else fqdn(zoneName)] = zoneName
+            self._apexes = (version, apexes)
+        while True:
+            zoneName = apexes.get(name)
+            if zoneName is not None:
+                return zoneName
+            if not name:
+                return None
+            dot = name.find(".")
+            name = name[dot + 1:] if dot >= 0 else ""
+
+    def section(self, zoneName: str, name: str, qtype: int, labels: tuple, build: bool = True):
+        """
+        Returns the answer of a zone to a query, built on the first query.
+        :param labels: offsets of the labels of the question name, see wire.Query
+        :type labels: tuple
+        :param build: Build the answer if it is not cached, else return UNCACHED
+        :type build: bool
+        :return: wire.Section, or None if the zone does not hold the name
+        """
+        key = (name, qtype)
+        answers = self._answers.get(zoneName)
+        if answers is not None:
+            section = answers.get(key)
+            if section is not None:
+                return section
+        if not build:
+            return UNCACHED
+        version = self._versions.get(zoneName, 0)
+        section = self.build(zoneName, name, qtype, labels)
+        if section is not None:
+            with self._lock:
+                # Not kept if the zone was mutated while it was built
+                if self._versions.get(zoneName, 0) == version:
+                    answers = self._answers.setdefault(zoneName, {})
+                    if len(answers) >= MAX_ANSWERS:
+                        answers.clear()
+                    answers[key] = section
+        return section
+
+    def build(self, zoneName: str, name: str, qtype: int, labels: tuple):
+        """
+        Encodes the answer of a zone to a query, holding the zone lock.
+        :param labels: offsets of the labels of the question name, see wire.Query.
+                       They only depend on the name, so the answer can be cached
+                       by name.
+        :type labels: tuple
+        :return: wire.Section, or None if the zone no longer exists, cannot be
+                 read or does not hold the name
+        """
+        try:
+            with self.store.locked(zoneName) as zone:
+                return self._build(zoneName, zone, name, qtype, labels)
+        except (ZoneNotFound, ValueError):
+            # Deleted meanwhile, or not a valid zone file
+            return None
+
+    def _build(self, zoneName: str, zone, name: str, qtype: int, labels: tuple):
+        soa = zone.soa
+        apex = fqdn(soa.name)
+        if apex != fqdn(zoneName) and self._apexes[1].get(apex) != zoneName:
+            # Loaded with an apex other than its name: match the names against it
+            self._apexes = (None, {})
+        if apex and name != apex and not name.endswith("." + apex):
+            return None
+        self.built += 1
+        if qtype == wire.SOA and name == apex:
+            return wire.Section(wire.NOERROR, 1, 0, wire.encode_rr(
+                wire.QUESTION_POINTER, wire.SOA, int(soa.ttl), wire.soa_rdata(soa)))
+
+        types = zone.records.get(name)
+        if types and qtype in (wire.A, wire.AAAA):
+            rrset = types.get("A" if qtype == wire.A else "AAAA")
+            if rrset:
+                rdata = wire.a_rdata if qtype == wire.A else wire.aaaa_rdata
+                records = zone.held(rrset)
+                return wire.Section(wire.NOERROR, len(records), 0, b"".join(
+                    wire.encode_rr(wire.QUESTION_POINTER, qtype, int(record.ttl), rdata(record.ip))
+                    for record in records))
+
+        # No data: the SOA goes in the authority section, its owner pointing at
+        # the apex within the question name. Names only owning records below
+        # them (empty non-terminals) are reported as not existing.
+        if name != apex:
+            owner = struct.pack("!H", 0xC000 | labels[len(labels) - 1 - (apex.count(".") + 1 if apex else 0)])
+        else:
+            owner = wire.QUESTION_POINTER
+        rcode = wire.NOERROR if types or name == apex else wire.NXDOMAIN
+        return wire.Section(rcode, 0, 1, wire.encode_rr(owner, wire.SOA, int(soa.ttl), wire.soa_rdata(soa)))
+
+    def answer(self, message: bytes, udp: bool = True, build: bool = True):
+        """
+        Answers a query.
+        :param message: query in wire format
+        :type message: bytes
+        :param udp: whether the answer is sent over UDP, and may be truncated
+        :type udp: bool
+        :param build: Build the answer if it is not cached, else return UNCACHED
+        :type build: bool
+        :return: response in wire format, empty if there must be no response,
+                 None if the query must be forwarded to the upstream server, or
+                 UNCACHED
+        """
+        try:
+            query = wire.parse_query(message)
+        except wire.FormatError:
+            self.queries["error"] += 1
+            return wire.error(message, wire.FORMERR)
+        if query.flags & wire.OPCODE:
+            # Only standard queries (opcode 0) are supported
+            self.queries["error"] += 1
+            return wire.error(message, wire.NOTIMP)
+
+        zoneName = self.zone_of(query.name) if query.qclass == wire.CLASS_IN else None
+        section = self.section(zoneName, query.name, query.qtype, query.labels, build) if zoneName is not None else None
+        if section is UNCACHED:
+            return UNCACHED
+        if section is None:
+            if self.upstream is not None:
+                self.queries["forwarded"] += 1
+                return None
+            self.queries["refused"] += 1
+            return wire.error(message, wire.REFUSED)
+        self.queries["answered"] += 1
+        return wire.response(query, section, udp)
+
+    def resolve(self, message: bytes, udp: bool = True) -> bytes:
+        """
+        Answers a query, building its answer or forwarding it to the upstream
+        server if needed. Blocking, run off the event loop.
+        """
+        response = self.answer(message, udp)
+        if response is None:
+            response = self.forward(message, udp)
+        return response
+
+    def blocking(self, response):
+        """
+        Returns the function finishing the answer to a query off the event loop,
+        from the result of answer(build=False), or None if it is complete.
+        """
+        if response is UNCACHED:
+            return self.resolve
+        if response is None:
+            return self.forward
+        return None
+
+    def forward(self, message: bytes, udp: bool = True) -> bytes:
+        """
+        Sends a query to the upstream server and returns its response, or a
+        SERVFAIL response if it does not answer. Blocking, run off the event loop.
+        """
+        try:
+            if udp:
+                with socket.socket(socket.AF_INET6 if ":" in self.upstream[0] else socket.AF_INET,
+                                   socket.SOCK_DGRAM) as s:
+                    s.settimeout(UPSTREAM_TIMEOUT)
+                    s.sendto(message, self.upstream)
+                    while True:
+                        response = s.recv(65535)
+                        # Drop stray responses to other queries
+                        if response[:2] == message[:2]:
+                            return response
+            with socket.create_connection(self.upstream, timeout=UPSTREAM_TIMEOUT) as s:
+                s.sendall(struct.pack("!H", len(message)) + message)
+                length = struct.unpack("!H", recv_exactly(s, 2))[0]
+                return recv_exactly(s, length)
+        except (OSError, struct.error) as e:
+            cherrypy.log("Upstream %s:%d did not answer: %s" % (self.upstream + (e,)))
+            return wire.error(message, wire.SERVFAIL)
+
+    async def serve(self, host: str, port: int):
+        """
+        Serves queries over UDP and TCP until cancelled.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: UdpProtocol(self), local_addr=(host, port))
+        server = await asyncio.start_server(self.serve_tcp, host, port)
+        cherrypy.log("DNS responder listening on %s:%d (UDP and TCP)" % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            transport.close()
+
+    async def serve_tcp(self, reader, writer):
+        # Queries over TCP are prefixed by their length, several per connection
+        import asyncio
+        try:
+            while True:
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+                message = await reader.readexactly(length)
+                response = self.answer(message, udp=False, build=False)
+                blocking = self.blocking(response)
+                if blocking is not None:
+                    try:
+                        response = await asyncio.get_running_loop().run_in_executor(None, blocking, message, False)
+                    except Exception as e:
+                        response = failed(message, e)
+                if response:
+                    writer.write(struct.pack("!H", len(response)) + response)
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def start(self, host: str, port: int) -> threading.Thread:
+        """
+        Serves queries from a daemon thread running its own event loop, next to
+        the API server.
+        """
+        import asyncio
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(host, port),), name="DnsResponder", daemon=True)
+        thread.start()
+        return thread
+
+
+class UdpProtocol:
+    """
+    asyncio datagram protocol answering the queries received over UDP.
+    """
+    def __init__(self, responder: Responder):
+        self.responder = responder
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        response = self.responder.answer(data, build=False)
+        blocking = self.responder.blocking(response)
+        if blocking is not None:
+            import asyncio
+            future = asyncio.get_running_loop().run_in_executor(None, blocking, data)
+            future.add_done_callback(functools.partial(self.send_result, data, addr))
+        elif response:
+            self.transport.sendto(response, addr)
+
+    def send_result(self, data: bytes, addr, future):
+        # Sends the response computed off the event loop
+        if future.cancelled():
+            return
+        try:
+            response = future.result()
+        except Exception as e:
+            response = failed(data, e)
+        if response:
+            self.transport.sendto(response, addr)
+
+    def error_received(self, exc):
+        pass
+
+    def connection_lost(self, exc):
+        pass
+
+
+def failed(message: bytes, e: Exception) -> bytes:
+    """
+    Returns the SERVFAIL response to a query that could not be answered.
+    """
+    cherrypy.log("Failed to answer a query: %r" % e)
+    return wire.error(message, wire.SERVFAIL)
+
+
+def recv_exactly(s: socket.socket, length: int) -> bytes:
+    data = b""
+    while len(data) < length:
+        chunk = s.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed")
+        data += chunk
+    return data
+
+
+# Responder of the zones of the API process, started when RESPONDER_PORT is set
+responder = Responder(zone_store, parse_address(config.RESPONDER_UPSTREAM))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authoritative DNS responder serving the zone files of a folder.")
+    parser.add_argument("--dir", default=config.FILES_PATH, help="folder of the zone files")
+    parser.add_argument("--host", default=config.RESPONDER_HOST)
+    parser.add_argument("--port", type=int, default=config.RESPONDER_PORT or 53)
+    parser.add_argument("--upstream", default=config.RESPONDER_UPSTREAM,
+                        help="host:port of the server answering for other names, e.g. CoreDNS")
+    parser.add_argument("--leader", help="keep the zones in sync with this DNS API, e.g. http://10.0.0.1:8082")
+    parser.add_argument("--interval", type=float, default=1, help="seconds between two syncs with the leader")
+    args = parser.parse_args()
+
+    import asyncio
+    cherrypy.log.screen = True
+    if args.leader:
+        # Mutations replicated from the leader are answered as soon as they are applied
+        from .replication import Follower
+        follower = Follower(args.leader, args.dir)
+        store = follower.store
+        threading.Thread(target=follower.run, args=(args.interval,), name="Follower", daemon=True).start()
+    else:
+        store = ZoneStore(args.dir)
+    try:
+        asyncio.run(Responder(store, parse_address(args.upstream)).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Store of the ETSI MEC 011 DNS rules. Rules are indexed by id and by  #
+# domain name, and every ACTIVE rule is served by one record of the    #
+# zone its domain name belongs to. Changing the state of a rule only   #
+# adds or discards that record, with a single zone serial increment.   #
+#                                                                      #
+# A rule change appends one line to a log next to the rules file, so   #
+# persisting it does not depend on the number of rules. The log is     #
+# folded into the rules file once it holds as many entries as rules.   #
+########################################################################
+import json
+import os
+import threading
+from contextlib import contextmanager, ExitStack
+
+from . import config
+from .locks import lock_manager
+from .models import DnsRule
+from .store import zone_store, ZoneStore, ZoneNotFound, fqdn
+from .utils import write_atomic
+
+# TTL of the records of the rules that do not set one
+DEFAULT_TTL = 300
+
+# Entries of the rule log that are never folded into the rules file before
+# the log holds as many entries as there are rules
+MIN_LOG_ENTRIES = 1000
+
+
+class RuleNotFound(LookupError):
+    """
+    Raised when an operation targets a DNS rule that does not exist.
+    """
+
+
+class RuleExists(Exception):
+    """
+    Raised when creating a DNS rule whose id is already in use.
+    """
+
+
+class RuleStore:
+    """
+    Keeps the DNS rules in memory, indexed by dnsRuleId and by domain name, and
+    persists them in a JSON file next to the zone files, and their changes in
+    a log (<path>.log) of JSON lines. Every change gets a sequence number when
+    the indexes are changed, and the log is replayed in that order, whatever
+    the order in which the lines were appended.
+
+    A rule change holds the locks of the zones whose records it changes, so
+    that changes of rules sharing a record are serialized, while changes of
+    rules of different zones run in parallel.
+    """
+    def __init__(self, store: ZoneStore, path: str):
+        """
+        :param store: Zone store holding the records of the rules
+        :type store: ZoneStore
+        :param path: Path of the file where the rules are persisted
+        :type path: str
+        """
+        self.store = store
+        self.path = path
+        self.log_path = path + ".log"
+        self._rules = {}
+        self._by_domain = {}
+        self._loaded = False
+        # Protects the indexes and the sequence numbers; only held while writing
+        # a file to fold the log into the rules file
+        self._lock = threading.Lock()
+        # Sequence number of the last change, and number of entries in the log
+        self._seq = 0
+        self._logged = 0
+        self._log_fd = None
+
+    @staticmethod
+    def _data(rule: DnsRule) -> dict:
+        data = rule.to_json()
+        data["appInstanceId"] = rule.appInstanceId
+        return data
+
+    def _load(self):
+        # Must be called holding self._lock
+        if self._loaded:
+            return
+        try:
+            with open(self.path, mode='r') as f:
+                for data in json.load(f):
+                    self._index(DnsRule.from_json(data, data.get("appInstanceId")))
+        except FileNotFoundError:
+            pass
+
+        # The first line of the log is the sequence number of the last change in
+        # the rules file; the entries up to it were folded into the file
+        base = 0
+        latest = {}
+        try:
+            with open(self.log_path, mode='r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn by a crash while appending
+                        break
+                    if "base" in entry:
+                        base = entry["base"]
+                        continue
+                    self._logged += 1
+                    dnsRuleId = entry["rule"]["dnsRuleId"] if "rule" in entry else entry["delete"]
+                    if entry["seq"] <= latest.get(dnsRuleId, base):
+                        continue
+                    latest[dnsRuleId] = entry["seq"]
+                    if dnsRuleId in self._rules:
+                        self._unindex(self._rules[dnsRuleId])
+                    if "rule" in entry:
+                        self._index(DnsRule.from_json(entry["rule"], entry["rule"].get("appInstanceId")))
+        except FileNotFoundError:
+            pass
+        self._seq = max([base] + list(latest.values()))
+        self._loaded = True
+
+    def _log(self, seq: int, rule: DnsRule = None, dnsRuleId: str = None):
+        """
+        Appends a change to the rule log: the rule as it is after change seq, or
+        its deletion if rule is None.
+        """
+        entry = dict(seq=seq, rule=self._data(rule)) if rule is not None else dict(seq=seq, delete=dnsRuleId)
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._lock:
+            if self._log_fd is None:
+                self._log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            fd = self._log_fd
+            self._logged += 1
+            fold = self._logged >= max(MIN_LOG_ENTRIES, len(self._rules))
+        # A single write() on an O_APPEND descriptor, so entries never interleave
+        os.write(fd, line)
+        if fold:
+            self._fold()
+
+    def _fold(self):
+        # Writes every rule into the rules file and empties the log. Holding the
+        # lock, no change gets a sequence number meanwhile: the entries appended
+        # later with older ones are skipped by the base written into the log
+        with self._lock:
+            if self._logged < max(MIN_LOG_ENTRIES, len(self._rules)):
+                # Folded by another thread meanwhile
+                return
+            write_atomic(self.path, json.dumps([self._data(rule) for rule in self._rules.values()]))
+            os.ftruncate(self._log_fd, 0)
+            os.write(self._log_fd, (json.dumps(dict(base=self._seq)) + "\n").encode("utf-8"))
+            self._logged = 0
+
+    def _index(self, rule: DnsRule):
+        self._rules[rule.dnsRuleId] = rule
+        self._by_domain.setdefault(fqdn(rule.domainName), {})[rule.dnsRuleId] = rule
+
+    def _unindex(self, rule: DnsRule):
+        del self._rules[rule.dnsRuleId]
+        rules = self._by_domain[fqdn(rule.domainName)]
+        del rules[rule.dnsRuleId]
+        if not rules:
+            del self._by_domain[fqdn(rule.domainName)]
+
+    @staticmethod
+    def _key(rule: DnsRule) -> tuple:
+        # Identifies the record of a rule as the zone does: owner, type and data
+        record = rule.record()
+        return fqdn(record.name), record.type, record.ip
+
+    def _shared(self, rule: DnsRule) -> bool:
+        # Whether another ACTIVE rule is served by the same record, whatever its TTL
+        key = self._key(rule)
+        with self._lock:
+            return any(other is not rule and other.active and self._key(other) == key
+                       for other in self._by_domain.get(fqdn(rule.domainName), {}).values())
+
+    @contextmanager
+    def _zones_locked(self, *zoneNames):
+        # Holds the locks of zones, always taken in the same order
+        with ExitStack() as stack:
+            for zoneName in sorted(set(zoneName for zoneName in zoneNames if zoneName is not None)):
+                stack.enter_context(lock_manager.zone(zoneName))
+            yield
+
+    def zone_of(self, domainName: str) -> str:
+        """
+        Returns the name of the zone a domain name belongs to: the longest zone
+        name that is a suffix of the domain name.
+        :param domainName: Domain name
+        :type domainName: str
+        :rtype: str
+        :raises ZoneNotFound: if no zone holds the domain name
+        """
+        labels = domainName.rstrip('.').split('.')
+        for i in range(len(labels)):
+            zoneName = '.'.join(labels[i:])
+            if self.store.exists(zoneName):
+                return zoneName
+        raise ZoneNotFound(domainName)
+
+    def _served_zone(self, rule: DnsRule) -> str:
+        # Zone holding the record of an ACTIVE rule, None if the zone was deleted
+        if not rule.active:
+            return None
+        try:
+            return self.zone_of(rule.domainName)
+        except ZoneNotFound:
+            return None
+
+    def get(self, dnsRuleId: str) -> DnsRule:
+        """
+        :raises RuleNotFound: if there is no rule with that id
+        """
+        with self._lock:
+            self._load()
+            rule = self._rules.get(dnsRuleId)
+        if rule is None:
+            raise RuleNotFound(dnsRuleId)
+        return rule
+
+    def by_domain(self, domainName: str) -> list:
+        """
+        Returns the rules resolving a domain name.
+        """
+        with self._lock:
+            self._load()
+            return list(self._by_domain.get(fqdn(domainName), {}).values())
+
+    def rules(self, appInstanceId: str = None) -> list:
+        """
+        Returns the rules of a MEC application instance, or every rule.
+        """
+        with self._lock:
+            self._load()
+            return [rule for rule in self._rules.values()
+                    if appInstanceId is None or rule.appInstanceId == appInstanceId]
+
+    def create(self, rule: DnsRule) -> DnsRule:
+        """
+        Adds a rule, and its record if the rule is ACTIVE.
+        :raises RuleExists: if the rule id is already in use
+        :raises ZoneNotFound: if no zone holds the domain name of the rule
+        """
+        zoneName = self.zone_of(rule.domainName)
+        with self._zones_locked(zoneName):
+            with self._lock:
+                self._load()
+                if rule.dnsRuleId in self._rules:
+                    raise RuleExists(rule.dnsRuleId)
+                self._index(rule)
+                self._seq += 1
+                seq = self._seq
+            try:
+                if rule.active:
+                    self.store.apply(zoneName, [("add", rule.record())])
+            except BaseException:
+                with self._lock:
+                    self._unindex(rule)
+                raise
+        self._log(seq, rule)
+        return rule
+
+    def update(self, dnsRuleId: str, rule: DnsRule) -> DnsRule:
+        """
+        Replaces a rule. When only the state changes, the record of the rule is
+        added or discarded; otherwise the old record is replaced by the new one.
+        The old record is left alone if its zone was deleted.
+        :raises RuleNotFound: if there is no rule with that id
+        :raises ZoneNotFound: if the rule is ACTIVE and no zone holds its domain name
+        """
+        while True:
+            old = self.get(dnsRuleId)
+            old_zone = self._served_zone(old)
+            new_zone = self.zone_of(rule.domainName) if rule.active else None
+            with self._zones_locked(old_zone, new_zone):
+                with self._lock:
+                    if self._rules.get(dnsRuleId) is not old:
+                        # Replaced meanwhile, its record may be in another zone
+                        continue
+                    self._unindex(old)
+                    self._index(rule)
+                    self._seq += 1
+                    seq = self._seq
+                try:
+                    # The new record first, so a failure leaves the zones untouched
+                    if rule.active and not (old.active and str(old.record()) == str(rule.record())):
+                        self.store.apply(new_zone, [("add", rule.record())])
+                    # Same owner and address as the new record: replaced by it already
+                    if old_zone is not None and not self._shared(old):
+                        try:
+                            self.store.apply(old_zone, [("discard", old.record())])
+                        except ZoneNotFound:
+                            pass
+                except BaseException:
+                    with self._lock:
+                        self._unindex(rule)
+                        self._index(old)
+                    raise
+            break
+        self._log(seq, rule)
+        return rule
+
+    def delete(self, dnsRuleId: str):
+        """
+        Deletes a rule, and its record if the rule is ACTIVE and no other rule
+        is served by that record.
+        :raises RuleNotFound: if there is no rule with that id
+        """
+        while True:
+            rule = self.get(dnsRuleId)
+            zoneName = self._served_zone(rule)
+            with self._zones_locked(zoneName):
+                with self._lock:
+                    if self._rules.get(dnsRuleId) is not rule:
+                        continue
+                    self._unindex(rule)
+                    self._seq += 1
+                    seq = self._seq
+                try:
+                    if zoneName is not None and not self._shared(rule):
+                        self.store.apply(zoneName, [("discard", rule.record())])
+                except ZoneNotFound:
+                    # The zone was deleted together with the records of its rules
+                    pass
+                except BaseException:
+                    with self._lock:
+                        self._index(rule)
+                    raise
+            break
+        self._log(seq, dnsRuleId=dnsRuleId)
+
+
+# Rules shared by every controller of the process
+rule_store = RuleStore(zone_store, os.path.join(config.FILES_PATH, "dns_rules.json"))
@@ -332,4 +332,36 @@ dns_rule_put_schema = {
         {"required": ["state"]}
     ],
     "additionalProperties": False,
-}
\ No newline at end of file
+}
+
+dns_record_operation_schema = {
+    "type": "object",
+    "properties": {
+        "action": {
+            "enum": [
+                "add",
+                "delete"
+                ]
+        },
+        "name": {"type": "string", "minLength": 1},
+        "ip": {"type": "string"},
+        "ttl": {"type": ["string", "integer"], "pattern": "^[0-9]+$", "minimum": 0}
+    },
+    "required": ["action", "name"],
+    "if": {"properties": {"action": {"const": "add"}}},
+    "then": {"required": ["ip", "ttl"]},
+    "additionalProperties": False,
+}
+
+dns_record_batch_schema = {
+    "type": "object",
+    "properties": {
+        "operations": {
+            "type": "array",
+            "items": dns_record_operation_schema,
+            "minItems": 1
+        }
+    },
+    "required": ["operations"],
+    "additionalProperties": False,
+}
@@ -0,0 +1,104 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# JSON serialization of the responses. orjson is used when it is       #
+# installed, the json module of the standard library otherwise. Model  #
+# objects are encoded by the encoder registered for their type, looked #
+# up once per type, instead of probing every object for to_json.       #
+########################################################################
+import json
+import threading
+from enum import Enum
+
+from . import config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Serializer:
+    """
+    Encodes response bodies to JSON bytes with the fastest backend available.
+    """
+    def __init__(self, backend: str = "auto"):
+        """
+        :param backend: "orjson", "json" or "auto" (orjson if it is installed)
+        :type backend: str
+        """
+        if backend == "auto":
+            backend = "orjson" if orjson is not None else "json"
+        if backend == "orjson" and orjson is None:
+            raise ValueError("The orjson JSON backend is not installed")
+        if backend not in ("orjson", "json"):
+            raise ValueError("Invalid JSON backend: %s" % backend)
+        self.backend = backend
+        self._encoders = {}
+        # Encoder of every type met so far, including subclasses of registered types
+        self._resolved = {}
+        self._lock = threading.Lock()
+        self._stdlib = json.JSONEncoder(default=self.default)
+
+    def register(self, cls: type, encoder):
+        """
+        Registers the function encoding the objects of a type (and of its
+        subclasses) into JSON-serializable values.
+        :param cls: Type of the objects
+        :type cls: type
+        :param encoder: function(obj) returning a dict, list or scalar
+        """
+        with self._lock:
+            self._encoders[cls] = encoder
+            self._resolved = dict(self._encoders)
+
+    def _resolve(self, cls: type):
+        for base in cls.__mro__:
+            encoder = self._encoders.get(base)
+            if encoder is not None:
+                return encoder
+        if issubclass(cls, Enum):
+            return lambda obj: obj.name
+        if hasattr(cls, "to_json"):
+            # Types that were not registered keep working through their to_json method
+            return cls.to_json
+        return None
+
+    def default(self, obj):
+        """
+        Encodes an object the backend cannot serialize natively.
+        :raises TypeError: if no encoder handles the type of the object
+        """
+        encoder = self._resolved.get(type(obj))
+        if encoder is None:
+            encoder = self._resolve(type(obj))
+            if encoder is None:
+                raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+            self._resolved[type(obj)] = encoder
+        return encoder(obj)
+
+    def dumps(self, obj) -> bytes:
+        """
+        Encodes an object into JSON.
+        :rtype: bytes
+        """
+        if self.backend == "orjson":
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return self._stdlib.encode(obj).encode("utf-8")
+
+
+# Serializer shared by every controller of the process
+serializer = Serializer(config.JSON_BACKEND)
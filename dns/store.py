@@ -0,0 +1,1095 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Process-wide zone store. Zones are parsed once and kept in memory,   #
+# indexed by owner name and record type, so that record mutations are  #
+# dictionary operations. Zone files are rendered from the store        #
+# instead of being edited as text.                                     #
+########################################################################
+from __future__ import annotations
+import gc
+import mmap
+import os
+import shutil
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+from . import config
+from .models import SOA, A_rec, record_from_str
+from .records import CompactA, RecordTable, compact
+from .utils import write_atomic
+from .locks import lock_manager
+from .journal import Journal, FSYNC_NONE
+from .changelog import ChangeLog, CREATE, UPDATE, DROP, encode_changes
+from .metrics import metrics
+from . import zonefile
+
+
+class ZoneNotFound(LookupError):
+    """
+    Raised when an operation targets a zone that does not exist.
+    """
+
+
+class ZoneExists(Exception):
+    """
+    Raised when creating a zone that already exists.
+    """
+
+
+class BatchRejected(Exception):
+    """
+    Raised when operations of a batch cannot be applied. No operation of the
+    batch is applied in that case.
+    """
+    def __init__(self, failures: list):
+        """
+        :param failures: (index, detail) of every operation that cannot be applied
+        :type failures: list
+        """
+        Exception.__init__(self, "; ".join(detail for _, detail in failures))
+        self.failures = failures
+
+
+def fqdn(name: str) -> str:
+    """
+    Returns the key under which the records of a name are indexed: the fully
+    qualified name, in lower case and without the trailing dot.
+    :param name: owner name
+    :type name: str
+    :rtype: str
+    """
+    return name.rstrip('.').lower()
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Returns the shard holding the records of a name, by a hash of its key that
+    does not change across processes.
+    :param key: owner name, as returned by fqdn()
+    :type key: str
+    :param count: number of shards of the zone
+    :type count: int
+    :rtype: int
+    """
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def find_line(mm: mmap.mmap, record: A_rec):
+    """
+    Finds the line of a record in a zone file written by the store, even if it
+    was padded by a previous in-place patch.
+    :return: (start, end) offsets of the line without its newline, or None
+    """
+    prefix = ("\n%s. " % record.name).encode("ascii")
+    data = (record.type.encode("ascii"), record.ip.encode("ascii"))
+    if mm[:len(prefix) - 1] == prefix[1:]:
+        # The first line of a shard file is a record too
+        start = 0
+    else:
+        # The line starts after the newline the prefix begins with
+        start = mm.find(prefix)
+        if start != -1:
+            start += 1
+    while start != -1:
+        end = mm.find(b"\n", start)
+        if end == -1:
+            end = len(mm)
+        tokens = mm[start:end].split()
+        if len(tokens) == 5 and tokens[2] == b"IN" and (tokens[3], tokens[4]) == data:
+            return start, end
+        start = mm.find(prefix, end)
+        if start != -1:
+            start += 1
+    return None
+
+
+def padded_line(record: A_rec, width: int):
+    """
+    Renders a record line to a given width, without its newline, padding it
+    with blanks after the TTL.
+    :return: line as bytes, or None if the record does not fit
+    """
+    line = str(record).rstrip("\n").encode("ascii")
+    if len(line) > width:
+        return None
+    owner, ttl, rest = line.split(b" ", 2)
+    return b"%s %s%s %s" % (owner, ttl, b" " * (width - len(line)), rest)
+
+
+class Zone:
+    """
+    In-memory representation of a zone file. It holds the SOA record and every
+    other record of the zone, indexed as:
+        fully qualified owner name -> record type -> record data -> record
+    so that finding or removing the records of a name only touches that name.
+    Insertion order is preserved, so rendering a zone is deterministic.
+    A compact zone holds its A and AAAA records as CompactA objects, indexed by
+    their packed address. A zone with a record table keeps them in the rows of
+    a RecordTable instead, the index holding their row numbers; records() turns
+    what the index holds into records.
+    """
+    def __init__(self, soa: SOA, compact: bool = False, table: bool = False):
+        """
+        :param soa: SOA record of the zone
+        :type soa: SOA
+        :param compact: Hold the records as CompactA objects
+        :type compact: bool
+        :param table: Hold the A and AAAA records in a RecordTable
+        :type table: bool
+        """
+        self.soa = soa
+        self.compact = compact
+        self.table = RecordTable() if table else None
+        self.records = {}
+        self.count = 0
+        # Distinguishes zones re-created with the same name and serial
+        self.generation = 0
+        # Serial of the last commit, the base of the next replication delta
+        self.committed_serial = soa.serial
+        # When the zone is stored in shards (see shard()): the owner names of
+        # every shard, and the shards changed since they were last written,
+        # None meaning all of them
+        self.shards = None
+        self.stale = None
+
+    @property
+    def name(self) -> str:
+        return self.soa.name
+
+    def add(self, record: A_rec) -> bool:
+        """
+        Adds a record to the zone. A record with the same owner, type and data
+        replaces the previous one (e.g. to change its TTL).
+        :param record: record to be added
+        :type record: A_rec
+        :return: True if the record is new, False if it replaced an existing one
+        :rtype: bool
+        """
+        record, key, data = self._slot(record)
+        types = self.records.get(key)
+        if types is None:
+            types = self.records[key] = {}
+            if self.shards is not None:
+                self.shards[shard_of(key, len(self.shards))][key] = None
+        if self.stale is not None:
+            self.stale.add(shard_of(key, len(self.shards)))
+        rrset = types.setdefault(record.type, {})
+        held = rrset.get(data)
+        if type(data) is bytes and self.table is not None:
+            if held is None:
+                rrset[data] = self.table.add(record)
+            else:
+                self.table.replace(held, record)
+        else:
+            rrset[data] = record
+        if held is None:
+            self.count += 1
+        return held is None
+
+    def find(self, name: str, rtype: str = None) -> list:
+        """
+        Returns the records owned by a name.
+        :param name: owner name of the records
+        :type name: str
+        :param rtype: record type, every type if omitted
+        :type rtype: str
+        :return: matching records
+        :rtype: list
+        """
+        types = self.records.get(fqdn(name))
+        if types is None:
+            return []
+        if rtype is not None:
+            return self.held(types.get(rtype, {}))
+        return [record for rrset in types.values() for record in self.held(rrset)]
+
+    def remove(self, name: str, rtype: str = None) -> list:
+        """
+        Removes the records owned by a name. Only the slots of that name are
+        touched, so the cost does not depend on the size of the zone.
+        :param name: owner name of the records
+        :type name: str
+        :param rtype: record type, every type if omitted
+        :type rtype: str
+        :return: removed records
+        :rtype: list
+        """
+        key = fqdn(name)
+        types = self.records.get(key)
+        if types is None:
+            return []
+        rrsets = list(types.values()) if rtype is None else [types.get(rtype, {})]
+        removed = [record for rrset in rrsets for record in self.held(rrset)]
+        if self.table is not None:
+            # Row by row, reading each row again as freeing one may move another
+            for rrset in rrsets:
+                for data in list(rrset):
+                    if type(rrset[data]) is int:
+                        self._free(rrset.pop(data))
+        if rtype is None:
+            self._unindex(key)
+        else:
+            types.pop(rtype, None)
+            if not types:
+                self._unindex(key)
+            elif removed and self.stale is not None:
+                self.stale.add(shard_of(key, len(self.shards)))
+        self.count -= len(removed)
+        return removed
+
+    def discard(self, record: A_rec) -> bool:
+        """
+        Removes a single record, matched by owner, type and data.
+        :param record: record to be removed
+        :type record: A_rec
+        :return: False if the zone did not hold the record
+        :rtype: bool
+        """
+        record, key, data = self._slot(record)
+        types = self.records.get(key)
+        if types is None or data not in types.get(record.type, {}):
+            return False
+        rrset = types[record.type]
+        held = rrset.pop(data)
+        if type(held) is int:
+            self._free(held)
+        if not rrset:
+            del types[record.type]
+        if not types:
+            self._unindex(key)
+        elif self.stale is not None:
+            self.stale.add(shard_of(key, len(self.shards)))
+        self.count -= 1
+        return True
+
+    def held(self, rrset: dict) -> list:
+        """
+        Returns the records of an rrset of the index, the rows of the record
+        table turned into records.
+        :param rrset: record data -> record or row
+        :type rrset: dict
+        :rtype: list
+        """
+        if self.table is None:
+            return list(rrset.values())
+        table = self.table
+        return [table.record(held) if type(held) is int else held for held in rrset.values()]
+
+    def _slot(self, record: A_rec) -> tuple:
+        # Returns the record as the zone holds it, and the owner and data keys
+        # it is indexed by
+        if self.table is not None and isinstance(record, (A_rec, CompactA)):
+            try:
+                _, address, _ = RecordTable.pack(record)
+            except (ValueError, OSError):
+                # Kept as an object, as compact() does
+                return record, fqdn(record.name), record.ip
+            return record, sys.intern(fqdn(record.name)), address
+        if self.compact:
+            record = compact(record)
+            if isinstance(record, CompactA):
+                # The owner name is interned, so it is shared with its key when
+                # already in lower case; the packed address is shorter than its text
+                return record, sys.intern(fqdn(record.name)), record.address
+        return record, fqdn(record.name), record.ip
+
+    def _free(self, row: int):
+        # Removes a row of the record table, pointing the index of the record
+        # moved into it at its new row
+        moved = self.table.remove(row)
+        if moved is not None:
+            table = self.table
+            types = self.records[fqdn(table.names[row])]
+            types[table.type(row)][table.address(row)] = row
+
+    def _unindex(self, key: str):
+        # Removes a name that owns no record anymore
+        del self.records[key]
+        if self.shards is not None:
+            shard = shard_of(key, len(self.shards))
+            del self.shards[shard][key]
+            if self.stale is not None:
+                self.stale.add(shard)
+
+    def shard(self, count: int):
+        """
+        Indexes the owner names of the zone by shard, so that the records of a
+        shard can be rendered without going through the whole zone. Every shard
+        is stale until stale is reset by the caller.
+        :param count: number of shards
+        :type count: int
+        """
+        self.shards = [{} for _ in range(count)]
+        for key in self.records:
+            self.shards[shard_of(key, count)][key] = None
+        self.stale = None
+
+    def __contains__(self, name: str) -> bool:
+        return fqdn(name) in self.records
+
+    def __iter__(self):
+        for types in self.records.values():
+            for rrset in types.values():
+                yield from self.held(rrset)
+
+    def __len__(self):
+        return self.count
+
+    def render(self) -> str:
+        """
+        Returns the zone in master file format, SOA record first.
+        :return: zone file content
+        :rtype: str
+        """
+        return str(self.soa) + ''.join(str(record) for record in self)
+
+    def render_shard(self, index: int) -> str:
+        """
+        Returns the records of a shard in master file format.
+        :param index: Shard number
+        :type index: int
+        :rtype: str
+        """
+        records = self.records
+        return ''.join(str(record) for key in self.shards[index]
+                       for rrset in records[key].values() for record in self.held(rrset))
+
+    def render_includes(self, directory: str) -> str:
+        """
+        Returns the zone file of a zone stored in shards: its SOA record and the
+        $INCLUDE directive of every shard file.
+        :param directory: Folder of the shard files, relative to the zone file
+        :type directory: str
+        :rtype: str
+        """
+        return str(self.soa) + ''.join("$INCLUDE %s/%d.db\n" % (directory, i) for i in range(len(self.shards)))
+
+    @staticmethod
+    def from_lines(lines, origin: str = None, compact: bool = False, table: bool = False) -> Zone:
+        """
+        Creates a Zone object from the lines of a zone file, streamed through the
+        master file parser, so zone files written by other tools can be loaded too.
+        :param lines: lines of the zone file, SOA record first
+        :param origin: Initial origin of relative names, e.g. the zone name
+        :type origin: str
+        :param compact: Hold the records as CompactA objects
+        :type compact: bool
+        :param table: Hold the A and AAAA records in a RecordTable
+        :type table: bool
+        :return: Zone object
+        :rtype: Zone
+        :raises StopIteration: if the zone file is empty
+        :raises ZoneFileError: if the zone file is malformed
+        """
+        records = zonefile.parse(lines, origin, path=getattr(lines, "name", None))
+        soa = next(records)
+        if not isinstance(soa, SOA):
+            raise zonefile.ZoneFileError("The first record of a zone must be its SOA record",
+                                         getattr(lines, "name", None))
+        zone = Zone(soa, compact, table)
+        # Loading allocates millions of objects that all survive, which would
+        # only trigger useless collections of the youngest generations
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for record in records:
+                zone.add(record)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return zone
+
+
+def apply_changes(zone: Zone, changes: list):
+    """
+    Applies encoded changes (journal entries, replication deltas) to a zone.
+    :param zone: zone to be changed
+    :type zone: Zone
+    :param changes: ["add", record line], ["discard", record line] and ["delete", name, type] lists
+    :type changes: list
+    """
+    for change in changes:
+        if change[0] == "add":
+            zone.add(record_from_str(change[1]))
+        elif change[0] == "discard":
+            zone.discard(record_from_str(change[1]))
+        else:
+            zone.remove(change[1], change[2])
+
+
+class ZoneStore:
+    """
+    Keeps every zone managed by the service in memory. Zones that already exist
+    on disk are loaded the first time they are accessed.
+
+    Every access to a zone is serialized by the lock of that zone, taken from
+    the lock manager, so operations on different zones run in parallel.
+
+    In coalescing mode a mutation only marks its zone as dirty; dirty zones are
+    written by flush(), which is called periodically by a background flusher or
+    explicitly by callers that need the zone file on disk before answering.
+
+    With a journal, mutations are also deferred, but every mutation is first
+    appended to the zone journal. Flushing a zone compacts its journal, and the
+    journal tail is replayed when a zone is loaded.
+
+    With a change log, every commit is also recorded there for the followers.
+
+    With shards, the records of a zone are split by a hash of their owner name
+    into that many files of the <zone>.d folder, included by the zone file,
+    which then only holds the SOA record. Writing a zone only rewrites the
+    zone file and the shards changed since the previous write.
+    """
+    def __init__(self, files_path: str, coalesce: bool = False, journal: Journal = None,
+                 changelog: ChangeLog = None, shards: int = 0, compact: bool = False, table: bool = False):
+        """
+        :param files_path: Folder where the zone files are written
+        :type files_path: str
+        :param coalesce: Defer zone file writes until the next flush
+        :type coalesce: bool
+        :param journal: Write-ahead journal of the zone mutations
+        :type journal: Journal
+        :param changelog: Change log read by the replication followers
+        :type changelog: ChangeLog
+        :param shards: Shard files of every zone, 0 to write every zone as a single file
+        :type shards: int
+        :param compact: Hold the records of the zones as CompactA objects
+        :type compact: bool
+        :param table: Hold the A and AAAA records of the zones in record tables
+        :type table: bool
+        """
+        self.files_path = files_path
+        self.coalesce = coalesce or journal is not None
+        self.journal = journal
+        self.changelog = changelog
+        self.shards = shards
+        self.compact = compact
+        self.table = table
+        self._zones = {}
+        self._dirty = set()
+        # Protects self._zones and self._dirty, never held while doing I/O
+        self._lock = threading.Lock()
+        self._generation = 0
+        # Incremented every time a zone is created or deleted
+        self.version = 0
+        self.listeners = []
+
+    def zone_path(self, zoneName: str) -> str:
+        return os.path.join(self.files_path, "%s.db" % zoneName)
+
+    def shard_path(self, zoneName: str) -> str:
+        # Folder of the shard files, not a zone file itself so names() ignores it
+        return os.path.join(self.files_path, "%s.d" % zoneName)
+
+    def _sharded_on_disk(self, zoneName: str) -> bool:
+        # Whether the zone file was written with the current number of shards
+        try:
+            return sum(1 for name in os.listdir(self.shard_path(zoneName)) if name.endswith(".db")) == self.shards
+        except FileNotFoundError:
+            return False
+
+    def _get(self, zoneName: str) -> Zone:
+        # Must be called holding the zone lock
+        zone = self._zones.get(zoneName)
+        if zone is None:
+            try:
+                with open(self.zone_path(zoneName), mode='r') as f:
+                    zone = Zone.from_lines(f, zoneName, self.compact, self.table)
+                    metrics.file_io(zoneName, read=os.fstat(f.fileno()).st_size)
+            except (FileNotFoundError, StopIteration):
+                raise ZoneNotFound(zoneName)
+            self._install(zoneName, zone)
+        return zone
+
+    def _install(self, zoneName: str, zone: Zone):
+        # Must be called holding the zone lock, with a zone just read from its zone file
+        if self.shards:
+            zone.shard(self.shards)
+            if self._sharded_on_disk(zoneName):
+                # Only the shards changed by the journal tail below must be rewritten
+                zone.stale = set()
+        replayed = self._replay(zone)
+        zone.committed_serial = zone.soa.serial
+        with self._lock:
+            self._generation += 1
+            zone.generation = self._generation
+            self._zones[zoneName] = zone
+            if replayed:
+                self._dirty.add(zoneName)
+
+    def preload(self, zoneName: str, zone: Zone) -> bool:
+        """
+        Holds in memory a zone read from its zone file elsewhere (e.g. by the warm
+        start), unless the zone was loaded or deleted in the meantime.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param zone: Zone read from the zone file
+        :type zone: Zone
+        :return: True if the zone was installed
+        :rtype: bool
+        """
+        with lock_manager.zone(zoneName):
+            if zoneName in self._zones or not os.path.exists(self.zone_path(zoneName)):
+                return False
+            self._install(zoneName, zone)
+            return True
+
+    def _replay(self, zone: Zone) -> int:
+        # Applies the journal tail of a zone just loaded from its zone file
+        if self.journal is None:
+            return 0
+        replayed = 0
+        for entry in self.journal.replay(zone.name):
+            apply_changes(zone, entry["changes"])
+            zone.soa.serial = entry["serial"]
+            replayed += 1
+        return replayed
+
+    def recover(self) -> list:
+        """
+        Replays every journal tail left by a previous run and compacts it into the
+        zone file.
+        :return: names of the recovered zones
+        :rtype: list
+        """
+        if self.journal is None:
+            return []
+        recovered = []
+        for zoneName in self.journal.tails():
+            try:
+                self.get(zoneName)
+                recovered.append(zoneName)
+            except ZoneNotFound:
+                # Journal of a zone whose zone file was deleted
+                self.journal.remove(zoneName)
+        self.flush()
+        return recovered
+
+    @contextmanager
+    def locked(self, zoneName: str):
+        """
+        Context manager holding the lock of a zone and yielding the zone.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :raises ZoneNotFound: if the zone does not exist
+        """
+        with lock_manager.zone(zoneName):
+            yield self._get(zoneName)
+
+    def get(self, zoneName: str) -> Zone:
+        """
+        Returns a zone, loading it from its zone file if it is not in memory yet.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :return: Zone object
+        :rtype: Zone
+        :raises ZoneNotFound: if the zone does not exist
+        """
+        zone = self._zones.get(zoneName)
+        if zone is not None:
+            return zone
+        with self.locked(zoneName) as zone:
+            return zone
+
+    def loaded(self, zoneName: str):
+        """
+        Returns a zone if it is held in memory, without reading its zone file.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :rtype: Zone or None
+        """
+        return self._zones.get(zoneName)
+
+    def exists(self, zoneName: str) -> bool:
+        return zoneName in self._zones or os.path.exists(self.zone_path(zoneName))
+
+    def zones(self) -> list:
+        """
+        Returns the names of the zones held in memory.
+        """
+        return list(self._zones)
+
+    def record_counts(self) -> dict:
+        """
+        Returns the number of records of every zone held in memory, by zone name.
+        Zones not loaded yet are not read from disk.
+        :rtype: dict
+        """
+        return {name: len(zone) for name, zone in list(self._zones.items())}
+
+    def names(self) -> list:
+        """
+        Returns the sorted names of every zone, including the ones that were not
+        loaded from their zone file yet.
+        :rtype: list
+        """
+        names = set(self._zones)
+        for entry in os.scandir(self.files_path):
+            if entry.name.endswith(".db") and entry.is_file():
+                names.add(entry.name[:-len(".db")])
+        return sorted(names)
+
+    def subscribe(self, listener):
+        """
+        Registers a function called as listener(event, zoneName) after a zone is
+        created ("create"), mutated ("update") or deleted ("drop"). It is called
+        holding the zone lock, so it must not block.
+        :param listener: function to be called
+        """
+        self.listeners.append(listener)
+
+    def notify(self, event: str, zoneName: str):
+        for listener in self.listeners:
+            listener(event, zoneName)
+
+    def create(self, soa: SOA) -> Zone:
+        """
+        Creates a new zone and writes its zone file.
+        :param soa: SOA record of the new zone
+        :type soa: SOA
+        :return: Zone object
+        :rtype: Zone
+        :raises ZoneExists: if the zone already exists
+        """
+        with lock_manager.zone(soa.name):
+            if self.exists(soa.name):
+                raise ZoneExists(soa.name)
+            zone = Zone(soa, self.compact, self.table)
+            if self.shards:
+                zone.shard(self.shards)
+            self.write(zone)
+            with self._lock:
+                self._generation += 1
+                zone.generation = self._generation
+                self._zones[soa.name] = zone
+                self.version += 1
+            if self.changelog is not None:
+                self.changelog.append(zone.name, CREATE, serial=soa.serial, soa=str(soa).rstrip("\n"))
+            self.notify("create", zone.name)
+        return zone
+
+    def drop(self, zoneName: str):
+        """
+        Removes a zone from memory and deletes its zone file.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :raises ZoneNotFound: if the zone does not exist
+        """
+        with lock_manager.zone(zoneName):
+            with self._lock:
+                self._zones.pop(zoneName, None)
+                self._dirty.discard(zoneName)
+            if self.journal is not None:
+                self.journal.remove(zoneName)
+            try:
+                os.remove(self.zone_path(zoneName))
+            except FileNotFoundError:
+                raise ZoneNotFound(zoneName)
+            shutil.rmtree(self.shard_path(zoneName), ignore_errors=True)
+            with self._lock:
+                self.version += 1
+            if self.changelog is not None:
+                self.changelog.append(zoneName, DROP)
+            self.notify("drop", zoneName)
+
+    def restore(self, zoneName: str, content: str):
+        """
+        Replaces the zone file of a zone, or creates it, with a copy received from
+        elsewhere (e.g. a replication snapshot). The zone is read from the new
+        file the next time it is accessed.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param content: Zone file content
+        :type content: str
+        """
+        with lock_manager.zone(zoneName):
+            existed = self.exists(zoneName)
+            write_atomic(self.zone_path(zoneName), content)
+            metrics.file_io(zoneName, written=len(content))
+            # The copy is a single file, split again the next time the zone is written
+            shutil.rmtree(self.shard_path(zoneName), ignore_errors=True)
+            with self._lock:
+                self._zones.pop(zoneName, None)
+                self._dirty.discard(zoneName)
+                if not existed:
+                    self.version += 1
+            if self.journal is not None:
+                self.journal.truncate(zoneName)
+            self.notify("update" if existed else "create", zoneName)
+
+    def add_record(self, zoneName: str, record: A_rec) -> Zone:
+        """
+        Adds a record to a zone, increments the zone serial and rewrites the zone file.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param record: Record to be added
+        :type record: A_rec
+        :return: updated zone
+        :rtype: Zone
+        """
+        with self.locked(zoneName) as zone:
+            zone.add(record)
+            zone.soa.update()
+            seq = self.commit(zone, [("add", record)])
+        self.wait_durable(zoneName, seq)
+        return zone
+
+    def delete_records(self, zoneName: str, name: str, rtype: str = None) -> list:
+        """
+        Deletes the records owned by a name, increments the zone serial and
+        rewrites the zone file. Nothing is written if no record matches.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param name: owner name of the records
+        :type name: str
+        :param rtype: record type, every type if omitted
+        :type rtype: str
+        :return: removed records
+        :rtype: list
+        """
+        seq = None
+        with self.locked(zoneName) as zone:
+            removed = zone.remove(name, rtype)
+            if removed:
+                zone.soa.update()
+                seq = self.commit(zone, [("delete", name, rtype)])
+        self.wait_durable(zoneName, seq)
+        return removed
+
+    def update_record(self, zoneName: str, name: str, record: A_rec, ip: str = None) -> list:
+        """
+        Replaces the records of a name and type, or only the one holding some
+        data, with a record, incrementing the zone serial once. When a single
+        record is replaced and the zone files are written synchronously, the
+        record line and the SOA line are patched in place if their new text fits
+        (see patch()); otherwise the zone file is rewritten.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param name: owner name of the records
+        :type name: str
+        :param record: new record, of the type of the records replaced
+        :type record: A_rec
+        :param ip: data of the record to be replaced, every record of the name
+                   and type if omitted
+        :type ip: str
+        :return: replaced records, none if no record matched
+        :rtype: list
+        """
+        seq = None
+        with self.locked(zoneName) as zone:
+            if zone.compact:
+                # As the zone holds and renders it
+                record = compact(record)
+            records = zone.find(name, record.type)
+            replaced = [r for r in records if r.ip == ip] if ip is not None else records
+            if replaced:
+                # A single line changes unless the new data was held by another record
+                one_line = len(replaced) == 1 and (record.ip == replaced[0].ip or
+                                                   all(r.ip != record.ip for r in records))
+                old_soa = str(zone.soa)
+                for r in replaced:
+                    zone.discard(r)
+                zone.add(record)
+                zone.soa.update()
+                changes = [("discard", r) for r in replaced] + [("add", record)]
+                patched = one_line and not self.coalesce and self.patch(zone, old_soa, replaced[0], record)
+                seq = self.commit(zone, changes, written=patched)
+        self.wait_durable(zoneName, seq)
+        return replaced
+
+    def patch(self, zone: Zone, old_soa: str, old: A_rec, new: A_rec) -> bool:
+        """
+        Patches the line of a replaced record, then the SOA line, in place in the
+        memory-mapped zone file (the shard file of the record in a sharded zone,
+        whose small zone file is rewritten instead). CoreDNS only reloads a zone
+        file whose serial changed, so it never loads the record line without the
+        serial. A shorter line is padded with blanks between its TTL and class.
+        Must be called holding the zone lock, after the zone was updated.
+        :param zone: updated zone
+        :type zone: Zone
+        :param old_soa: SOA line the zone file holds
+        :type old_soa: str
+        :param old: replaced record
+        :type old: A_rec
+        :param new: new record
+        :type new: A_rec
+        :return: False if the zone file must be rewritten instead
+        :rtype: bool
+        """
+        if zone.shards is not None:
+            shard = shard_of(fqdn(new.name), len(zone.shards))
+            if zone.stale != {shard}:
+                return False
+            path = os.path.join(self.shard_path(zone.name), "%d.db" % shard)
+        else:
+            path = self.zone_path(zone.name)
+        soa = str(zone.soa).encode("ascii")
+        if zone.shards is None and len(soa) != len(old_soa):
+            return False
+        try:
+            with open(path, mode='r+b') as f, mmap.mmap(f.fileno(), 0) as mm:
+                if zone.shards is None and mm[:len(soa)] != old_soa.encode("ascii"):
+                    return False
+                span = find_line(mm, old)
+                if span is None:
+                    return False
+                start, end = span
+                line = padded_line(new, end - start)
+                if line is None:
+                    return False
+                mm[start:end] = line
+                if zone.shards is None:
+                    mm[:len(soa)] = soa
+                mm.flush()
+        except (OSError, ValueError):
+            # Missing or empty file
+            return False
+        written = len(line) + (len(soa) if zone.shards is None else 0)
+        if zone.shards is not None:
+            content = zone.render_includes(os.path.basename(self.shard_path(zone.name)))
+            write_atomic(self.zone_path(zone.name), content)
+            written += len(content)
+            zone.stale = set()
+        metrics.file_io(zone.name, written=written)
+        return True
+
+    def apply(self, zoneName: str, changes: list) -> str:
+        """
+        Applies a list of changes to a zone with a single serial increment and a
+        single commit.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param changes: ("add", record), ("discard", record) and ("delete", name, type) tuples
+        :type changes: list
+        :return: new zone serial
+        :rtype: str
+        """
+        with self.locked(zoneName) as zone:
+            for change in changes:
+                if change[0] == "add":
+                    zone.add(change[1])
+                elif change[0] == "discard":
+                    zone.discard(change[1])
+                else:
+                    zone.remove(change[1], change[2])
+            zone.soa.update()
+            serial = zone.soa.serial
+            seq = self.commit(zone, changes)
+        self.wait_durable(zoneName, seq)
+        return serial
+
+    @staticmethod
+    def _check_batch(zone: Zone, operations: list) -> list:
+        # Dry run of a batch, so that a failing operation leaves the zone untouched
+        added = set()
+        deleted = set()
+        failures = []
+        for index, (action, target) in enumerate(operations):
+            if action == "add":
+                added.add(fqdn(target.name))
+            elif fqdn(target) in added or (fqdn(target) not in deleted and zone.find(target, "A")):
+                added.discard(fqdn(target))
+                deleted.add(fqdn(target))
+            else:
+                failures.append((index, "Inexistent record name %s." % target))
+        return failures
+
+    def check_batch(self, zoneName: str, operations: list) -> list:
+        """
+        Tells which operations of a batch could not be applied to a zone, without
+        applying any of them.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param operations: ("add", record) and ("delete", owner name) tuples, in order
+        :type operations: list
+        :return: (index, detail) of every operation that cannot be applied
+        :rtype: list
+        """
+        with self.locked(zoneName) as zone:
+            return self._check_batch(zone, operations)
+
+    def apply_batch(self, zoneName: str, operations: list) -> tuple:
+        """
+        Applies a list of record operations to a zone as a whole: either every
+        operation is applied or none is. The zone serial is incremented once and
+        the zone file is written once.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param operations: ("add", record) and ("delete", owner name) tuples, in order
+        :type operations: list
+        :return: new zone serial and number of records added or removed by each operation
+        :rtype: tuple
+        :raises BatchRejected: if delete operations match no record
+        """
+        with self.locked(zoneName) as zone:
+            failures = self._check_batch(zone, operations)
+            if failures:
+                raise BatchRejected(failures)
+
+            results = []
+            changes = []
+            for action, target in operations:
+                if action == "add":
+                    results.append(int(zone.add(target)))
+                    changes.append(("add", target))
+                else:
+                    results.append(len(zone.remove(target, "A")))
+                    changes.append(("delete", target, "A"))
+
+            zone.soa.update()
+            serial = zone.soa.serial
+            seq = self.commit(zone, changes)
+        self.wait_durable(zoneName, seq)
+        return serial, results
+
+    def commit(self, zone: Zone, changes: list, written: bool = False) -> int:
+        """
+        Persists a mutated zone: writes the zone file right away, or marks the
+        zone as dirty in coalescing mode, after appending the changes to the
+        journal if there is one. Must be called holding the zone lock.
+        :param zone: mutated zone
+        :type zone: Zone
+        :param changes: ("add", record), ("discard", record) and ("delete", name, type) tuples
+        :type changes: list
+        :param written: the zone file already holds the changes (patched in place)
+        :type written: bool
+        :return: journal sequence number of the mutation, to be passed to wait_durable()
+        :rtype: int
+        """
+        seq = None
+        encoded = encode_changes(changes) if self.journal is not None or self.changelog is not None else None
+        if self.journal is not None:
+            seq = self.journal.append(zone.name, zone.soa.serial, encoded)
+        if self.changelog is not None:
+            self.changelog.append(zone.name, UPDATE, serial=zone.soa.serial,
+                                  fromSerial=zone.committed_serial, changes=encoded)
+        zone.committed_serial = zone.soa.serial
+        if self.coalesce:
+            with self._lock:
+                self._dirty.add(zone.name)
+        elif not written:
+            self.write(zone)
+        self.notify("update", zone.name)
+        return seq
+
+    def wait_durable(self, zoneName: str, seq: int):
+        """
+        Waits until a journaled mutation is on stable storage. Called after
+        releasing the zone lock, so concurrent mutations share a group commit.
+        :param zoneName: Name of the zone
+        :type zoneName: str
+        :param seq: sequence number returned by commit()
+        :type seq: int
+        """
+        if seq is not None:
+            self.journal.wait(zoneName, seq)
+
+    def flush(self, zoneName: str = None) -> list:
+        """
+        Writes the zone files of dirty zones.
+        :param zoneName: Name of the zone to be flushed, every dirty zone if omitted
+        :type zoneName: str
+        :return: names of the zones written
+        :rtype: list
+        """
+        with self._lock:
+            names = list(self._dirty) if zoneName is None else [zoneName]
+
+        written = []
+        for name in names:
+            with lock_manager.zone(name):
+                with self._lock:
+                    if name not in self._dirty:
+                        # Already flushed, or deleted, while waiting for the lock
+                        continue
+                    self._dirty.discard(name)
+                    zone = self._zones[name]
+                self.write(zone)
+                if self.journal is not None:
+                    # The zone file now holds every journaled mutation
+                    self.journal.truncate(name)
+                written.append(name)
+        return written
+
+    def write(self, zone: Zone):
+        """
+        Renders a zone into its zone file, atomically replacing the previous one.
+        Must be called holding the zone lock.
+        :param zone: zone to be written
+        :type zone: Zone
+        """
+        # The zone file must be durable before the journal is truncated
+        fsync = self.journal is not None and self.journal.fsync != FSYNC_NONE
+        if zone.shards is not None:
+            written = self.write_shards(zone, fsync)
+        else:
+            content = zone.render()
+            write_atomic(self.zone_path(zone.name), content, fsync=fsync)
+            written = len(content)
+            if os.path.isdir(self.shard_path(zone.name)):
+                # Written in shards by a previous run
+                shutil.rmtree(self.shard_path(zone.name), ignore_errors=True)
+        # Zone files are ASCII, so characters are bytes
+        metrics.file_io(zone.name, written=written)
+
+    def write_shards(self, zone: Zone, fsync: bool = False) -> int:
+        """
+        Writes the stale shard files of a zone, then its zone file, so that a
+        reader of the new zone file (and its new serial) finds every change.
+        Must be called holding the zone lock.
+        :param zone: zone to be written, indexed by shard
+        :type zone: Zone
+        :param fsync: Make sure the files are on stable storage before returning
+        :type fsync: bool
+        :return: bytes written
+        :rtype: int
+        """
+        folder = self.shard_path(zone.name)
+        count = len(zone.shards)
+        if zone.stale is None:
+            os.makedirs(folder, exist_ok=True)
+            stale = range(count)
+        else:
+            stale = sorted(zone.stale)
+        written = 0
+        for index in stale:
+            content = zone.render_shard(index)
+            write_atomic(os.path.join(folder, "%d.db" % index), content, fsync=fsync)
+            written += len(content)
+        content = zone.render_includes(os.path.basename(folder))
+        write_atomic(self.zone_path(zone.name), content, fsync=fsync)
+        if zone.stale is None:
+            # Files of a previous layout with more shards, no longer included
+            for name in os.listdir(folder):
+                if name.endswith(".db") and int(name[:-len(".db")]) >= count:
+                    os.remove(os.path.join(folder, name))
+        zone.stale = set()
+        return written + len(content)
+
+
+# Store shared by every controller of the process
+zone_store = ZoneStore(
+    config.FILES_PATH,
+    coalesce=config.FLUSH_MODE == "coalesce",
+    journal=Journal(config.FILES_PATH, config.JOURNAL_FSYNC) if config.JOURNAL else None,
+    changelog=ChangeLog(config.CHANGELOG_SIZE) if config.CHANGELOG_SIZE > 0 else None,
+    shards=config.ZONE_SHARDS,
+    compact=config.COMPACT_RECORDS,
+    table=config.RECORD_TABLE,
+)
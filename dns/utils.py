@@ -17,10 +17,52 @@ from json import JSONEncoder
 import json
 from enum import Enum
 
-from dns import models
+from dns.serializer import serializer
 import cherrypy
-import re
-import pprint as pp
+import importlib
+import os
+import shutil
+import sys
+import threading
+
+
+class LazyModule:
+    """
+    Stands for a module that is imported the first time one of its attributes
+    is read. Concurrent first reads import it once, the others wait for it.
+    """
+    def __init__(self, name: str):
+        """
+        :param name: Name of the module, e.g. "jsonschema"
+        :type name: str
+        """
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr: str):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attr)
+
+
+def lazy_import(name: str):
+    """
+    Returns a module that is only imported the first time one of its attributes
+    is accessed, so that heavy dependencies are not loaded before a request
+    needs them.
+
+    :param name: Name of the module, e.g. "jsonschema"
+    :type name: str
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
 
 
 # Decorator that receives a CLS to encode the json
@@ -29,6 +71,12 @@ def json_out(cls):
         def inner(*args, **kwargs):
             object_to_be_serialized = func(*args, **kwargs)
             cherrypy.response.headers["Content-Type"] = "application/json"
+            # Already serialized (e.g. cached) responses are sent as they are
+            if isinstance(object_to_be_serialized, bytes):
+                return object_to_be_serialized
+            # Model objects are encoded by the encoders registered in the serializer
+            if cls is NestedEncoder:
+                return serializer.dumps(object_to_be_serialized)
             return json.dumps(object_to_be_serialized, cls=cls).encode("utf-8")
 
         return inner
@@ -48,4 +96,42 @@ class NestedEncoder(JSONEncoder):
             return json.JSONEncoder.default(self, obj)
 
 
+def write_atomic(path: str, data: str, fsync: bool = False):
+    """
+    Writes a file through a temporary file in the same folder which is then
+    renamed over the destination, so a reader (e.g. CoreDNS) never sees a
+    partially written file, even if the process crashes while writing.
 
+    :param path: Path of the file to be written
+    :type path: str
+    :param data: Content of the file
+    :type data: str
+    :param fsync: Make sure the new file is on stable storage before returning
+    :type fsync: bool
+    """
+    tmp_path = "%s.%d.tmp" % (path, threading.get_ident())
+    try:
+        with open(tmp_path, mode='w') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            # Keep the permissions of the file being replaced
+            shutil.copymode(path, tmp_path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        if fsync:
+            # Persist the rename itself
+            dir_fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
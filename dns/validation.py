@@ -0,0 +1,121 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Registry of compiled JSON schema validators. jsonschema.validate     #
+# checks the schema and builds a new validator on every call; here     #
+# each schema of dns/schemas.py is checked and compiled once, on first #
+# use, and the validator instance is reused by every request.          #
+########################################################################
+import threading
+import time
+
+from . import schemas
+from .utils import lazy_import
+
+# Loaded by the first validation, not at startup
+jsonschema = lazy_import("jsonschema")
+
+
+class SchemaStats:
+    """
+    Number of validations of a schema and time spent in them.
+    """
+    def __init__(self):
+        self.validations = 0
+        self.failures = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def to_json(self):
+        return dict(
+            validations=self.validations,
+            failures=self.failures,
+            total_us=round(self.total * 1e6, 1),
+            mean_us=round(self.total * 1e6 / self.validations, 1) if self.validations else 0.0,
+            max_us=round(self.max * 1e6, 1),
+        )
+
+
+class ValidatorRegistry:
+    """
+    Compiled validators, indexed by the identity of their schema dict. The
+    schemas are static module-level dicts, so their identity never changes.
+    """
+    def __init__(self):
+        self._validators = {}
+        self._names = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        for name, schema in vars(schemas).items():
+            if name.endswith("_schema") and isinstance(schema, dict):
+                self._names[id(schema)] = name
+
+    def name(self, schema: dict) -> str:
+        return self._names.get(id(schema), "schema_%x" % id(schema))
+
+    def validator(self, schema: dict):
+        """
+        Returns the compiled validator of a schema, compiling it on first use.
+        :param schema: JSON schema
+        :type schema: dict
+        :raises jsonschema.exceptions.SchemaError: if the schema itself is invalid
+        """
+        entry = self._validators.get(id(schema))
+        if entry is None:
+            cls = jsonschema.validators.validator_for(schema)
+            cls.check_schema(schema)
+            with self._lock:
+                # Keep a reference to the schema so that its id is never reused
+                entry = self._validators.setdefault(id(schema), (cls(schema), schema))
+        return entry[0]
+
+    def validate(self, instance, schema: dict):
+        """
+        Validates an instance against a schema through its cached validator.
+        Raises the same error jsonschema.validate would.
+        :param instance: Instance to be validated (e.g. a request body)
+        :param schema: JSON schema
+        :type schema: dict
+        :raises jsonschema.exceptions.ValidationError: if the instance is invalid
+        """
+        validator = self.validator(schema)
+        start = time.perf_counter()
+        error = jsonschema.exceptions.best_match(validator.iter_errors(instance))
+        elapsed = time.perf_counter() - start
+
+        stats = self._stats.get(id(schema))
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(id(schema), SchemaStats())
+        # Statistics are best effort, updated without a lock
+        stats.validations += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+        if error is not None:
+            stats.failures += 1
+            raise error
+
+    def stats(self) -> dict:
+        """
+        Returns the validation statistics of every schema used so far, by schema name.
+        """
+        return {self.name(self._validators[key][1]): stats.to_json()
+                for key, stats in list(self._stats.items())}
+
+
+# Validators shared by every controller of the process
+validator_registry = ValidatorRegistry()
+validate = validator_registry.validate
@@ -0,0 +1,237 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Warm start. At startup the zone files already in FILES_PATH are      #
+# indexed and cross-checked against the zone blocks of the Corefile;   #
+# in "eager" mode they are also parsed in parallel by a process pool   #
+# and handed to the zone store, largest first, so the first requests   #
+# after a restart do not pay for reading the zones.                    #
+#                                                                      #
+# Workers send the records back as plain tuples: pickling the model    #
+# objects costs more than parsing the zone file again.                 #
+########################################################################
+from __future__ import annotations
+import gc
+import os
+import re
+import threading
+import time
+
+import cherrypy
+
+from . import zonefile
+from .config import LOAD_MODE, LOAD_WORKERS
+from .models import SOA, A_rec, AAAA_rec
+from .store import Zone, zone_store
+from .corefile import corefile
+from .metrics import metrics
+
+# Zone files referenced by a server block, e.g. "file /etc/coredns/zone0.db {"
+file_pattern = re.compile(r"^\s*file\s+\S*?([^/\s]+)\.db\b", re.MULTILINE)
+
+LOADING = "loading"
+READY = "ready"
+
+
+def read_rows(path: str, zoneName: str) -> tuple:
+    """
+    Parses a zone file in a worker process.
+    :param path: Path of the zone file
+    :type path: str
+    :param zoneName: Name of the zone, origin of its relative names
+    :type zoneName: str
+    :return: SOA record, records as (name, ip, ttl, type) tuples for A and AAAA
+             and as ResourceRecord objects for the other types, and bytes read
+    :rtype: tuple
+    """
+    with open(path, mode='r') as f:
+        records = zonefile.parse(f, zoneName, path=path)
+        try:
+            soa = next(records)
+        except StopIteration:
+            raise zonefile.ZoneFileError("Empty zone file", path)
+        if not isinstance(soa, SOA):
+            raise zonefile.ZoneFileError("The first record of a zone must be its SOA record", path)
+        rows = [(r.name, r.ip, r.ttl, r.type) if isinstance(r, A_rec) else r for r in records]
+        return soa, rows, os.fstat(f.fileno()).st_size
+
+
+def build_zone(soa: SOA, rows: list, compact: bool = False, table: bool = False) -> Zone:
+    """
+    Creates a Zone object from the result of read_rows.
+    """
+    zone = Zone(soa, compact, table)
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for row in rows:
+            if type(row) is tuple:
+                name, ip, ttl, rtype = row
+                row = (AAAA_rec if rtype == "AAAA" else A_rec)(name, ip, ttl)
+            zone.add(row)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return zone
+
+
+class WarmStart:
+    """
+    Startup phase of the zone store. It reports "loading" until every zone found
+    at startup is indexed and, in eager mode, held in memory; then "ready".
+    """
+    def __init__(self, store, corefile, mode: str = "eager", workers: int = 1):
+        """
+        :param store: Zone store to be warmed
+        :type store: ZoneStore
+        :param corefile: Corefile whose zone blocks are cross-checked
+        :type corefile: Corefile
+        :param mode: "eager" or "lazy"
+        :type mode: str
+        :param workers: Processes parsing the zone files in eager mode
+        :type workers: int
+        """
+        self.store = store
+        self.corefile = corefile
+        self.mode = mode
+        self.workers = workers
+        self.status = LOADING
+        self.zones = []
+        self.loaded = 0
+        self.records = 0
+        self.errors = {}
+        self.without_block = []
+        self.without_file = []
+        self.started = None
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def index(self) -> list:
+        """
+        Lists the zone files in the store folder and cross-checks them against the
+        Corefile: zone files without a server block are not served by CoreDNS,
+        and server blocks without a zone file make CoreDNS fail to load the zone.
+        :return: names of the zones, largest zone file first
+        :rtype: list
+        """
+        try:
+            self.corefile.load()
+            blocks = set(self.corefile.zones)
+            # Zone files of the root block (e.g. zone0.db) are not zones of the API
+            shared = set(file_pattern.findall(self.corefile.root or ""))
+        except (OSError, ValueError) as e:
+            self.errors["Corefile"] = str(e)
+            blocks, shared = set(), set()
+
+        sizes = {}
+        for entry in os.scandir(self.store.files_path):
+            if entry.name.endswith(".db") and entry.is_file():
+                name = entry.name[:-len(".db")]
+                if name not in shared:
+                    sizes[name] = entry.stat().st_size
+        self.without_block = sorted(set(sizes) - blocks) if blocks or shared else []
+        self.without_file = sorted(blocks - set(sizes))
+        return sorted(sizes, key=lambda name: -sizes[name])
+
+    def run(self):
+        """
+        Runs the startup phase. Errors of single zones are reported, not raised,
+        so that the other zones are still served.
+        """
+        self.started = time.time()
+        start = time.perf_counter()
+        self.zones = self.index()
+        if self.mode == "eager" and self.zones:
+            if self.workers > 1 and len(self.zones) > 1:
+                self._load_parallel()
+            else:
+                for zoneName in self.zones:
+                    self._load(zoneName)
+        self.duration = time.perf_counter() - start
+        self.status = READY
+
+        for zoneName in self.without_block:
+            cherrypy.log("Zone %s has no server block in the Corefile" % zoneName)
+        for zoneName in self.without_file:
+            cherrypy.log("Server block of zone %s has no zone file" % zoneName)
+        for zoneName, error in sorted(self.errors.items()):
+            cherrypy.log("Cannot load zone %s: %s" % (zoneName, error))
+        cherrypy.log("Warm start (%s): %d zones, %d loaded with %d records in %.2fs" % (
+            self.mode, len(self.zones), self.loaded, self.records, self.duration))
+
+    def _done(self, zoneName: str, zone: Zone):
+        with self._lock:
+            self.loaded += 1
+            self.records += len(zone)
+
+    def _load(self, zoneName: str):
+        try:
+            self._done(zoneName, self.store.get(zoneName))
+        except Exception as e:
+            self.errors[zoneName] = str(e) or type(e).__name__
+
+    def _load_parallel(self):
+        # Only imported when there are several zones and workers to load them
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        # Spawned workers, as the service may already be running threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(self.zones)), mp_context=context) as pool:
+            futures = {pool.submit(read_rows, self.store.zone_path(name), name): name for name in self.zones}
+            for future in as_completed(futures):
+                zoneName = futures[future]
+                try:
+                    soa, rows, size = future.result()
+                    zone = build_zone(soa, rows, self.store.compact, self.store.table)
+                except Exception as e:
+                    self.errors[zoneName] = str(e) or type(e).__name__
+                    continue
+                metrics.file_io(zoneName, read=size)
+                self.store.preload(zoneName, zone)
+                self._done(zoneName, zone)
+
+    def start(self) -> threading.Thread:
+        """
+        Runs the startup phase in a background thread, so the API answers (and
+        reports "loading") meanwhile.
+        """
+        thread = threading.Thread(target=self.run, name="warm-start", daemon=True)
+        thread.start()
+        return thread
+
+    def report(self) -> dict:
+        """
+        Returns the progress of the startup phase, as sent by the readiness endpoint.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(
+                status=self.status,
+                mode=self.mode,
+                zones=len(self.zones),
+                loadedZones=self.loaded,
+                records=self.records,
+                seconds=round(self.duration if self.duration is not None
+                              else (time.time() - self.started if self.started else 0), 3),
+                errors=dict(self.errors),
+                zonesWithoutServerBlock=self.without_block,
+                serverBlocksWithoutZoneFile=self.without_file,
+            )
+
+
+# Startup phase of the zone store of the process
+warm_start = WarmStart(zone_store, corefile, LOAD_MODE, LOAD_WORKERS)
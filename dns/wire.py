@@ -0,0 +1,318 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# DNS wire format (RFC 1035), as much as the embedded responder needs: #
+# parsing a query's question and EDNS size, and encoding A, AAAA and   #
+# SOA records and responses. Answers are encoded once into a Section   #
+# whose owner names point at the question (offset 12), so the same    #
+# bytes answer every query of that name whatever its letter case.      #
+########################################################################
+from __future__ import annotations
+import re
+import socket
+import struct
+
+# Record types and classes
+A = 1
+SOA = 6
+AAAA = 28
+OPT = 41
+CLASS_IN = 1
+
+TYPES = {"A": A, "AAAA": AAAA, "SOA": SOA}
+
+# Response codes
+NOERROR = 0
+FORMERR = 1
+SERVFAIL = 2
+NXDOMAIN = 3
+NOTIMP = 4
+REFUSED = 5
+
+# Header flags
+QR = 0x8000
+AA = 0x0400
+TC = 0x0200
+RD = 0x0100
+OPCODE = 0x7800
+
+HEADER = struct.Struct("!HHHHHH")
+RR_FIXED = struct.Struct("!HHIH")
+
+# Pointer to the question name, right after the header
+QUESTION_POINTER = b"\xc0\x0c"
+
+# Bytes of a label written as \DDD in a name: dots, backslashes, and anything
+# but printable ASCII
+ESCAPED = re.compile(rb"[^\x21-\x2d\x2f-\x5b\x5d-\x7e]")
+
+# Largest UDP response without EDNS, and the one advertised with EDNS
+UDP_SIZE = 512
+EDNS_SIZE = 1232
+OPT_RECORD = b"\x00" + struct.pack("!HHIH", OPT, EDNS_SIZE, 0, 0)
+
+
+class FormatError(ValueError):
+    """
+    Raised when a message cannot be parsed.
+    """
+
+
+class Query:
+    """
+    Question of a query and what the response depends on.
+    """
+    __slots__ = ("id", "flags", "name", "labels", "qtype", "qclass", "question", "edns", "size")
+
+    def __init__(self, id: int, flags: int, name: str, labels: tuple, qtype: int, qclass: int,
+                 question: bytes, edns: bool, size: int):
+        self.id = id
+        self.flags = flags
+        # Lower case, without the trailing dot
+        self.name = name
+        # Offsets in the message of the labels of the name, and of the root
+        # label ending it, to point at any of its suffixes
+        self.labels = labels
+        self.qtype = qtype
+        self.qclass = qclass
+        # Question section as received, echoed in the response
+        self.question = question
+        self.edns = edns
+        # Largest UDP response accepted by the client
+        self.size = size
+
+
+class Section:
+    """
+    Precomputed part of a response: rcode, record counts and the encoded
+    answer and authority sections.
+    """
+    __slots__ = ("rcode", "ancount", "nscount", "data")
+
+    def __init__(self, rcode: int, ancount: int, nscount: int, data: bytes):
+        self.rcode = rcode
+        self.ancount = ancount
+        self.nscount = nscount
+        self.data = data
+
+
+def encode_name(name: str) -> bytes:
+    """
+    Encodes a domain name, without compression.
+    :param name: Domain name, with or without the trailing dot
+    :type name: str
+    :raises ValueError: if a label is longer than 63 bytes
+    """
+    encoded = bytearray()
+    for label in name.rstrip(".").split("."):
+        if label:
+            data = label.encode("ascii")
+            if len(data) > 63:
+                raise ValueError("Label too long: %s" % label)
+            encoded.append(len(data))
+            encoded += data
+    encoded.append(0)
+    return bytes(encoded)
+
+
+def read_name(message: bytes, offset: int) -> tuple:
+    """
+    Reads a possibly compressed domain name.
+    :return: name in lower case without the trailing dot, and the offset following it
+    :rtype: tuple
+    """
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(message):
+            raise FormatError("Truncated name")
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if offset + 1 >= len(message) or jumps > 16:
+                raise FormatError("Invalid name pointer")
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+            jumps += 1
+        elif length == 0:
+            offset += 1
+            break
+        else:
+            labels.append(message[offset + 1:offset + 1 + length].decode("ascii", "replace").lower())
+            offset += 1 + length
+    return ".".join(labels), end if end is not None else offset
+
+
+def read_question_name(message: bytes, offset: int) -> tuple:
+    """
+    Reads the name of a question, which is not compressed. Dots, backslashes and
+    bytes other than printable ASCII within a label are escaped as in master
+    files (\\DDD), so the dots of the name are its label boundaries.
+    :return: name in lower case without the trailing dot, offsets of its labels
+             and of its root label, and the offset following it
+    :rtype: tuple
+    :raises FormatError: if the name is truncated, compressed or too long
+    """
+    labels = []
+    offsets = []
+    start = offset
+    while True:
+        if offset >= len(message):
+            raise FormatError("Truncated name")
+        length = message[offset]
+        offsets.append(offset)
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0:
+            raise FormatError("Compressed question name")
+        label = message[offset + 1:offset + 1 + length].lower()
+        if len(label) < length:
+            raise FormatError("Truncated name")
+        if ESCAPED.search(label) is None:
+            labels.append(label.decode("ascii"))
+        else:
+            labels.append("".join("\\%03d" % b if ESCAPED.match(label, i) else chr(b)
+                                  for i, b in enumerate(label)))
+        offset += 1 + length
+    if offset - start > 255:
+        raise FormatError("Name too long")
+    return ".".join(labels), tuple(offsets), offset
+
+
+def parse_query(message: bytes) -> Query:
+    """
+    Parses a query with a single question, and its EDNS OPT record if any.
+    :raises FormatError: if the message is not a well-formed query
+    """
+    if len(message) < HEADER.size:
+        raise FormatError("Truncated header")
+    id, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(message)
+    if flags & QR or qdcount != 1:
+        raise FormatError("Not a single question query")
+    name, labels, offset = read_question_name(message, HEADER.size)
+    if offset + 4 > len(message):
+        raise FormatError("Truncated question")
+    qtype, qclass = struct.unpack_from("!HH", message, offset)
+    question = message[HEADER.size:offset + 4]
+
+    edns = False
+    size = UDP_SIZE
+    if arcount and not ancount and not nscount:
+        # The OPT record, if any, is the only additional record of a query
+        offset += 4
+        if offset + 11 <= len(message) and message[offset] == 0:
+            rtype, rclass = struct.unpack_from("!HH", message, offset + 1)
+            if rtype == OPT:
+                edns = True
+                size = max(UDP_SIZE, min(rclass, EDNS_SIZE))
+    return Query(id, flags, name, labels, qtype, qclass, question, edns, size)
+
+
+def encode_query(name: str, qtype: int, id: int = 0, edns: bool = False) -> bytes:
+    """
+    Encodes a query for a name, with recursion not desired.
+    :param name: Domain name
+    :type name: str
+    :param qtype: Record type, e.g. A
+    :type qtype: int
+    :param id: Query id, echoed in the response
+    :type id: int
+    :param edns: whether to advertise EDNS_SIZE with an OPT record
+    :type edns: bool
+    """
+    return HEADER.pack(id, 0, 1, 0, 0, 1 if edns else 0) + encode_name(name) \
+        + struct.pack("!HH", qtype, CLASS_IN) + (OPT_RECORD if edns else b"")
+
+
+def encode_rr(owner: bytes, rtype: int, ttl: int, rdata: bytes) -> bytes:
+    return owner + RR_FIXED.pack(rtype, CLASS_IN, ttl, len(rdata)) + rdata
+
+
+def a_rdata(ip: str) -> bytes:
+    return socket.inet_pton(socket.AF_INET, ip)
+
+
+def aaaa_rdata(ip: str) -> bytes:
+    return socket.inet_pton(socket.AF_INET6, ip)
+
+
+def soa_rdata(soa) -> bytes:
+    """
+    :param soa: SOA record of a zone
+    :type soa: dns.models.SOA
+    """
+    return encode_name(soa.mname) + encode_name(soa.rname) + struct.pack(
+        "!IIIII", int(soa.serial), int(soa.refresh), int(soa.retry), int(soa.expire), int(soa.ttl))
+
+
+def response(query: Query, section: Section, udp: bool = True) -> bytes:
+    """
+    Builds the response to a query from a precomputed section. A UDP response
+    larger than the client accepts is truncated (TC) to its question.
+    """
+    flags = QR | AA | (query.flags & (OPCODE | RD)) | section.rcode
+    opt = OPT_RECORD if query.edns else b""
+    message = HEADER.pack(query.id, flags, 1, section.ancount, section.nscount, 1 if opt else 0) \
+        + query.question + section.data + opt
+    if udp and len(message) > query.size:
+        message = HEADER.pack(query.id, flags | TC, 1, 0, 0, 1 if opt else 0) + query.question + opt
+    return message
+
+
+def soa_serial(message: bytes):
+    """
+    Returns the serial of the SOA record answered by a response.
+    :param message: response in wire format
+    :type message: bytes
+    :return: serial, or None if the response is an error or holds no SOA answer
+    """
+    try:
+        id, flags, qdcount, ancount, nscount, arcount = HEADER.unpack_from(message)
+        if not flags & QR or flags & 0x000F != NOERROR:
+            return None
+        offset = HEADER.size
+        for _ in range(qdcount):
+            offset = read_name(message, offset)[1] + 4
+        for _ in range(ancount):
+            offset = read_name(message, offset)[1]
+            rtype, rclass, ttl, rdlength = RR_FIXED.unpack_from(message, offset)
+            offset += RR_FIXED.size
+            if rtype == SOA:
+                # Serial follows the mname and rname of the rdata
+                rdata = read_name(message, read_name(message, offset)[1])[1]
+                return struct.unpack_from("!I", message, rdata)[0]
+            offset += rdlength
+    except (FormatError, struct.error):
+        pass
+    return None
+
+
+def error(message: bytes, rcode: int) -> bytes:
+    """
+    Builds an error response (e.g. FORMERR, NOTIMP, REFUSED) echoing what can be
+    read of the query.
+    """
+    if len(message) < HEADER.size:
+        return b""
+    id, flags = struct.unpack_from("!HH", message)
+    try:
+        query = parse_query(message)
+        question, qdcount = query.question, 1
+    except FormatError:
+        question, qdcount = b"", 0
+    return HEADER.pack(id, QR | (flags & (OPCODE | RD)) | rcode, qdcount, 0, 0, 0) + question
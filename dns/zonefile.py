@@ -0,0 +1,341 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# Streaming parser of RFC 1035 master files (zone files). The file is  #
+# read a line at a time and records are yielded as soon as they are    #
+# complete, so zones of millions of records are never held as text.   #
+#                                                                      #
+# Supported: $ORIGIN, $TTL and $INCLUDE directives, comments,          #
+# parentheses spanning several lines, quoted strings, "@", relative    #
+# names, blank owners, and TTL/class in either order. SOA, A and AAAA  #
+# records become model objects; CNAME, SRV, TXT, PTR and any other     #
+# type become ResourceRecord objects.                                  #
+########################################################################
+from __future__ import annotations
+import os
+import re
+
+from .models import SOA, A_rec, AAAA_rec
+
+CLASSES = ("IN", "CH", "HS", "CS")
+
+# Record types whose data holds domain names, by position in the data
+NAME_FIELDS = {
+    "SOA": (0, 1),
+    "CNAME": (0,),
+    "PTR": (0,),
+    "NS": (0,),
+    "MX": (1,),
+    "SRV": (3,),
+}
+
+TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+# Every part but the last has a unit, so that a digit run is matched in one way only
+ttl_pattern = re.compile(r"^(?:\d+[smhdw])*\d*$", re.IGNORECASE)
+ttl_part_pattern = re.compile(r"(\d+)([smhdw]?)", re.IGNORECASE)
+
+# Characters that take a line out of the fast path of the tokenizer
+special_pattern = re.compile(r'["()\\]')
+
+
+class ZoneFileError(ValueError):
+    """
+    Raised when a zone file cannot be parsed. The message tells the file and line.
+    """
+    def __init__(self, detail: str, path: str = None, line: int = None):
+        location = "%s:%s" % (path or "<zone>", line) if line is not None else (path or "<zone>")
+        ValueError.__init__(self, "%s: %s" % (location, detail))
+        self.detail = detail
+        self.path = path
+        self.line = line
+
+    def __reduce__(self):
+        # Raised in the worker processes of the warm start too
+        return type(self), (self.detail, self.path, self.line)
+
+
+class ResourceRecord:
+    """
+    Record of a type without a dedicated model class (CNAME, SRV, TXT, PTR...).
+    It has the attributes the zone store relies on: name, type, ttl and ip,
+    which for these records is the record data, as it is the key under which
+    the zone indexes the records of a name and type.
+    """
+    __slots__ = ("name", "ttl", "type", "rdata")
+    class_ = "IN"
+
+    def __init__(self, name: str, ttl: str, type: str, rdata: str):
+        """
+        :param name: Owner name, fully qualified, without the trailing dot
+        :type name: str
+        :param ttl: Time to live, in seconds
+        :type ttl: str
+        :param type: Record type
+        :type type: str
+        :param rdata: Record data in master file format
+        :type rdata: str
+        """
+        self.name = name
+        self.ttl = ttl
+        self.type = type
+        self.rdata = rdata
+
+    @property
+    def ip(self) -> str:
+        return self.rdata
+
+    def __str__(self):
+        return "%s. %s IN %s %s\n" % (self.name, self.ttl, self.type, self.rdata)
+
+    def to_json(self):
+        return dict(
+            name=self.name,
+            type=self.type,
+            data=self.rdata,
+            ttl=self.ttl,
+        )
+
+
+def parse_ttl(value: str) -> int:
+    """
+    Converts a TTL in seconds or in BIND units (e.g. "1h30m") to seconds.
+    :raises ValueError: if the value is not a TTL
+    """
+    if value.isdigit():
+        return int(value)
+    if not value or not ttl_pattern.match(value):
+        raise ValueError("Invalid TTL: %s" % value)
+    return sum(int(n) * TTL_UNITS[(unit or "s").lower()] for n, unit in ttl_part_pattern.findall(value))
+
+
+def is_ttl(token: str) -> bool:
+    return token.isdigit() or (token[0].isdigit() and ttl_pattern.match(token) is not None)
+
+
+def split_line(line: str, path: str = None, number: int = None) -> list:
+    """
+    Splits a line into tokens, dropping comments. Quoted strings are kept as
+    one token, quotes included, and parentheses are returned as tokens.
+    """
+    tokens = []
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i]
+        if c in " \t\r\n":
+            i += 1
+        elif c == ";":
+            break
+        elif c in "()":
+            tokens.append(c)
+            i += 1
+        elif c == '"':
+            j = i + 1
+            while j < n and line[j] != '"':
+                j += 2 if line[j] == "\\" else 1
+            if j >= n:
+                raise ZoneFileError("Unterminated quoted string", path, number)
+            tokens.append(line[i:j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < n and line[j] not in " \t\r\n;()\"":
+                j += 2 if line[j] == "\\" else 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+def entries(lines, path: str = None):
+    """
+    Yields the logical entries of a master file as (line number, owner is blank,
+    tokens) tuples, joining the lines of parenthesized entries.
+    :param lines: iterable of lines (e.g. an open file)
+    :param path: name of the file, for error messages
+    """
+    tokens = None
+    blank_owner = False
+    start = 0
+    depth = 0
+    for number, line in enumerate(lines, 1):
+        if depth == 0:
+            # Fast path for the plain one-line records written by this service
+            if special_pattern.search(line) is None:
+                line_tokens = line.split(";", 1)[0].split() if ";" in line else line.split()
+                if line_tokens:
+                    yield number, line[0] in " \t", line_tokens
+                continue
+            line_tokens = split_line(line, path, number)
+            if not line_tokens:
+                continue
+            tokens = []
+            blank_owner = line[0] in " \t"
+            start = number
+        else:
+            line_tokens = split_line(line, path, number)
+
+        for token in line_tokens:
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+                if depth < 0:
+                    raise ZoneFileError("Unbalanced parentheses", path, number)
+            else:
+                tokens.append(token)
+        if depth == 0 and tokens:
+            yield start, blank_owner, tokens
+            tokens = None
+    if depth != 0:
+        raise ZoneFileError("Unterminated parentheses", path, start)
+
+
+def absolute(name: str, origin: str) -> str:
+    """
+    Returns a domain name as a fully qualified name without the trailing dot.
+    :param name: Absolute (trailing dot), relative or "@" name
+    :param origin: Current origin, without the trailing dot
+    """
+    if name == "@":
+        return origin
+    if name.endswith("."):
+        return name[:-1]
+    if not origin:
+        return name
+    return name + "." + origin
+
+
+def parse(lines, origin: str = None, ttl: int = None, path: str = None):
+    """
+    Yields the records of a master file: SOA, A_rec and AAAA_rec objects for
+    those types and ResourceRecord objects for the others.
+    :param lines: iterable of lines (e.g. an open file), read lazily
+    :param origin: Initial origin ($ORIGIN), e.g. the zone name
+    :type origin: str
+    :param ttl: Initial default TTL ($TTL)
+    :type ttl: int
+    :param path: Path of the file, for error messages and relative $INCLUDEs
+    :type path: str
+    :raises ZoneFileError: on a malformed entry
+    """
+    origin = origin.rstrip(".") if origin else ""
+    default_ttl = ttl
+    last_ttl = None
+    owner = None
+
+    for number, blank_owner, tokens in entries(lines, path):
+        first = tokens[0]
+        if first[0] == "$":
+            directive = first.upper()
+            if directive == "$ORIGIN" and len(tokens) >= 2:
+                origin = absolute(tokens[1], origin)
+            elif directive == "$TTL" and len(tokens) >= 2:
+                try:
+                    default_ttl = parse_ttl(tokens[1])
+                except ValueError as e:
+                    raise ZoneFileError(str(e), path, number)
+            elif directive == "$INCLUDE" and len(tokens) >= 2:
+                include = tokens[1]
+                if path is not None and not os.path.isabs(include):
+                    include = os.path.join(os.path.dirname(path), include)
+                include_origin = absolute(tokens[2], origin) if len(tokens) >= 3 else origin
+                try:
+                    with open(include, mode='r') as f:
+                        yield from parse(f, include_origin, default_ttl, include)
+                except OSError as e:
+                    raise ZoneFileError("Cannot include %s: %s" % (include, e), path, number)
+            else:
+                raise ZoneFileError("Invalid directive: %s" % " ".join(tokens), path, number)
+            continue
+
+        # Fast path for the "<name>. <ttl> IN A|AAAA <address>" lines written by this service
+        if len(tokens) == 5 and not blank_owner and tokens[2] == "IN" and tokens[1].isdigit() \
+                and first[-1] == "." and (tokens[3] == "A" or tokens[3] == "AAAA"):
+            owner = first[:-1]
+            last_ttl = int(tokens[1])
+            yield (A_rec if tokens[3] == "A" else AAAA_rec)(owner, tokens[4], tokens[1])
+            continue
+
+        i = 0
+        if not blank_owner:
+            owner = absolute(first, origin)
+            i = 1
+        elif owner is None:
+            raise ZoneFileError("Record without owner name", path, number)
+
+        # Optional TTL and class, in either order
+        record_ttl = None
+        n = len(tokens)
+        if i < n and tokens[i][0].isdigit() and is_ttl(tokens[i]):
+            record_ttl = parse_ttl(tokens[i])
+            i += 1
+        if i < n and tokens[i].upper() in CLASSES:
+            i += 1
+            if record_ttl is None and i < n and tokens[i][0].isdigit() and is_ttl(tokens[i]):
+                record_ttl = parse_ttl(tokens[i])
+                i += 1
+        if i >= n:
+            raise ZoneFileError("Record without type", path, number)
+        rtype = tokens[i].upper()
+        rdata = tokens[i + 1:]
+
+        for field in NAME_FIELDS.get(rtype, ()):
+            if field < len(rdata):
+                rdata[field] = absolute(rdata[field], origin)
+
+        if rtype == "SOA":
+            if len(rdata) != 7:
+                raise ZoneFileError("SOA record with %d fields" % len(rdata), path, number)
+            if default_ttl is None:
+                # Without $TTL, the SOA minimum is the default TTL of the zone
+                default_ttl = parse_ttl(rdata[6])
+            yield SOA(owner, rdata[0], rdata[1], rdata[2], str(parse_ttl(rdata[3])),
+                      str(parse_ttl(rdata[4])), str(parse_ttl(rdata[5])), str(parse_ttl(rdata[6])))
+            last_ttl = record_ttl if record_ttl is not None else last_ttl
+            continue
+
+        if record_ttl is None:
+            record_ttl = default_ttl if default_ttl is not None else last_ttl
+            if record_ttl is None:
+                raise ZoneFileError("Record without TTL and no default TTL", path, number)
+        else:
+            last_ttl = record_ttl
+
+        if rtype in ("A", "AAAA"):
+            if len(rdata) != 1:
+                raise ZoneFileError("%s record with %d fields" % (rtype, len(rdata)), path, number)
+            record_type = A_rec if rtype == "A" else AAAA_rec
+            yield record_type(owner, rdata[0], str(record_ttl))
+        else:
+            if rtype == "SRV" and len(rdata) != 4:
+                raise ZoneFileError("SRV record with %d fields" % len(rdata), path, number)
+            if not rdata:
+                raise ZoneFileError("%s record without data" % rtype, path, number)
+            for field in NAME_FIELDS.get(rtype, ()):
+                if field < len(rdata):
+                    rdata[field] += "."
+            yield ResourceRecord(owner, str(record_ttl), rtype, " ".join(rdata))
+
+
+def parse_file(path: str, origin: str = None):
+    """
+    Yields the records of a zone file, streamed from disk.
+    :param path: Path of the zone file
+    :type path: str
+    :param origin: Initial origin, e.g. the zone name
+    :type origin: str
+    """
+    with open(path, mode='r') as f:
+        yield from parse(f, origin, path=path)
@@ -19,12 +19,25 @@ import os
 import stat
 
 from dns.api.controllers.zones_controller import (ZonesController)
+from dns.api.controllers.dns_rules_controller import (DnsRulesController)
+from dns.api.controllers.metrics_controller import (MetricsController)
+from dns.api.controllers.readiness_controller import (ReadinessController)
+from dns.api.controllers.replication_controller import (ReplicationController)
+from dns.api.controllers.watch_controller import (WatchController)
 from dns.models import ProblemDetails
-
-FILES_PATH = "/tmp/coredns/"
+from dns.serializer import serializer
+from dns.store import zone_store
+from dns.warmup import warm_start
+from dns.responder import responder
+from dns.config import FILES_PATH, FLUSH_MODE, FLUSH_INTERVAL, JOURNAL, COMPACT_INTERVAL, SERVER, AIO_WORKERS, API_PORT
+from dns.config import RESPONDER_HOST, RESPONDER_PORT
 
 # API Controllers
-def main():
+def dispatcher() -> cherrypy.dispatch.RoutesDispatcher:
+    """
+    Returns the dispatcher holding the routes of the API, shared by the CherryPy
+    and the asyncio servers.
+    """
 
     ##################################
     # Application support interface  #
@@ -35,6 +48,14 @@ def main():
     ##############################
     # Zones creation and removal #
     ##############################
+    dns_dispatcher.connect(
+        name="Get Zones",
+        action="get_zones",
+        controller=ZonesController,
+        route="/api",
+        conditions=dict(method=["GET"]),
+    )
+
     dns_dispatcher.connect(
         name="Post Zone",
         action="add_zone",
@@ -62,6 +83,14 @@ def main():
         conditions=dict(method=["POST"]),
     )
 
+    dns_dispatcher.connect(
+        name="Put Record",
+        action="update_a_record",
+        controller=ZonesController,
+        route="/api/:zoneName/record",
+        conditions=dict(method=["PUT"]),
+    )
+
     dns_dispatcher.connect(
         name="Delete Record",
         action="delete_a_record",
@@ -70,20 +99,172 @@ def main():
         conditions=dict(method=["DELETE"]),
     )
 
+    dns_dispatcher.connect(
+        name="Get Records",
+        action="get_records",
+        controller=ZonesController,
+        route="/api/:zoneName/record",
+        conditions=dict(method=["GET"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Get Record",
+        action="get_record",
+        controller=ZonesController,
+        route="/api/:zoneName/record/:name",
+        conditions=dict(method=["GET"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Post Records",
+        action="batch_records",
+        controller=ZonesController,
+        route="/api/:zoneName/records",
+        conditions=dict(method=["POST"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Flush Zone",
+        action="flush_zone",
+        controller=ZonesController,
+        route="/api/:zoneName/flush",
+        conditions=dict(method=["POST"]),
+    )
+
+    ##################################
+    # DNS rules (ETSI GS MEC 011)    #
+    ##################################
+    dns_dispatcher.connect(
+        name="Get DNS Rules",
+        action="get_rules",
+        controller=DnsRulesController,
+        route="/applications/:appInstanceId/dns_rules",
+        conditions=dict(method=["GET"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Post DNS Rule",
+        action="post_rule",
+        controller=DnsRulesController,
+        route="/applications/:appInstanceId/dns_rules",
+        conditions=dict(method=["POST"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Get DNS Rule",
+        action="get_rule",
+        controller=DnsRulesController,
+        route="/applications/:appInstanceId/dns_rules/:dnsRuleId",
+        conditions=dict(method=["GET"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Put DNS Rule",
+        action="put_rule",
+        controller=DnsRulesController,
+        route="/applications/:appInstanceId/dns_rules/:dnsRuleId",
+        conditions=dict(method=["PUT"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Delete DNS Rule",
+        action="delete_rule",
+        controller=DnsRulesController,
+        route="/applications/:appInstanceId/dns_rules/:dnsRuleId",
+        conditions=dict(method=["DELETE"]),
+    )
+
+    ##################################
+    # Replication to followers       #
+    ##################################
+    dns_dispatcher.connect(
+        name="Get Changes",
+        action="get_changes",
+        controller=ReplicationController,
+        route="/replication/changes",
+        conditions=dict(method=["GET"]),
+    )
+
+    dns_dispatcher.connect(
+        name="Get Snapshot",
+        action="get_snapshot",
+        controller=ReplicationController,
+        route="/replication/snapshot",
+        conditions=dict(method=["GET"]),
+    )
+
+    ##################################
+    # Change feed                    #
+    ##################################
+    dns_dispatcher.connect(
+        name="Watch",
+        action="watch",
+        controller=WatchController,
+        route="/watch",
+        conditions=dict(method=["GET"]),
+    )
+
+    return dns_dispatcher
+
+
+def main():
+    dns_dispatcher = dispatcher()
 
     ################################
     cherrypy.config.update(
-        {"server.socket_host": "0.0.0.0", "server.socket_port": 8082}
+        {"server.socket_host": "0.0.0.0", "server.socket_port": API_PORT}
     )
 
-    dns_conf = {"/": {"request.dispatch": dns_dispatcher}}
+    dns_conf = {"/": {"request.dispatch": dns_dispatcher, "tools.metrics.on": True}}
     cherrypy.tree.mount(None, "/dns_support/v1", config=dns_conf)
 
+    # Prometheus metrics
+    cherrypy.tree.mount(MetricsController(), "/metrics", config={"/": {"tools.trailing_slash.on": False}})
+
+    # Readiness of the zones found at startup
+    cherrypy.tree.mount(ReadinessController(), "/ready", config={"/": {"tools.trailing_slash.on": False}})
+
+
+    #################################################
+    # Zone files flusher (coalescing/journal modes) #
+    #################################################
+    if JOURNAL:
+        # Flushing a zone compacts its journal into the zone file
+        cherrypy.process.plugins.Monitor(
+            cherrypy.engine, zone_store.flush, frequency=COMPACT_INTERVAL, name="ZoneCompactor"
+        ).subscribe()
+    elif FLUSH_MODE == "coalesce":
+        cherrypy.process.plugins.Monitor(
+            cherrypy.engine, zone_store.flush, frequency=FLUSH_INTERVAL, name="ZoneFlusher"
+        ).subscribe()
+    if zone_store.coalesce:
+        # Write pending changes before shutting down
+        cherrypy.engine.subscribe("stop", zone_store.flush)
+
 
     ######################################
     # Database Connection to all threads #
     ######################################
     cherrypy.engine.start()
+    # The main thread must outlive the server: thread pools (e.g. the one the
+    # DNS responder builds its answers in) refuse work once it has exited
+    cherrypy.engine.block()
+
+
+def main_asyncio():
+    """
+    Serves the same routes as main() from an asyncio event loop, running the
+    controllers on a bounded thread pool (DNS_SERVER=asyncio).
+    """
+    from dns.api import aio_server
+
+    flush, flush_interval = None, None
+    if JOURNAL:
+        flush, flush_interval = zone_store.flush, COMPACT_INTERVAL
+    elif FLUSH_MODE == "coalesce":
+        flush, flush_interval = zone_store.flush, FLUSH_INTERVAL
+    aio_server.run(dispatcher(), "0.0.0.0", API_PORT, workers=AIO_WORKERS,
+                   flush=flush, flush_interval=flush_interval)
 
 
 def error_page_404(status, message, traceback, version):
@@ -96,44 +277,44 @@ def error_page_404(status, message, traceback, version):
         detail="URI %s cannot be mapped to a valid resource." % cherrypy.request.path_info,
         instance="xxx"
     )
-    return json.dumps(errorMessage.to_json())
+    return serializer.dumps(errorMessage)
+
+# The bodies of the error pages never change, so they are encoded once
+ERROR_PAGE_403 = serializer.dumps(ProblemDetails(
+    type="xxxx",
+    title="Forbidden.",
+    status=403,
+    detail="The operation is not allowed given the current status of the resource.",
+    instance="xxx"
+))
+
+ERROR_PAGE_400 = serializer.dumps(ProblemDetails(
+    type="xxxx",
+    title="Forbidden.",
+    status=400,
+    detail="The operation is not allowed given the current status of the resource.",
+    instance="xxx"
+))
+
+ERROR_PAGE_500 = serializer.dumps(ProblemDetails(
+    type="xxxx",
+    title="Internal Server Error.",
+    status=500,
+    detail="The server has encountered a situation it does not know how to handle.",
+    instance="xxx"
+))
 
 def error_page_403(status, message, traceback, version):
-    response = cherrypy.response
-    response.headers['Content-Type'] = 'application/json'
-    errorMessage = ProblemDetails(
-        type="xxxx",
-        title="Forbidden.",
-        status=403,
-        detail="The operation is not allowed given the current status of the resource.",
-        instance="xxx"
-    )
-    return json.dumps(errorMessage.to_json())
+    cherrypy.response.headers['Content-Type'] = 'application/json'
+    return ERROR_PAGE_403
 
 def error_page_400(status, message, traceback, version):
-    response = cherrypy.response
-    response.headers['Content-Type'] = 'application/json'
-    errorMessage = ProblemDetails(
-        type="xxxx",
-        title="Forbidden.",
-        status=400,
-        detail="The operation is not allowed given the current status of the resource.",
-        instance="xxx"
-    )
-    return json.dumps(errorMessage.to_json())
+    cherrypy.response.headers['Content-Type'] = 'application/json'
+    return ERROR_PAGE_400
 
 def error_page_500(status, message, traceback, version):
-    response = cherrypy.response
-    response.headers['Content-Type'] = 'application/json'
-    errorMessage = ProblemDetails(
-        type="xxxx",
-        title="Internal Server Error.",
-        status=500,
-        detail="The server has encountered a situation it does not know how to handle.",
-        instance="xxx"
-    )
-    return json.dumps(errorMessage.to_json())
-
+    cherrypy.response.headers['Content-Type'] = 'application/json'
+    return ERROR_PAGE_500
 
 if __name__ == "__main__":
 
@@ -141,13 +322,16 @@ if __name__ == "__main__":
     # Create Corefile and zone0.db if not exist #
     #############################################
 
+    # Templates shipped next to this file (/home/api/temp_files in the image)
+    TEMPLATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "temp_files")
+
     corefile_path = FILES_PATH + "Corefile"
     zone0_path = FILES_PATH + "zone0.db"
 
     # Corefile
     if not os.path.exists(corefile_path): 
         #os.system("touch " + corefile_path)
-        with open('home/api/temp_files/Corefile','r') as corefile_tmp, open(corefile_path,'w+') as corefile:
+        with open(os.path.join(TEMPLATES_PATH, 'Corefile'),'r') as corefile_tmp, open(corefile_path,'w+') as corefile:
             # copy file
             for line in corefile_tmp:
                 corefile.write(line)
@@ -158,7 +342,7 @@ if __name__ == "__main__":
     # zone0.db
     if not os.path.exists(zone0_path):
         #os.system("touch " + zone0_path)
-        with open('home/api/temp_files/zone0.db','r') as zone0_tmp, open(zone0_path,'w+') as zone0:
+        with open(os.path.join(TEMPLATES_PATH, 'zone0.db'),'r') as zone0_tmp, open(zone0_path,'w+') as zone0:
             # copy file
             for line in zone0_tmp:
                 zone0.write(line)
@@ -167,4 +351,21 @@ if __name__ == "__main__":
 
         cherrypy.log(f"zone0.db created at {zone0_path}")
 
-    main()
+    # Replay the journal tails left by a previous run
+    if JOURNAL:
+        for zoneName in zone_store.recover():
+            cherrypy.log(f"Recovered journal of zone {zoneName}")
+
+    # Index the zones found in FILES_PATH and, in eager mode, load them in the
+    # background; /ready answers 200 once it is done
+    warm_start.start()
+
+    # Answer DNS queries from the zone store, without waiting for CoreDNS to
+    # reload the zone files
+    if RESPONDER_PORT:
+        responder.start(RESPONDER_HOST, RESPONDER_PORT)
+
+    if SERVER == "asyncio":
+        main_asyncio()
+    else:
+        main()
@@ -0,0 +1,74 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+########################################################################
+# The configuration is read from the environment when dns.config is    #
+# imported, so the process-wide singletons (zone store, Corefile) are  #
+# pointed at a temporary folder before any test module imports them.   #
+########################################################################
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import cherrypy
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+os.environ["DNS_FILES_PATH"] = tempfile.mkdtemp(prefix="dns_api_tests_") + "/"
+# As main() does when the service starts
+shutil.copyfile(os.path.join(ROOT, "temp_files", "Corefile"), os.environ["DNS_FILES_PATH"] + "Corefile")
+
+from dns.models import SOA
+from dns.store import zone_store, ZoneStore, ZoneNotFound
+
+_zone_ids = itertools.count()
+
+
+def new_soa(zoneName: str) -> SOA:
+    return SOA(zoneName, "ns." + zoneName, "admin." + zoneName, "2022110900", "7200", "3600", "1209600", "3600")
+
+
+def call(method, **kwargs):
+    """
+    Calls a controller method outside of a request and returns the status and
+    the decoded body of its response.
+    """
+    cherrypy.response.status = 200
+    body = method(**kwargs)
+    return int(str(cherrypy.response.status)[:3]), json.loads(body) if body else None
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A store of its own, in a folder of its own
+    return ZoneStore(str(tmp_path) + "/")
+
+
+@pytest.fixture
+def zone():
+    """
+    Creates a zone in the process-wide store, deleted after the test.
+    """
+    zoneName = "z%d.test" % next(_zone_ids)
+    zone_store.create(new_soa(zoneName))
+    yield zoneName
+    try:
+        zone_store.drop(zoneName)
+    except ZoneNotFound:
+        pass
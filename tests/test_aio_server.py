@@ -0,0 +1,78 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import asyncio
+import json
+
+import pytest
+
+from dns.api.aio_server import AsyncServer
+from dns.store import zone_store
+from main import dispatcher
+
+
+async def exchange(server: AsyncServer, request: bytes) -> tuple:
+    """
+    Sends a raw request to a server on an ephemeral port and returns the status,
+    headers and body of its response.
+    """
+    await server.start("127.0.0.1", 0)
+    try:
+        port = server.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 10)
+        writer.close()
+    finally:
+        await server.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, body
+
+
+def send(request: bytes) -> tuple:
+    return asyncio.run(exchange(AsyncServer(dispatcher(), workers=2), request))
+
+
+def test_get(zone):
+    status, headers, body = send(b"GET /dns_support/v1/api HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status == 200
+    assert zone in json.loads(body)["zones"]
+    assert int(headers["Content-Length"]) == len(body)
+
+
+def test_post_form(zone):
+    form = b"name=www.%s&ip=10.0.0.1&ttl=60" % zone.encode()
+    status, _, _ = send(b"POST /dns_support/v1/api/%s/record HTTP/1.1\r\nConnection: close\r\n"
+                        b"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: %d\r\n\r\n%s"
+                        % (zone.encode(), len(form), form))
+    assert status == 200
+    assert [r.ip for r in zone_store.get(zone).find("www." + zone)] == ["10.0.0.1"]
+
+
+def test_unknown_route():
+    status, _, body = send(b"GET /dns_support/v1/nowhere HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status == 404
+    assert json.loads(body)["status"] == 404
+
+
+@pytest.mark.parametrize("value", [b"abc", b"-1", b"1e3", b"\xb2"])
+def test_malformed_content_length(value):
+    status, headers, body = send(b"POST /dns_support/v1/api/x.test HTTP/1.1\r\nContent-Length: %s\r\n\r\n" % value)
+    assert status == 400
+    assert headers["Connection"] == "close"
+    assert json.loads(body)["detail"] == "Malformed Content-Length header."
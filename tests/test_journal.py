@@ -0,0 +1,103 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import errno
+import os
+import threading
+
+import pytest
+
+from conftest import new_soa
+from dns import journal as journal_module
+from dns.journal import Journal, FSYNC_GROUP, FSYNC_NONE
+from dns.models import A_rec
+from dns.store import ZoneStore
+
+ZONE = "example.test"
+
+
+def test_recovery_replays_the_journal_tail(tmp_path):
+    files_path = str(tmp_path) + "/"
+    store = ZoneStore(files_path, journal=Journal(files_path, FSYNC_NONE))
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("a." + ZONE, "10.0.0.1", "60"))
+    store.add_record(ZONE, A_rec("b." + ZONE, "10.0.0.2", "60"))
+    store.delete_records(ZONE, "a." + ZONE, "A")
+    serial = store.get(ZONE).soa.serial
+    # The process stops before the journal is compacted, in the middle of an append
+    with open(os.path.join(files_path, ZONE + ".journal"), mode='a') as f:
+        f.write('{"serial":"2099010100","changes":[["add","c.%s. 60 IN A' % ZONE)
+    with open(store.zone_path(ZONE)) as f:
+        assert "b." + ZONE not in f.read()
+
+    recovered = ZoneStore(files_path, journal=Journal(files_path, FSYNC_NONE))
+    assert recovered.recover() == [ZONE]
+    zone = ZoneStore(files_path).get(ZONE)
+    assert [r.name for r in zone] == ["b." + ZONE]
+    assert zone.soa.serial == serial
+    assert os.path.getsize(os.path.join(files_path, ZONE + ".journal")) == 0
+
+
+def test_group_fsync_does_not_block_appends(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path), FSYNC_GROUP)
+    blocked = journal._get("slow.test").fd
+    syncing, release = threading.Event(), threading.Event()
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        if fd == blocked:
+            syncing.set()
+            release.wait(5)
+        fsync(fd)
+
+    monkeypatch.setattr(journal_module.os, "fsync", slow_fsync)
+    seq = journal.append("slow.test", "1", [])
+    assert syncing.wait(5)
+
+    # Appending to another zone does not wait for the fsync in progress
+    done = threading.Event()
+    threading.Thread(target=lambda: (journal.append("other.test", "1", []), done.set())).start()
+    assert done.wait(1)
+
+    release.set()
+    journal.wait("slow.test", seq)
+
+
+def test_failed_fsync_fails_its_waiters(tmp_path, monkeypatch):
+    journal = Journal(str(tmp_path), FSYNC_GROUP)
+    broken = journal._get("broken.test").fd
+    fsync = os.fsync
+
+    def failing_fsync(fd):
+        if fd == broken:
+            raise OSError(errno.EIO, os.strerror(errno.EIO))
+        fsync(fd)
+
+    monkeypatch.setattr(journal_module.os, "fsync", failing_fsync)
+    seq = journal.append("broken.test", "1", [])
+    with pytest.raises(OSError) as e:
+        journal.wait("broken.test", seq)
+    assert e.value.errno == errno.EIO
+
+    # The syncer is still alive for the other zones
+    journal.wait("other.test", journal.append("other.test", "1", []))
+    assert journal._syncer.is_alive()
+
+    # Until folded into the zone file, the later entries may be lost too
+    monkeypatch.setattr(journal_module.os, "fsync", fsync)
+    with pytest.raises(OSError):
+        journal.wait("broken.test", journal.append("broken.test", "2", []))
+    journal.truncate("broken.test")
+    journal.wait("broken.test", journal.append("broken.test", "3", []))
@@ -0,0 +1,59 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import threading
+
+from conftest import call
+from dns.locks import LockManager, lock_manager
+from dns.api.controllers.zones_controller import ZonesController
+
+
+def test_locks_are_released_with_their_last_holder():
+    locks = LockManager()
+    with locks.zone("a.test"):
+        # Nested acquisitions by the same thread
+        with locks.zone("a.test"):
+            assert len(locks) == 1
+    assert len(locks) == 0
+    assert locks.stats()["zone"]["acquisitions"] == 1
+
+
+def test_lock_excludes_other_threads():
+    locks = LockManager()
+    inside = []
+
+    def worker():
+        for _ in range(100):
+            with locks.zone("a.test"):
+                inside.append(1)
+                assert len(inside) == 1
+                inside.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(locks) == 0
+    assert locks.stats()["zone"]["acquisitions"] == 400
+
+
+def test_missing_zones_leave_no_lock():
+    controller = ZonesController()
+    for i in range(50):
+        status, _ = call(controller.get_record, zoneName="missing%d.test" % i, name="www")
+        assert status == 404
+    assert len(lock_manager) == 0
+    assert set(lock_manager.stats()) == {"zone", "Corefile"}
@@ -0,0 +1,41 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import json
+
+import cherrypy
+
+from dns.models import SOA, A_rec, NotFound, BadRequest, record_from_str
+from dns.serializer import serializer
+
+
+def test_error_message():
+    body = json.loads(NotFound("Inexistent zone name.").message())
+    assert cherrypy.response.status == 404
+    assert body == dict(type="xxx", title="Not Found", status=404, detail="Inexistent zone name.", instance="xxx")
+    # Errors holding request values are encoded as they are
+    for value in ("a", "b"):
+        body = json.loads(BadRequest("Invalid attribute(s): {'x': '%s'}" % value).message())
+        assert body["detail"] == "Invalid attribute(s): {'x': '%s'}" % value
+
+
+def test_records_round_trip():
+    soa = SOA("ex.com", "ns.ex.com", "admin.ex.com", "2022110900", "7200", "3600", "1209600", "3600")
+    assert str(SOA.from_str(str(soa))) == str(soa)
+    record = A_rec("www.ex.com", "10.0.0.1", "60")
+    parsed = record_from_str(str(record))
+    assert (parsed.name, parsed.type, parsed.ip, parsed.ttl) == ("www.ex.com", "A", "10.0.0.1", "60")
+    assert json.loads(serializer.dumps(dict(soa=soa, records=[record]))) == dict(
+        soa=soa.to_json(), records=[record.to_json()])
@@ -0,0 +1,83 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import json
+
+import pytest
+
+from conftest import new_soa
+from dns.api.controllers.replication_controller import ReplicationController
+from dns.changelog import ChangeLog, UPDATE
+from dns.models import A_rec
+from dns.replication import Follower
+from dns.store import zone_store
+
+controller = ReplicationController()
+
+
+@pytest.fixture
+def changelog(monkeypatch):
+    changelog = ChangeLog(100)
+    monkeypatch.setattr(zone_store, "changelog", changelog)
+    return changelog
+
+
+def leader(path: str, **params) -> dict:
+    # Answers a follower from the controllers, as the leader API would
+    body = getattr(controller, "get_" + path)(**params)
+    return json.loads(body if isinstance(body, bytes) else b"".join(body))
+
+
+def test_snapshot_is_streamed(changelog, zone):
+    zone_store.add_record(zone, A_rec("www." + zone, "10.0.0.1", "60"))
+    chunks = list(controller.get_snapshot())
+    # The head, a chunk per zone and the tail
+    assert len(chunks) == len(zone_store.names()) + 2
+    snapshot = json.loads(b"".join(chunks))
+    assert snapshot["epoch"] == changelog.epoch
+    zone_file = [z for z in snapshot["zones"] if z["zoneName"] == zone][0]
+    assert "www.%s. 60 IN A 10.0.0.1" % zone in zone_file["content"]
+
+    snapshot = json.loads(b"".join(controller.get_snapshot(zoneName=zone)))
+    assert [z["zoneName"] for z in snapshot["zones"]] == [zone]
+    assert json.loads(controller.get_snapshot(zoneName="missing.test"))["status"] == 404
+
+
+def test_follower_copies_and_follows(changelog, zone, tmp_path, monkeypatch):
+    follower = Follower("http://leader", str(tmp_path) + "/")
+    monkeypatch.setattr(follower, "fetch", leader)
+    follower.sync()
+    assert follower.store.get(zone).soa.serial == zone_store.get(zone).soa.serial
+
+    zone_store.add_record(zone, A_rec("www." + zone, "10.0.0.1", "60"))
+    assert follower.sync() == 1
+    assert [r.ip for r in follower.store.get(zone).find("www." + zone)] == ["10.0.0.1"]
+    assert follower.resyncs == 1
+
+
+def test_follower_compares_serials_across_wrap_around(tmp_path, monkeypatch):
+    follower = Follower("http://leader", str(tmp_path) + "/")
+    resyncs = []
+    monkeypatch.setattr(follower, "resync", resyncs.append)
+    soa = new_soa("wrap.test")
+    soa.serial = "5"
+    follower.store.create(soa)
+
+    # Older than 5 in serial number arithmetic: already copied
+    follower.apply(dict(zone="wrap.test", op=UPDATE, fromSerial="4294967289", serial="4294967290", changes=[]))
+    assert resyncs == []
+    # Newer, from another base serial: the zone diverged
+    follower.apply(dict(zone="wrap.test", op=UPDATE, fromSerial="6", serial="7", changes=[]))
+    assert resyncs == ["wrap.test"]
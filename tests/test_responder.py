@@ -0,0 +1,161 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import asyncio
+import socket
+import struct
+import threading
+from contextlib import contextmanager
+
+from conftest import new_soa
+from dns import wire
+from dns.models import A_rec
+from dns.responder import Responder, UdpProtocol
+from dns.store import ZoneStore
+
+ZONE = "example.test"
+
+
+def ask(responder: Responder, message: bytes) -> tuple:
+    """
+    Returns the rcode, the answer count and the authority section owner name of
+    the response to a query.
+    """
+    response = responder.answer(message)
+    _, flags, _, ancount, nscount, _ = wire.HEADER.unpack_from(response)
+    owner = None
+    if nscount:
+        offset = wire.read_name(response, wire.HEADER.size)[1] + 4
+        owner = wire.read_name(response, offset)[0]
+    return flags & 0x0F, ancount, owner
+
+
+def test_answers(store):
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.1", "60"))
+    responder = Responder(store)
+    assert ask(responder, wire.encode_query("WWW." + ZONE, wire.A)) == (wire.NOERROR, 1, None)
+    assert ask(responder, wire.encode_query("www." + ZONE, wire.AAAA)) == (wire.NOERROR, 0, ZONE)
+    assert ask(responder, wire.encode_query("a.b." + ZONE, wire.A)) == (wire.NXDOMAIN, 0, ZONE)
+    assert ask(responder, wire.encode_query("other.test", wire.A)) == (wire.REFUSED, 0, None)
+
+    # Answers are dropped when the zone changes
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.2", "60"))
+    assert ask(responder, wire.encode_query("www." + ZONE, wire.A)) == (wire.NOERROR, 2, None)
+
+
+def test_answers_from_a_record_table(tmp_path):
+    store = ZoneStore(str(tmp_path) + "/", table=True)
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.1", "60"))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.2", "60"))
+    response = Responder(store).answer(wire.encode_query("www." + ZONE, wire.A))
+    assert response.endswith(b"\x0a\x00\x00\x01\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x02")
+
+
+def test_authority_points_at_the_apex_in_the_question(store):
+    store.create(new_soa(ZONE))
+    responder = Responder(store)
+    # Labels holding a dot and a byte that is not ASCII
+    message = wire.HEADER.pack(1, 0, 1, 0, 0, 0) + b"\x04a.\xffb\x03x.y" + wire.encode_name(ZONE) \
+        + struct.pack("!HH", wire.A, wire.CLASS_IN)
+    assert ask(responder, message) == (wire.NXDOMAIN, 0, ZONE)
+    # Not below the apex: "example" is within the label "a.example"
+    message = wire.HEADER.pack(1, 0, 1, 0, 0, 0) + b"\x01x\x09a.example\x04test\x00" \
+        + struct.pack("!HH", wire.A, wire.CLASS_IN)
+    assert ask(responder, message) == (wire.REFUSED, 0, None)
+
+
+def test_zones_are_not_loaded_to_match_names(store):
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.1", "60"))
+    lazy = ZoneStore(store.files_path)
+    responder = Responder(lazy)
+    assert responder.zone_of("www." + ZONE) == ZONE
+    assert lazy.loaded(ZONE) is None
+    assert ask(responder, wire.encode_query("www." + ZONE, wire.A)) == (wire.NOERROR, 1, None)
+
+
+def test_zone_with_an_apex_other_than_its_name(store):
+    with open(store.zone_path("zone0"), "w") as f:
+        f.write("netedge.zone0. 3600 IN SOA ns1.netedge.com. admin.netedge.com. 1 7200 3600 1209600 3600\n")
+    responder = Responder(store)
+    assert ask(responder, wire.encode_query("x.zone0", wire.A))[0] == wire.REFUSED
+    assert ask(responder, wire.encode_query("www.netedge.zone0", wire.A)) == (wire.NXDOMAIN, 0, "netedge.zone0")
+    assert responder.zone_of("netedge.zone0") == "zone0"
+
+
+def test_answers_are_built_holding_the_zone_lock(store):
+    store.create(new_soa(ZONE))
+    responder = Responder(store)
+    answered = threading.Event()
+    with store.locked(ZONE):
+        thread = threading.Thread(target=lambda: (ask(responder, wire.encode_query(ZONE, wire.SOA)),
+                                                  answered.set()))
+        thread.start()
+        assert not answered.wait(0.2)
+    thread.join()
+    assert answered.is_set()
+
+
+@contextmanager
+def udp_responder(responder: Responder):
+    """
+    Serves the queries of a responder over UDP on an event loop in a thread, and
+    yields a socket connected to it.
+    """
+    loop = asyncio.new_event_loop()
+    transport, _ = loop.run_until_complete(
+        loop.create_datagram_endpoint(lambda: UdpProtocol(responder), local_addr=("127.0.0.1", 0)))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.settimeout(5)
+            s.connect(transport.get_extra_info("sockname"))
+            yield s
+    finally:
+        loop.call_soon_threadsafe(transport.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def rcode_of(response: bytes) -> tuple:
+    _, flags, _, ancount, _, _ = wire.HEADER.unpack_from(response)
+    return response[:2], flags & 0x0F, ancount
+
+
+def test_a_locked_zone_does_not_stall_the_other_zones(store):
+    store.create(new_soa(ZONE))
+    store.create(new_soa("other.test"))
+    store.add_record("other.test", A_rec("www.other.test", "10.0.0.1", "60"))
+    with udp_responder(Responder(store)) as s:
+        with store.locked(ZONE):
+            s.send(wire.encode_query(ZONE, wire.SOA, 1))
+            s.send(wire.encode_query("www.other.test", wire.A, 2))
+            assert rcode_of(s.recv(512)) == (b"\x00\x02", wire.NOERROR, 1)
+        assert rcode_of(s.recv(512)) == (b"\x00\x01", wire.NOERROR, 1)
+
+
+def test_servfail_when_forwarding_fails(store):
+    responder = Responder(store, upstream=("127.0.0.1", 9))
+
+    def forward(message, udp=True):
+        raise RuntimeError("upstream gone")
+    responder.forward = forward
+    with udp_responder(responder) as s:
+        s.send(wire.encode_query("www.other.test", wire.A, 3))
+        assert rcode_of(s.recv(512)) == (b"\x00\x03", wire.SERVFAIL, 0)
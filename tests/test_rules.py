@@ -0,0 +1,150 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import os
+import threading
+
+import pytest
+
+from conftest import new_soa
+from dns.models import DnsRule
+from dns import rules as rules_module
+from dns.rules import RuleStore, RuleNotFound
+from dns.store import ZoneNotFound
+
+ZONE = "ex.com"
+
+
+def rule(dnsRuleId: str, ip: str = "10.1.1.1", ttl: int = 60, state: str = "ACTIVE",
+         domainName: str = "app." + ZONE) -> DnsRule:
+    return DnsRule(dnsRuleId, domainName, "IP_V4", ip, ttl, state, "app1")
+
+
+@pytest.fixture
+def rules(store):
+    store.create(new_soa(ZONE))
+    return RuleStore(store, os.path.join(store.files_path, "dns_rules.json"))
+
+
+def served(rules: RuleStore) -> list:
+    return sorted((r.name, r.ip) for r in rules.store.get(ZONE))
+
+
+def test_rule_record(rules):
+    rules.create(rule("r1"))
+    assert served(rules) == [("app." + ZONE, "10.1.1.1")]
+    rules.update("r1", rule("r1", ip="10.1.1.2"))
+    assert served(rules) == [("app." + ZONE, "10.1.1.2")]
+    rules.update("r1", rule("r1", ip="10.1.1.2", state="INACTIVE"))
+    assert served(rules) == []
+    rules.delete("r1")
+    with pytest.raises(RuleNotFound):
+        rules.get("r1")
+    # Persisted
+    assert RuleStore(rules.store, rules.path).rules() == []
+
+
+def test_record_shared_by_rules_with_different_ttls(rules):
+    rules.create(rule("r1", ttl=60))
+    rules.create(rule("r2", ttl=300))
+    rules.delete("r1")
+    # Still served for r2
+    assert served(rules) == [("app." + ZONE, "10.1.1.1")]
+
+    serial = rules.store.get(ZONE).soa.serial
+    rules.update("r2", rule("r2", ttl=300, state="INACTIVE"))
+    assert served(rules) == []
+    assert rules.store.get(ZONE).soa.serial != serial
+
+
+def test_ttl_change_keeps_the_record(rules):
+    rules.create(rule("r1", ttl=60))
+    rules.update("r1", rule("r1", ttl=120))
+    assert [r.ttl for r in rules.store.get(ZONE)] == ["120"]
+
+
+def test_rule_of_a_deleted_zone_can_be_deactivated(rules):
+    rules.create(rule("r1"))
+    rules.store.drop(ZONE)
+    rules.update("r1", rule("r1", state="INACTIVE"))
+    assert not rules.get("r1").active
+    with pytest.raises(ZoneNotFound):
+        rules.update("r1", rule("r1", state="ACTIVE"))
+    # Left unchanged by the failed update
+    assert not rules.get("r1").active
+    rules.delete("r1")
+
+
+def test_concurrent_rules_sharing_a_record(rules):
+    rules.create(rule("keep"))
+
+    def worker(i):
+        for j in range(20):
+            rules.create(rule("r%d-%d" % (i, j)))
+            rules.update("r%d-%d" % (i, j), rule("r%d-%d" % (i, j), ttl=120))
+            rules.delete("r%d-%d" % (i, j))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [r.dnsRuleId for r in rules.rules()] == ["keep"]
+    assert served(rules) == [("app." + ZONE, "10.1.1.1")]
+    assert [r.dnsRuleId for r in RuleStore(rules.store, rules.path).rules()] == ["keep"]
+
+
+def reloaded(rules: RuleStore) -> dict:
+    return {r.dnsRuleId: (r.ipAddress, r.state) for r in RuleStore(rules.store, rules.path).rules()}
+
+
+def test_state_changes_are_appended_to_the_log(rules):
+    for i in range(10):
+        rules.create(rule("r%d" % i))
+    with open(rules.log_path) as f:
+        size = len(f.read())
+    rules.update("r3", rule("r3", state="INACTIVE"))
+    # One line per change, the rules file is not rewritten
+    with open(rules.log_path) as f:
+        line = f.read()[size:]
+    assert line.count("\n") == 1 and '"r3"' in line
+    assert not os.path.exists(rules.path)
+    rules.delete("r4")
+    assert reloaded(rules)["r3"] == ("10.1.1.1", "INACTIVE")
+    assert "r4" not in reloaded(rules)
+
+
+def test_log_is_replayed_by_sequence_number(rules):
+    rules.create(rule("r1"))
+    rules.update("r1", rule("r1", ip="10.1.1.2"))
+    with open(rules.log_path) as f:
+        lines = f.readlines()
+    # Appended in the other order by threads racing after changing the indexes
+    with open(rules.log_path, "w") as f:
+        f.writelines(reversed(lines))
+        f.write('{"seq": 9, "delete"')
+    assert reloaded(rules) == {"r1": ("10.1.1.2", "ACTIVE")}
+
+
+def test_log_is_folded_into_the_rules_file(rules, monkeypatch):
+    monkeypatch.setattr(rules_module, "MIN_LOG_ENTRIES", 4)
+    for i in range(3):
+        rules.create(rule("r%d" % i))
+    rules.update("r0", rule("r0", state="INACTIVE"))
+    assert os.path.exists(rules.path)
+    with open(rules.log_path) as f:
+        assert f.read().count("\n") == 1
+    rules.delete("r1")
+    assert reloaded(rules) == {"r0": ("10.1.1.1", "INACTIVE"), "r2": ("10.1.1.1", "ACTIVE")}
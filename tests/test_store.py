@@ -0,0 +1,144 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import mmap
+
+import pytest
+
+from conftest import new_soa
+from dns.models import A_rec, AAAA_rec
+from dns.records import CompactA, RecordTable
+from dns.store import ZoneStore, BatchRejected, find_line
+
+ZONE = "example.test"
+
+
+def reload(store: ZoneStore):
+    # A store reading the zone files written by another one
+    return ZoneStore(store.files_path).get(ZONE)
+
+
+def test_add_and_delete_records(store):
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.1", "60"))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.2", "60"))
+    assert sorted(r.ip for r in reload(store).find("WWW." + ZONE + ".")) == ["10.0.0.1", "10.0.0.2"]
+
+    serial = store.get(ZONE).soa.serial
+    assert len(store.delete_records(ZONE, "www." + ZONE, "A")) == 2
+    assert store.get(ZONE).soa.serial != serial
+    assert len(reload(store)) == 0
+    # Nothing to delete: no serial increment
+    serial = store.get(ZONE).soa.serial
+    assert store.delete_records(ZONE, "www." + ZONE, "A") == []
+    assert store.get(ZONE).soa.serial == serial
+
+
+def test_apply_batch_is_atomic(store):
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("old." + ZONE, "10.0.0.1", "60"))
+    serial = store.get(ZONE).soa.serial
+    operations = [("add", A_rec("new." + ZONE, "10.0.0.2", "60")), ("delete", "missing." + ZONE),
+                  ("delete", "old." + ZONE), ("delete", "gone." + ZONE)]
+    with pytest.raises(BatchRejected) as e:
+        store.apply_batch(ZONE, operations)
+    assert [index for index, _ in e.value.failures] == [1, 3]
+    assert store.get(ZONE).soa.serial == serial
+    assert [r.name for r in reload(store)] == ["old." + ZONE]
+
+    # A name added earlier in the batch can be deleted by it
+    serial, results = store.apply_batch(ZONE, [("add", A_rec("tmp." + ZONE, "10.0.0.3", "60")),
+                                               ("delete", "tmp." + ZONE), ("delete", "old." + ZONE)])
+    assert results == [1, 1, 1]
+    assert len(reload(store)) == 0
+    assert reload(store).soa.serial == serial
+
+
+def test_compact_zone(tmp_path):
+    store = ZoneStore(str(tmp_path) + "/", compact=True)
+    store.create(new_soa(ZONE))
+    store.add_record(ZONE, A_rec("www." + ZONE, "10.0.0.1", "60"))
+    store.add_record(ZONE, AAAA_rec("www." + ZONE, "2001:DB8::1", "60"))
+    # The same address in another spelling is the same record
+    store.add_record(ZONE, AAAA_rec("www." + ZONE, "2001:db8:0::1", "300"))
+    records = store.get(ZONE).find("www." + ZONE + ".")
+    assert all(isinstance(r, CompactA) for r in records)
+    assert sorted((r.type, r.ip, r.ttl) for r in records) == [("A", "10.0.0.1", "60"),
+                                                              ("AAAA", "2001:db8::1", "300")]
+
+    store.update_record(ZONE, "www." + ZONE, A_rec("www." + ZONE, "10.0.0.2", "60"), "10.0.0.1")
+    assert sorted(r.ip for r in reload(store).find("www." + ZONE + ".")) == ["10.0.0.2", "2001:db8::1"]
+    assert store.get(ZONE).discard(AAAA_rec("www." + ZONE, "2001:db8::1", "300"))
+    assert [r.ip for r in store.get(ZONE).find("www." + ZONE + ".")] == ["10.0.0.2"]
+
+
+def test_record_table_remove():
+    table = RecordTable()
+    for i in range(3):
+        table.add(A_rec("host%d.%s" % (i, ZONE), "10.0.0.%d" % i, "60"))
+    table.add(AAAA_rec("host3." + ZONE, "2001:db8::3", "300"))
+    # The last row moves into the removed one
+    assert table.remove(1) == 3
+    assert [str(r) for r in table] == [str(A_rec("host0." + ZONE, "10.0.0.0", "60")),
+                                       str(AAAA_rec("host3." + ZONE, "2001:db8::3", "300")),
+                                       str(A_rec("host2." + ZONE, "10.0.0.2", "60"))]
+    assert table.remove(2) is None
+    assert len(table) == 2 and len(table.addresses) == 32
+
+
+def test_table_zone(tmp_path):
+    store = ZoneStore(str(tmp_path) + "/", table=True)
+    store.create(new_soa(ZONE))
+    for i in range(6):
+        store.add_record(ZONE, A_rec("host%d.%s" % (i % 3, ZONE), "10.0.0.%d" % i, "60"))
+    store.add_record(ZONE, AAAA_rec("host0." + ZONE, "2001:DB8::1", "60"))
+    # Replaces the record of the same data
+    store.add_record(ZONE, AAAA_rec("host0." + ZONE, "2001:db8:0::1", "300"))
+    zone = store.get(ZONE)
+    assert len(zone.table) == 7 and len(zone) == 7
+
+    # Removals move rows: every record must still be found at its row
+    store.delete_records(ZONE, "host1." + ZONE)
+    store.apply(ZONE, [("discard", A_rec("host0." + ZONE, "10.0.0.0", "60"))])
+    store.update_record(ZONE, "host2." + ZONE, A_rec("host2." + ZONE, "10.0.0.9", "30"), "10.0.0.2")
+    expected = [("host0", "A", "10.0.0.3", "60"),
+                ("host0", "AAAA", "2001:db8::1", "300"), ("host2", "A", "10.0.0.5", "60"),
+                ("host2", "A", "10.0.0.9", "30")]
+    assert sorted((r.name.split(".")[0], r.type, r.ip, r.ttl) for r in zone) == expected
+    for types in zone.records.values():
+        for rrset in types.values():
+            for data, held in rrset.items():
+                if type(held) is int:
+                    assert zone.table.address(held) == data
+    assert len(zone.table) == len(zone) == 4
+    assert sorted((r.name.split(".")[0], r.type, r.ip, r.ttl) for r in reload(store)) == expected
+
+    # A record the table cannot hold is kept as an object
+    zone.add(A_rec("big." + ZONE, "10.0.1.1", str(1 << 32)))
+    assert len(zone.table) == 4 and [r.ttl for r in zone.find("big." + ZONE)] == [str(1 << 32)]
+    assert zone.remove("big." + ZONE) and len(zone) == 4
+
+
+@pytest.mark.parametrize("text, line", [
+    (b"www.example.test. 60 IN A 10.0.0.1\n", (0, 34)),
+    (b"example.test. 60 IN SOA x\nwww.example.test. 60 IN A 10.0.0.2\nwww.example.test. 60 IN A 10.0.0.1", (61, 95)),
+    (b"example.test. 60 IN SOA x\nwww.example.test. 60 IN A 10.0.0.2\n", None),
+    (b"example.test. 60 IN SOA x\nmail.example.test. 60 IN A 10.0.0.1\n", None),
+])
+def test_find_line(tmp_path, text, line):
+    path = tmp_path / "zone.db"
+    path.write_bytes(text)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert find_line(mm, A_rec("www." + ZONE, "10.0.0.1", "60")) == line
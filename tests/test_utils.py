@@ -0,0 +1,47 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import builtins
+import sys
+import threading
+
+from dns.utils import lazy_import
+
+SLOW_MODULE = """\
+import time
+import builtins
+builtins.slow_module_loads = getattr(builtins, "slow_module_loads", 0) + 1
+time.sleep(0.2)
+value = 42
+"""
+
+
+def test_lazy_import_is_thread_safe(tmp_path, monkeypatch):
+    (tmp_path / "slow_module.py").write_text(SLOW_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = lazy_import("slow_module")
+
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(module.value)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    try:
+        assert values == [42] * 8
+        assert builtins.slow_module_loads == 1
+    finally:
+        sys.modules.pop("slow_module", None)
+        del builtins.slow_module_loads
@@ -0,0 +1,67 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import struct
+
+import pytest
+
+from conftest import new_soa
+from dns import wire
+
+
+def test_parse_query():
+    query = wire.parse_query(wire.encode_query("WWW.Example.test.", wire.AAAA, 7, edns=True))
+    assert (query.id, query.name, query.qtype, query.qclass) == (7, "www.example.test", wire.AAAA, wire.CLASS_IN)
+    assert query.labels == (12, 16, 24, 29)
+    assert (query.edns, query.size) == (True, wire.EDNS_SIZE)
+
+
+def test_question_name_is_escaped():
+    # A label holding a dot and bytes that are not printable ASCII
+    message = wire.HEADER.pack(1, 0, 1, 0, 0, 0) + b"\x05a.b\xff\x00\x04zone\x00" + struct.pack("!HH", wire.A, 1)
+    query = wire.parse_query(message)
+    assert query.name == "a\\046b\\255\\000.zone"
+    assert query.labels == (12, 18, 23)
+
+
+@pytest.mark.parametrize("question", [
+    b"\x03www",                 # truncated
+    b"\x03www\xc0\x0c",         # compressed
+    b"\x3f" + b"a" * 63 + b"\x3f" + b"a" * 63 + b"\x3f" + b"a" * 63 + b"\x3f" + b"a" * 63 + b"\x00",
+])
+def test_malformed_question(question):
+    message = wire.HEADER.pack(1, 0, 1, 0, 0, 0) + question + struct.pack("!HH", wire.A, 1)
+    with pytest.raises(wire.FormatError):
+        wire.parse_query(message)
+    assert wire.error(message, wire.FORMERR)[3] & 0x0F == wire.FORMERR
+
+
+def test_soa_serial():
+    query = wire.parse_query(wire.encode_query("example.test", wire.SOA))
+    soa = new_soa("example.test")
+    section = wire.Section(wire.NOERROR, 1, 0, wire.encode_rr(wire.QUESTION_POINTER, wire.SOA, 3600,
+                                                              wire.soa_rdata(soa)))
+    assert wire.soa_serial(wire.response(query, section)) == 2022110900
+
+
+def test_udp_response_is_truncated():
+    query = wire.parse_query(wire.encode_query("example.test", wire.A))
+    records = b"".join(wire.encode_rr(wire.QUESTION_POINTER, wire.A, 60, wire.a_rdata("10.0.0.%d" % i))
+                       for i in range(40))
+    section = wire.Section(wire.NOERROR, 40, 0, records)
+    response = wire.response(query, section)
+    assert len(response) <= wire.UDP_SIZE
+    assert struct.unpack_from("!H", response, 2)[0] & wire.TC
+    assert len(wire.response(query, section, udp=False)) > wire.UDP_SIZE
@@ -0,0 +1,88 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import time
+
+import pytest
+
+from dns.models import SOA, A_rec, AAAA_rec
+from dns.zonefile import parse, parse_ttl, is_ttl, ZoneFileError, ResourceRecord
+
+ZONE_FILE = """\
+$ORIGIN example.test.
+$TTL 1h
+@   IN  SOA ns admin.example.test. (
+        2022110900 ; serial
+        2h 1h 2w 1h )
+www         A       10.0.0.1
+            AAAA    2001:db8::1
+mail 60 IN  A       10.0.0.2
+ftp  IN 1d  CNAME   www
+_sip._tcp   SRV     10 60 5060 sip.other.test.
+txt         TXT     "v=spf1 ; -all"
+"""
+
+
+def test_parse_ttl():
+    assert parse_ttl("3600") == 3600
+    assert parse_ttl("1h30m") == 5400
+    assert parse_ttl("1W") == 604800
+    assert parse_ttl("1h30") == 3630
+    for value in ("", "h", "1hh", "1.5h", "-1"):
+        with pytest.raises(ValueError):
+            parse_ttl(value)
+
+
+def test_ttl_pattern_does_not_backtrack():
+    # Seconds for an exponential pattern, and more than a lifetime at 5000 digits
+    start = time.perf_counter()
+    assert not is_ttl("1" * 24 + "x")
+    assert time.perf_counter() - start < 0.5
+    assert not is_ttl("1" * 5000 + "x")
+    assert not is_ttl("1h" * 5000 + "x")
+
+
+def test_parse():
+    records = list(parse(ZONE_FILE.splitlines(True)))
+    soa = records[0]
+    assert isinstance(soa, SOA)
+    assert (soa.name, soa.mname, soa.serial, soa.refresh, soa.expire) == \
+        ("example.test", "ns.example.test", "2022110900", "7200", "1209600")
+
+    assert [(type(r), r.name, r.ttl, r.ip) for r in records[1:4]] == [
+        (A_rec, "www.example.test", "3600", "10.0.0.1"),
+        (AAAA_rec, "www.example.test", "3600", "2001:db8::1"),
+        (A_rec, "mail.example.test", "60", "10.0.0.2"),
+    ]
+    cname, srv, txt = records[4:]
+    assert all(isinstance(r, ResourceRecord) for r in records[4:])
+    assert (cname.name, cname.ttl, cname.type, cname.rdata) == ("ftp.example.test", "86400", "CNAME",
+                                                                "www.example.test.")
+    assert (srv.name, srv.rdata) == ("_sip._tcp.example.test", "10 60 5060 sip.other.test.")
+    assert txt.rdata == '"v=spf1 ; -all"'
+
+
+@pytest.mark.parametrize("text, line", [
+    ("@ 3600 IN SOA ns admin 1 2 3 4\n", 1),
+    ("$TTL 1x\n", 1),
+    ("$TTL 60\n@ IN SOA ns admin 1 2 3 4 5\nwww A 10.0.0.1 10.0.0.2\n", 3),
+    ("$TTL 60\n@ IN SOA ns admin ( 1 2 3\n4 5\n", 2),
+    ("@ IN SOA ns admin 1 2 3 4 5\nwww A 10.0.0.1\ntxt TXT \"open\n", 3),
+])
+def test_parse_errors(text, line):
+    with pytest.raises(ZoneFileError) as e:
+        list(parse(text.splitlines(True), "example.test", path="example.test.db"))
+    assert e.value.line == line
+    assert str(e.value).startswith("example.test.db:%d: " % line)
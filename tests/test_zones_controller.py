@@ -0,0 +1,163 @@
+# Copyright 2022 Universidade do Minho
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+
+
+import os
+
+import cherrypy
+
+from conftest import call
+from dns import cache
+from dns.api.controllers.zones_controller import ZonesController, encode_cursor, DEFAULT_PAGE_SIZE
+from dns.cache import response_cache
+from dns.store import zone_store
+
+controller = ZonesController()
+
+
+def test_add_a_record(zone):
+    status, _ = call(controller.add_a_record, zoneName=zone, name="www." + zone, ip="10.0.0.1", ttl="60")
+    assert status == 200
+    assert [r.ip for r in zone_store.get(zone).find("www." + zone)] == ["10.0.0.1"]
+
+
+def test_add_a_record_invalid_ip(zone):
+    status, body = call(controller.add_a_record, zoneName=zone, name="www." + zone, ip="10.0.0.300", ttl="60")
+    assert status == 400
+    assert body["detail"] == "Invalid IPv4 address 10.0.0.300."
+    assert len(zone_store.get(zone)) == 0
+
+
+def test_add_a_record_missing_zone():
+    status, _ = call(controller.add_a_record, zoneName="missing.test", name="www.missing.test", ip="10.0.0.1", ttl="60")
+    assert status == 404
+    assert not os.path.exists(zone_store.zone_path("missing.test"))
+
+
+def test_update_a_record_invalid_ip(zone):
+    call(controller.add_a_record, zoneName=zone, name="www." + zone, ip="10.0.0.1", ttl="60")
+    status, _ = call(controller.update_a_record, zoneName=zone, name="www." + zone, ip="not-an-ip", ttl="60")
+    assert status == 400
+
+
+def batch(zone, *operations):
+    cherrypy.request.json = dict(operations=list(operations))
+    return call(controller.batch_records, zoneName=zone)
+
+
+def test_batch_records(zone):
+    call(controller.add_a_record, zoneName=zone, name="old." + zone, ip="10.0.0.1", ttl="60")
+    status, body = batch(zone, dict(action="add", name="new." + zone, ip="10.0.0.2", ttl="60"),
+                         dict(action="delete", name="old." + zone))
+    assert status == 200 and body["applied"]
+    assert [r.name for r in zone_store.get(zone)] == ["new." + zone]
+
+
+def test_batch_records_reports_every_failure(zone):
+    call(controller.add_a_record, zoneName=zone, name="old." + zone, ip="10.0.0.1", ttl="60")
+    serial = zone_store.get(zone).soa.serial
+    status, body = batch(zone, dict(action="add", name="bad." + zone, ip="10.0.0.256", ttl="60"),
+                         dict(action="delete", name="missing." + zone),
+                         dict(action="delete", name="old." + zone))
+    assert status == 400 and not body["applied"]
+    assert [r["status"] for r in body["results"]] == [400, 404, 424]
+    # Nothing was applied
+    assert zone_store.get(zone).soa.serial == serial
+    assert [r.name for r in zone_store.get(zone)] == ["old." + zone]
+
+
+def test_delete_a_record(zone):
+    call(controller.add_a_record, zoneName=zone, name="www." + zone, ip="10.0.0.1", ttl="60")
+    status, _ = call(controller.delete_a_record, zoneName=zone, name="www." + zone)
+    assert status == 200
+    assert zone_store.get(zone).find("www." + zone) == []
+
+
+def test_delete_missing_a_record(zone):
+    # As the zone file editing it replaced did, a missing host is not an error
+    serial = zone_store.get(zone).soa.serial
+    status, _ = call(controller.delete_a_record, zoneName=zone, name="missing." + zone)
+    assert status == 200
+    assert zone_store.get(zone).soa.serial == serial
+
+
+def test_get_records_pages(zone):
+    for i in range(5):
+        call(controller.add_a_record, zoneName=zone, name="h%d.%s" % (i, zone), ip="10.0.0.%d" % i, ttl="60")
+    names, cursor = [], None
+    while True:
+        params = dict(zoneName=zone, limit="2") if cursor is None else dict(zoneName=zone, limit="2", cursor=cursor)
+        status, body = call(controller.get_records, **params)
+        assert status == 200
+        names += [record["name"] for record in body["records"]]
+        cursor = body["nextCursor"]
+        if cursor is None:
+            break
+    assert names == ["h%d.%s" % (i, zone) for i in range(5)]
+
+
+def test_get_records_invalid_cursor(zone):
+    for cursor in ("!!!", "aGVsbG8", "é"):
+        status, _ = call(controller.get_records, zoneName=zone, cursor=cursor)
+        assert status == 400
+
+
+def test_get_records_not_modified(zone):
+    call(controller.get_records, zoneName=zone)
+    etag = cherrypy.response.headers["ETag"]
+    cherrypy.request.headers["If-None-Match"] = etag
+    try:
+        cherrypy.response.status = 200
+        assert controller.get_records(zoneName=zone) == b""
+        assert cherrypy.response.status == 304
+    finally:
+        del cherrypy.request.headers["If-None-Match"]
+
+
+def test_paged_views_are_bounded(zone):
+    call(controller.add_a_record, zoneName=zone, name="www." + zone, ip="10.0.0.1", ttl="60")
+    for limit in range(1, 50):
+        call(controller.get_records, zoneName=zone, limit=str(limit))
+    for i in range(cache.MAX_VIEWS + 10):
+        call(controller.get_records, zoneName=zone, cursor=encode_cursor("h%d" % i))
+    views = response_cache._entries[zone]
+    assert len(views) == cache.MAX_VIEWS
+    assert all(view[2] == DEFAULT_PAGE_SIZE for view in views if view != "index")
+
+
+def test_stale_zones_listing_is_not_cached():
+    response_cache.invalidate(cache.ZONES)
+    version = zone_store.version
+    zone_store.version += 1
+    try:
+        response_cache.put(cache.ZONES, "zones", "etag", b"body", version=version)
+        assert response_cache.get(cache.ZONES, "zones") is None
+    finally:
+        zone_store.version -= 1
+
+
+def test_malformed_zone_file():
+    path = zone_store.zone_path("malformed.test")
+    with open(path, "w") as f:
+        f.write("malformed.test. 3600 IN SOA ns.malformed.test. admin.malformed.test. 1 2 3 4 5\n"
+                "www.malformed.test. 60 IN A 10.0.0.1 10.0.0.2\n")
+    try:
+        status, body = call(controller.get_record, zoneName="malformed.test", name="www.malformed.test")
+        assert status == 500
+        assert body["detail"].endswith("malformed.test.db:2: A record with 2 fields")
+        status, _ = call(controller.add_a_record, zoneName="malformed.test", name="www.malformed.test",
+                         ip="10.0.0.2", ttl="60")
+        assert status == 500
+    finally:
+        os.remove(path)